@@ -2,7 +2,7 @@ from django.contrib import admin
 
 from .models import (
     Contact, EmployeeProfile, 
-    CustomerProfile, CustomUser, Comment)
+    CustomerProfile, CustomUser, Comment, ImageVariant, MediaBlob)
 from ecommerce.admin import OrderInline, ItemInline
 
 
@@ -59,4 +59,19 @@ class CustomUserAdmin(admin.ModelAdmin):
     search_fields = ("email", "username", "id",)
     inlines = [OrderInline, ItemInline, CustomerInline, EmployeeInline, CommentInline]
 
-admin.site.register(CustomUser,CustomUserAdmin)
\ No newline at end of file
+admin.site.register(CustomUser,CustomUserAdmin)
+
+
+@admin.register(ImageVariant)
+class ImageVariantAdmin(admin.ModelAdmin):
+    list_display = ("source", "format", "width", "height", "size", "created")
+    list_filter = ("format",)
+    search_fields = ("source",)
+    readonly_fields = ("source", "format", "width", "height", "name", "size", "created")
+
+
+@admin.register(MediaBlob)
+class MediaBlobAdmin(admin.ModelAdmin):
+    list_display = ("name", "refs", "size", "touched")
+    search_fields = ("name",)
+    readonly_fields = ("name", "refs", "size", "touched")
@@ -0,0 +1,262 @@
+"""
+Responsive image variants shared by item images, thumbnails and profile pics
+
+`generate_variants` decodes an upload once and writes a copy per configured
+width (`IMAGE_VARIANTS[kind]`), aspect ratio kept and never upscaled, in
+every `IMAGE_VARIANT_FORMATS` format: WebP first, JPEG as the fallback.
+Each copy is an `ImageVariant` row keyed by the source file name so
+serializers can hand clients a `srcset` per format and let them pick the
+smallest file that is big enough. Runs in the `process image variants` task.
+
+`process_batch` re-renders many images at once for the `process_images`
+command: decoding and resizing fan out over a process pool, one worker per
+core, JPEGs are decoded straight at a reduced scale (`open_image`) and
+images whose variants already match the configuration are skipped.
+"""
+import os
+from concurrent.futures import ProcessPoolExecutor
+from io import BytesIO
+
+import django
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import transaction
+from PIL import Image, ImageOps
+
+from core.models import ImageVariant
+from utils.caching import bump_version
+
+DEFAULT_VARIANTS = {
+    "item": (320, 640, 960, 1600),
+    "thumbnail": (125, 250),
+    "profile": (64, 150, 300),
+}
+DEFAULT_FORMATS = ("webp", "jpeg")
+SAVE_OPTIONS = {
+    "webp": {"method": 4},
+    "jpeg": {"optimize": True, "progressive": True},
+}
+EXTENSIONS = {"webp": "webp", "jpeg": "jpg"}
+EXIF_ORIENTATION = 0x0112
+BATCH_SIZE = 500#sources whose variant rows are looked up per query
+
+
+def get_widths(kind:str) -> tuple:
+    return getattr(settings, "IMAGE_VARIANTS", DEFAULT_VARIANTS)[kind]
+
+
+def get_formats() -> tuple:
+    return getattr(settings, "IMAGE_VARIANT_FORMATS", DEFAULT_FORMATS)
+
+
+def get_quality() -> int:
+    return getattr(settings, "IMAGE_VARIANT_QUALITY", 80)
+
+
+def get_workers() -> int:
+    return getattr(settings, "IMAGE_WORKERS", None) or os.cpu_count() or 1
+
+
+def variant_name(source:str, width:int, fmt:str) -> str:
+    '''
+    `item_images/123.jpg` -> `variants/item_images/123/320.webp`
+    '''
+    return f"variants/{os.path.splitext(source)[0]}/{width}.{EXTENSIONS[fmt]}"
+
+
+def variant_sizes(width:int, height:int, widths) -> list:
+    '''
+    `(width, height)` per requested width, largest first. Widths past the
+    original collapse into one copy at the original size
+    '''
+    sizes = sorted({min(wanted, width) for wanted in widths}, reverse=True)
+    return [(size, max(1, round(height * size / width))) for size in sizes]
+
+
+def flatten(img:Image.Image, fmt:str) -> Image.Image:
+    '''
+    jpeg has no alpha, transparent pixels go white
+    '''
+    if fmt == "jpeg" and img.mode == "RGBA":
+        background = Image.new("RGB", img.size, (255, 255, 255))
+        background.paste(img, mask=img.getchannel("A"))
+        return background
+    return img
+
+
+def open_image(file, kind:str) -> Image.Image:
+    '''
+    Opens an image for `render`. JPEGs are decoded at the smallest DCT scale
+    (1/2, 1/4 or 1/8) that still covers the largest variant of `kind`, so a
+    4000px photo for 1600px variants decodes a quarter of the pixels
+    '''
+    img = Image.open(file)
+    if img.format == "JPEG":
+        largest = max(get_widths(kind))
+        #photos taken sideways are stored rotated, their displayed width is the stored height
+        sideways = img.getexif().get(EXIF_ORIENTATION) in (5, 6, 7, 8)
+        img.draft(img.mode, (1, largest) if sideways else (largest, 1))
+    return img
+
+
+def expected_variants(img:Image.Image, kind:str) -> set:
+    '''
+    `{(width, format), ...}` `render` makes of an opened, not yet decoded image
+    '''
+    width, height = img.size
+    if img.getexif().get(EXIF_ORIENTATION) in (5, 6, 7, 8):
+        width, height = height, width
+    return {(size, fmt) for size, _ in variant_sizes(width, height, get_widths(kind)) for fmt in get_formats()}
+
+
+def render(img:Image.Image, kind:str) -> list:
+    '''
+    Resizes a decoded image into every variant.
+    returns `[(width, height, format, bytes), ...]`
+    '''
+    img = ImageOps.exif_transpose(img)
+    if img.mode not in ("RGB", "RGBA"):
+        img = img.convert("RGBA" if img.mode in ("LA", "PA") or "transparency" in img.info else "RGB")
+    rendered, current = [], img
+    for width, height in variant_sizes(img.width, img.height, get_widths(kind)):
+        #each size is scaled down from the previous, larger one
+        if current.size != (width, height):
+            current = current.resize((width, height), Image.LANCZOS)
+        for fmt in get_formats():
+            buffer = BytesIO()
+            flatten(current, fmt).save(buffer, format=fmt.upper(), quality=get_quality(), **SAVE_OPTIONS.get(fmt, {}))
+            rendered.append((width, height, fmt, buffer.getvalue()))
+    return rendered
+
+
+def write_variants(source:str, rendered:list) -> list:
+    '''
+    Writes rendered variants to storage. returns their unsaved `ImageVariant` rows
+    '''
+    variants = []
+    for width, height, fmt, data in rendered:
+        name = variant_name(source, width, fmt)
+        if default_storage.exists(name):
+            default_storage.delete(name)
+        variants.append(ImageVariant(source=source, width=width, height=height, format=fmt,
+                                     name=default_storage.save(name, ContentFile(data)), size=len(data)))
+    return variants
+
+
+def save_variants(source:str, variants:list, bump:bool=True) -> list:
+    '''
+    Replaces the source's rows with written `variants`,
+    files of variants no longer produced are deleted
+    '''
+    kept = {variant.name for variant in variants}
+    with transaction.atomic():
+        previous = ImageVariant.objects.filter(source=source)
+        stale = [name for name in previous.values_list("name", flat=True) if name not in kept]
+        previous.delete()
+        ImageVariant.objects.bulk_create(variants)
+    for name in stale:
+        default_storage.delete(name)
+    if bump:
+        #serialized srcsets change, cached responses listing them go
+        bump_version(ImageVariant)
+    return variants
+
+
+def store_variants(source:str, rendered:list) -> list:
+    '''
+    Writes rendered variants to storage and replaces the source's rows
+    '''
+    return save_variants(source, write_variants(source, rendered))
+
+
+def generate_variants(source:str, kind:str) -> list:
+    '''
+    Decodes `source` (a storage name) once and writes its variants.
+    returns the `ImageVariant` rows
+    '''
+    with default_storage.open(source, "rb") as file:
+        with open_image(file, kind) as img:
+            rendered = render(img, kind)
+    return store_variants(source, rendered)
+
+
+def render_job(job:tuple) -> tuple:
+    '''
+    Process pool worker for `process_batch`, touches files only.
+    `job` is `(source, kind, existing)`, `existing` the `(width, format)`s
+    already stored or None to render regardless. returns `(source, variants, error)`:
+    unsaved `ImageVariant` rows of the written files, None when `existing` was current
+    '''
+    source, kind, existing = job
+    try:
+        with default_storage.open(source, "rb") as file:
+            with open_image(file, kind) as img:
+                if existing is not None and expected_variants(img, kind) == existing:
+                    return source, None, None
+                rendered = render(img, kind)
+        return source, write_variants(source, rendered), None
+    except (OSError, ValueError, Image.DecompressionBombError) as exc:
+        return source, None, f"{type(exc).__name__}: {exc}"
+
+
+def _stored(sources:list) -> dict:
+    '''
+    `{source: {(width, format), ...}}` of the stored variants, one query
+    '''
+    stored = {}
+    for source, width, fmt in ImageVariant.objects.filter(source__in=sources).values_list("source", "width", "format"):
+        stored.setdefault(source, set()).add((width, fmt))
+    return stored
+
+
+def process_batch(jobs, workers:int=None, force:bool=False, batch_size:int=BATCH_SIZE) -> dict:
+    '''
+    Renders the variants of many `(source, kind)` pairs over `workers`
+    processes (`IMAGE_WORKERS`, default one per core), images whose stored
+    variants are current are skipped unless `force`.
+    returns `{"processed", "skipped", "failed", "errors": {source: message}}`
+    '''
+    kinds = {}
+    for source, kind in jobs:
+        #variants are keyed by source, the first kind listed for a file wins
+        kinds.setdefault(source, kind)
+    jobs = list(kinds.items())
+    workers = workers or get_workers()
+    report = {"processed": 0, "skipped": 0, "failed": 0, "errors": {}}
+    #workers only decode and write files, the rows are saved here
+    pool = ProcessPoolExecutor(max_workers=workers, initializer=django.setup) if workers > 1 else None
+    try:
+        for start in range(0, len(jobs), batch_size):
+            batch = jobs[start:start + batch_size]
+            stored = {} if force else _stored([source for source, _ in batch])
+            tasks = [(source, kind, None if force else stored.get(source, set())) for source, kind in batch]
+            results = pool.map(render_job, tasks, chunksize=max(1, len(tasks) // (workers * 4))) if pool else map(render_job, tasks)
+            for source, variants, error in results:
+                if error is not None:
+                    report["failed"] += 1
+                    report["errors"][source] = error
+                elif variants is None:
+                    report["skipped"] += 1
+                else:
+                    save_variants(source, variants, bump=False)
+                    report["processed"] += 1
+    finally:
+        if pool is not None:
+            pool.shutdown()
+    if report["processed"]:
+        bump_version(ImageVariant)
+    return report
+
+
+def srcsets(sources) -> dict:
+    '''
+    `{source: {format: "url 320w, url 640w"}}` for the given source names, one query
+    '''
+    result = {}
+    variants = ImageVariant.objects.filter(source__in=set(sources)).order_by("source", "format", "width")
+    for source, fmt, width, name in variants.values_list("source", "format", "width", "name"):
+        entry = result.setdefault(source, {})
+        url = f"{default_storage.url(name)} {width}w"
+        entry[fmt] = f"{entry[fmt]}, {url}" if fmt in entry else url
+    return result
@@ -0,0 +1,51 @@
+from time import perf_counter
+
+from django.core.management.base import BaseCommand, CommandError
+
+from core.images import BATCH_SIZE, get_workers, process_batch
+from core.models import CustomUser
+from ecommerce.models import Item
+
+#(model, field, variant kind)
+SOURCES = (
+    (Item, "image", "item"),
+    (Item, "thumbnail", "thumbnail"),
+    (CustomUser, "image", "profile"),
+)
+
+
+class Command(BaseCommand):
+    help = ("Re-renders the responsive variants of every item image, thumbnail and profile pic "
+            "over a process pool, images whose variants are already current are skipped")
+
+    def add_arguments(self, parser):
+        parser.add_argument("--workers", type=int, default=None, help="worker processes, defaults to one per core")
+        parser.add_argument("--batch-size", type=int, default=BATCH_SIZE, help="images looked up per query")
+        parser.add_argument("--force", action="store_true", help="re-render current variants too")
+
+    def jobs(self) -> list:
+        jobs = []
+        for model, field, kind in SOURCES:
+            #the field default is a placeholder, not an upload
+            default = model._meta.get_field(field).default
+            names = (model.objects.exclude(**{field: ""}).exclude(**{field: default})
+                     .order_by().values_list(field, flat=True).distinct())
+            jobs.extend((name, kind) for name in names.iterator())
+        return jobs
+
+    def handle(self, *args, **options):
+        workers = options["workers"] or get_workers()
+        if workers < 1 or options["batch_size"] < 1:
+            raise CommandError("--workers and --batch-size must be positive")
+        jobs = self.jobs()
+        start = perf_counter()
+        report = process_batch(jobs, workers=workers, force=options["force"], batch_size=options["batch_size"])
+        elapsed = perf_counter() - start
+        done = report["processed"] + report["skipped"] + report["failed"]
+        self.stdout.write(f"{done} images in {elapsed:.2f}s over {workers} worker(s) "
+                          f"({done / elapsed if elapsed else 0:.1f} images/s): "
+                          f"{report['processed']} processed, {report['skipped']} skipped")
+        for source, error in report["errors"].items():
+            self.stderr.write(f"{source}: {error}")
+        message = f"{report['failed']} failed"
+        self.stdout.write(self.style.ERROR(message) if report["failed"] else self.style.SUCCESS(message))
@@ -0,0 +1,27 @@
+from time import perf_counter
+
+from django.core.management.base import BaseCommand, CommandError
+from django.template.defaultfilters import filesizeformat
+
+from core.media import sweep
+
+
+class Command(BaseCommand):
+    help = ("Mark and sweep of the upload directories: deletes files no item or user references "
+            "once they are older than MEDIA_GC_GRACE, --dry-run reports what would be reclaimed")
+
+    def add_arguments(self, parser):
+        parser.add_argument("--dry-run", action="store_true", help="report orphans without deleting them")
+        parser.add_argument("--batch-size", type=int, default=500, help="files re-checked and deleted per batch")
+
+    def handle(self, *args, **options):
+        if options["batch_size"] < 1:
+            raise CommandError("--batch-size must be positive")
+        start = perf_counter()
+        report = sweep(dry_run=options["dry_run"], batch_size=options["batch_size"])
+        elapsed = perf_counter() - start
+        self.stdout.write(f"scanned {report['scanned']} files in {elapsed:.2f}s, "
+                          f"{report['orphans']} orphaned ({filesizeformat(report['reclaimable'])} reclaimable)")
+        if not options["dry_run"]:
+            self.stdout.write(self.style.SUCCESS(
+                f"deleted {report['deleted']} files, freed {filesizeformat(report['freed'])}"))
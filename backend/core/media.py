@@ -0,0 +1,255 @@
+"""
+Reference counted media blobs
+
+Uploads to item images, thumbnails and profile pics are content addressed
+(see `core.storage`), so two rows can point at the same file. `track()`
+connects signals that keep `MediaBlob.refs` equal to the number of model
+fields naming each file: a save that changes a name takes a reference on
+the new one and gives back the old, a delete gives back all of them.
+A blob whose count drops to zero is handed to the `delete previous image`
+task, `collect()` then deletes it (and its image variants) only if it is
+still unreferenced and hasn't been uploaded again within `MEDIA_BLOB_GRACE`.
+Field defaults (`default.jpg`) are neither counted nor collected, every
+row without an upload would otherwise update the same blob row.
+
+`sweep()` is the backstop for files the counts never covered (uploads from
+before blobs were tracked, rows removed with raw SQL): it marks every name
+the tracked fields, live blobs and their variants reference, then walks
+`MEDIA_GC_DIRS` and deletes unmarked files older than `MEDIA_GC_GRACE`.
+"""
+import os
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.db import transaction
+from django.db.models import F, Q
+from django.db.models.signals import post_init, pre_save, post_save, post_delete
+from django.utils import timezone
+
+from core.models import MediaBlob, ImageVariant
+from utils.caching import bump_version
+
+PROTECTED = set()#field defaults shared by every new row
+TRACKED = {}#model -> tracked file field attnames
+
+
+def get_grace() -> timedelta:
+    return timedelta(seconds=getattr(settings, "MEDIA_BLOB_GRACE", 60 * 10))
+
+
+def get_gc_grace() -> timedelta:
+    return timedelta(seconds=getattr(settings, "MEDIA_GC_GRACE", 60 * 60 * 24))
+
+
+def get_gc_dirs() -> tuple:
+    return getattr(settings, "MEDIA_GC_DIRS", ("item_images", "item_thumbnails", "profile_pics", "variants"))
+
+
+def acquire(name:str) -> None:
+    if name in PROTECTED:
+        return
+    if not MediaBlob.objects.filter(name=name).update(refs=F("refs") + 1):
+        blob, created = MediaBlob.objects.get_or_create(name=name, defaults={"refs": 1})
+        if not created:
+            MediaBlob.objects.filter(pk=blob.pk).update(refs=F("refs") + 1)
+
+
+def release(name:str) -> None:
+    from core.tasks import del_prev_image#tasks import this module
+    if name in PROTECTED:
+        return
+    MediaBlob.objects.filter(name=name, refs__gt=0).update(refs=F("refs") - 1)
+    if MediaBlob.objects.filter(name=name, refs=0).exists():
+        transaction.on_commit(lambda: del_prev_image.delay(name))
+
+
+def collect(name:str) -> bool:
+    '''
+    Deletes an unreferenced blob and its variants.
+    returns False, deleting nothing, while anything still references it
+    '''
+    if os.path.isabs(name):
+        #tasks queued before blobs were tracked carry absolute paths
+        name = os.path.relpath(name, settings.MEDIA_ROOT).replace(os.sep, "/")
+    if name in PROTECTED:
+        return False
+    with transaction.atomic():
+        blob = MediaBlob.objects.select_for_update().filter(
+            name=name, refs=0, touched__lt=timezone.now() - get_grace()).first()
+        if blob is None:
+            return False
+        variants = ImageVariant.objects.filter(source=name)
+        names = [name, *variants.values_list("name", flat=True)]
+        variants.delete()
+        blob.delete()
+
+        def delete_files():
+            for stale in names:
+                default_storage.delete(stale)
+        transaction.on_commit(delete_files)
+    return True
+
+
+def _names(instance) -> dict:
+    '''
+    loaded file names of the tracked fields, deferred ones are left out
+    '''
+    names = {}
+    for attname in TRACKED[type(instance)]:
+        if attname in instance.__dict__:
+            value = instance.__dict__[attname]
+            names[attname] = getattr(value, "name", value) or None
+    return names
+
+
+def remember(sender, instance, **kwargs) -> None:
+    instance._media_names = _names(instance)
+
+
+def before_save(sender, instance, update_fields=None, raw=False, **kwargs) -> None:
+    if raw or instance._state.adding:
+        return
+    known = getattr(instance, "_media_names", {})
+    missing = [attname for attname in _names(instance) if attname not in known]
+    if missing:
+        #a deferred field was assigned, read what it replaces
+        row = type(instance)._base_manager.filter(pk=instance.pk).values(*missing).first() or {}
+        known.update((attname, row.get(attname) or None) for attname in missing)
+    instance._media_names = known
+
+
+def after_save(sender, instance, created, update_fields=None, raw=False, **kwargs) -> None:
+    if raw:
+        return
+    previous = {} if created else getattr(instance, "_media_names", {})
+    current = _names(instance)
+    for attname, name in current.items():
+        if update_fields is not None and attname not in update_fields:
+            continue
+        old = previous.get(attname)
+        if name == old or (attname not in previous and not created):
+            continue
+        if name:
+            acquire(name)
+        if old:
+            release(old)
+    instance._media_names = current
+
+
+def after_delete(sender, instance, **kwargs) -> None:
+    for name in _names(instance).values():
+        if name:
+            release(name)
+
+
+def track(model, *fields) -> None:
+    '''
+    Counts the references `fields` (file fields of `model`) hold on media blobs
+    '''
+    TRACKED[model] = [model._meta.get_field(field).attname for field in fields]
+    PROTECTED.update(model._meta.get_field(field).default for field in fields)
+    post_init.connect(remember, sender=model, weak=False)
+    pre_save.connect(before_save, sender=model, weak=False)
+    post_save.connect(after_save, sender=model, weak=False)
+    post_delete.connect(after_delete, sender=model, weak=False)
+
+
+def _held(since, names=None) -> set:
+    '''
+    Names tracked fields and blobs still counted (or touched after `since`)
+    hold, all of them or only those among `names`
+    '''
+    held = set(PROTECTED)
+    for model, attnames in TRACKED.items():
+        for attname in attnames:
+            rows = model._base_manager.order_by().exclude(**{attname: ""})
+            if names is not None:
+                rows = rows.filter(**{f"{attname}__in": names})
+            held.update(rows.values_list(attname, flat=True).distinct().iterator(chunk_size=5000))
+    #re-uploads of an unreferenced blob only touch it
+    blobs = MediaBlob.objects.filter(Q(refs__gt=0) | Q(touched__gte=since))
+    if names is not None:
+        blobs = blobs.filter(name__in=names)
+    held.update(blobs.values_list("name", flat=True).iterator(chunk_size=5000))
+    return held
+
+
+def _mark(since) -> set:
+    marked = _held(since)
+    #variants live as long as their source
+    marked.update(name for source, name in ImageVariant.objects.values_list("source", "name").iterator(chunk_size=5000)
+                  if source in marked)
+    return marked
+
+
+def _live(names:list, since) -> set:
+    '''
+    `_mark` for a batch of names only, checked right before they are deleted
+    '''
+    live = _held(since, names)
+    variants = dict(ImageVariant.objects.filter(name__in=names).values_list("name", "source"))
+    sources = _held(since, list(set(variants.values())))
+    live.update(name for name, source in variants.items() if source in sources)
+    return live
+
+
+def _walk(path:str):
+    '''
+    `(path, stat)` of every file under `path`, depth first with `os.scandir`
+    '''
+    stack = [path]
+    while stack:
+        try:
+            entries = os.scandir(stack.pop())
+        except FileNotFoundError:
+            continue
+        with entries:
+            for entry in entries:
+                if entry.is_dir(follow_symlinks=False):
+                    stack.append(entry.path)
+                elif entry.is_file(follow_symlinks=False):
+                    yield entry.path, entry.stat(follow_symlinks=False)
+
+
+def sweep(dry_run:bool=False, batch_size:int=500) -> dict:
+    '''
+    Mark and sweep of `MEDIA_GC_DIRS`: deletes files nothing references that
+    are older than `MEDIA_GC_GRACE`, in batches re-checked against the database
+    first. `dry_run` only reports.
+    returns `{"scanned", "orphans", "reclaimable", "deleted", "freed"}`, sizes in bytes
+    '''
+    cutoff = timezone.now() - get_gc_grace()
+    marked = _mark(cutoff)
+    report = {"scanned": 0, "orphans": 0, "reclaimable": 0, "deleted": 0, "freed": 0}
+    batch = {}
+
+    def delete(batch:dict) -> None:
+        #rows saved since the mark keep their files
+        live = _live(list(batch), cutoff)
+        stale = {name: size for name, size in batch.items() if name not in live}
+        MediaBlob.objects.filter(name__in=list(stale)).delete()
+        if ImageVariant.objects.filter(name__in=list(stale)).delete()[0]:
+            bump_version(ImageVariant)
+        for name, size in stale.items():
+            default_storage.delete(name)
+            report["deleted"] += 1
+            report["freed"] += size
+
+    for directory in get_gc_dirs():
+        for path, stat in _walk(os.path.join(settings.MEDIA_ROOT, directory)):
+            report["scanned"] += 1
+            name = os.path.relpath(path, settings.MEDIA_ROOT).replace(os.sep, "/")
+            if name in marked or stat.st_mtime >= cutoff.timestamp():
+                continue
+            report["orphans"] += 1
+            report["reclaimable"] += stat.st_size
+            if dry_run:
+                continue
+            batch[name] = stat.st_size
+            if len(batch) >= batch_size:
+                delete(batch)
+                batch = {}
+    if batch:
+        delete(batch)
+    return report
@@ -0,0 +1,48 @@
+# Generated by Django 4.1.3 on 2026-10-18 19:00
+
+import core.models.user_models.customuser_models
+import core.storage
+from django.db import migrations, models
+import django.utils.timezone
+from django.db.models import Count
+
+
+def count_references(apps, schema_editor):
+    '''
+    blobs for the profile pics already stored, counted by the rows naming them
+    '''
+    MediaBlob = apps.get_model("core", "MediaBlob")
+    CustomUser = apps.get_model("core", "CustomUser")
+    references = CustomUser.objects.exclude(image="").order_by().values("image").annotate(refs=Count("id"))
+    MediaBlob.objects.bulk_create(
+        (MediaBlob(name=row["image"], refs=row["refs"]) for row in references.iterator()), batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0007_image_variants'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MediaBlob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=255, unique=True)),
+                ('size', models.PositiveBigIntegerField(default=0)),
+                ('refs', models.PositiveIntegerField(default=0)),
+                ('touched', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+            options={
+                'verbose_name': 'Media blob',
+                'verbose_name_plural': 'Media blobs',
+            },
+        ),
+        migrations.AlterField(
+            model_name='customuser',
+            name='image',
+            field=models.ImageField(default='default.jpg', storage=core.storage.ContentAddressedStorage(), upload_to=core.models.user_models.customuser_models.upload_image_path),
+        ),
+        migrations.RunPython(count_references, migrations.RunPython.noop),
+    ]
@@ -1,5 +1,6 @@
 from .contact_models import Contact
 from .comment_models import Comment
+from .media_models import MediaBlob, ImageVariant
 from .user_models import (
     CustomUser, CustomerProfile, EmployeeProfile)
 
@@ -7,6 +8,8 @@ from .user_models import (
 __all__ = (
     "Contact",
     "Comment",
+    "MediaBlob",
+    "ImageVariant",
     "CustomUser",
     "CustomerProfile",
     "EmployeeProfile",
@@ -0,0 +1,51 @@
+from django.db import models
+from django.core.files.storage import default_storage
+from django.utils import timezone
+
+
+class MediaBlob(models.Model):
+    '''
+    A stored media file and the number of model fields naming it,
+    see `core.storage` and `core.media`
+    '''
+    name = models.CharField(max_length=255, unique=True)#storage name
+    size = models.PositiveBigIntegerField(default=0)#bytes
+    refs = models.PositiveIntegerField(default=0)
+    touched = models.DateTimeField(default=timezone.now)#last stored or uploaded again
+
+    def __str__(self) -> str:
+        return f'{self.name} ({self.refs} refs)'
+
+    class Meta:
+        verbose_name = "Media blob"
+        verbose_name_plural = "Media blobs"
+
+
+class ImageVariant(models.Model):
+    '''
+    One resized copy of an uploaded image (item image, thumbnail or profile pic)
+    keyed by the source file name, written by `core.images.generate_variants`
+    '''
+    source = models.CharField(max_length=255)#storage name of the original
+    width = models.PositiveIntegerField()
+    height = models.PositiveIntegerField()
+    format = models.CharField(max_length=10)#webp, jpeg
+    name = models.CharField(max_length=255)#storage name of the variant file
+    size = models.PositiveIntegerField(default=0)#bytes
+    created = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self) -> str:
+        return f'{self.source} {self.width}w {self.format}'
+
+    @property
+    def url(self) -> str:
+        return default_storage.url(self.name)
+
+    class Meta:
+        verbose_name = "Image variant"
+        verbose_name_plural = "Image variants"
+        ordering = ["source", "format", "width"]
+        constraints = [
+            #also the index for looking up a source's variants
+            models.UniqueConstraint(fields=["source", "format", "width"], name="image_variant_unique"),
+        ]
@@ -1,10 +1,10 @@
 import os
-from random import randint
 
 from django.db import models
 from django.contrib.auth.models import AbstractUser
 
-from core.tasks import process_user_image
+from core.tasks import process_image_variants
+from core.storage import ContentAddressedStorage, is_upload
 
 #helper functions
 def get_filename_ext(filepath):
@@ -13,10 +13,9 @@ def get_filename_ext(filepath):
     return name, ext
 
 def upload_image_path(instance, filename)->str:
-    new_filename = randint(1,3910209312)
+    #the storage names the file by the hash of its bytes
     _, ext = get_filename_ext(filename)
-    final_filename = f'{new_filename}{ext}'
-    return "profile_pics/{final_filename}".format(final_filename=final_filename)
+    return f"profile_pics/upload{ext}"
 
 #model classes
 class CustomUser(AbstractUser):
@@ -33,7 +32,7 @@ class CustomUser(AbstractUser):
     phone = models.CharField(max_length=15, blank=True, null=True)
     address = models.TextField(blank=True, null= True)
     country = models.CharField(max_length=100, null=True, blank=True)
-    image = models.ImageField(default="default.jpg", upload_to=upload_image_path)#profile
+    image = models.ImageField(default="default.jpg", upload_to=upload_image_path, storage=ContentAddressedStorage())#profile
     email_verified = models.BooleanField(default=False)
     avg_rating = models.DecimalField(decimal_places=2, max_digits=4, default=0)
     #amount earned, amount paid out
@@ -42,7 +41,8 @@ class CustomUser(AbstractUser):
             return f"{self.username}"
     
     def process_image(self)->str:
-        process_user_image.delay(self.image.path)
+        if is_upload(self.image):
+            process_image_variants.delay(self.image.name, "profile")
         return "done"
     
     def get_comments(self):
@@ -54,7 +54,7 @@ class CustomUser(AbstractUser):
     def save(self, *args, **kwargs) -> None:
         print("saving")
         super().save(*args, **kwargs)
-        #process_user_image(self)#to reduce overhead on saving saving opeations
+        #self.process_image()#to reduce overhead on saving saving opeations
 
     class Meta:
         verbose_name = "CustomUser"
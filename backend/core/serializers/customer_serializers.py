@@ -1,11 +1,11 @@
 from django.contrib.auth.hashers import make_password
+from django.db import transaction
 from rest_framework.serializers import ModelSerializer  # CharField can be imported here too
 from rest_framework.fields import (
     CharField,  URLField,
     ) #CharField should be imported here(directly)
 
 from .user_serializers import CustomUserSerializer
-from core.tasks import del_prev_image
 from core.models import CustomUser, CustomerProfile
 
 
@@ -81,7 +81,6 @@ class CustomerUpdateSerializer(ModelSerializer):
         store_url = profile_data.pop("store_url", profile.store_url)
 
         #user instance update
-        old_image = instance.image
         if validated_data.get("password") != None:
             instance.set_password(validated_data["password"])
         instance.first_name = validated_data.get("first_name", instance.first_name)
@@ -92,10 +91,8 @@ class CustomerUpdateSerializer(ModelSerializer):
         instance.phone = validated_data.get("phone")
         instance.save()
         if validated_data.get("image") is not None:
-            instance.process_image()
-            print("old image",old_image, "path", old_image.path)
-            if "default"  not in old_image:
-                del_prev_image.delay(old_image.path)
+            #the replaced image is deleted by core.media once nothing references it
+            transaction.on_commit(instance.process_image)
         #implement algorithm for sending email on instance update
 
         #profile update
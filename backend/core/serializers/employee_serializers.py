@@ -1,4 +1,5 @@
 from django.contrib.auth.hashers import make_password
+from django.db import transaction
 from rest_framework.serializers import ModelSerializer  # CharField can be imported here too
 from rest_framework.fields import CharField#CharField should be imported here(directly)
 
@@ -83,7 +84,8 @@ class EmployeeUpdateSerializer(ModelSerializer):
         instance.phone = validated_data.get("phone")
         instance.save()
         if validated_data.get("image") is not None:
-            instance.process_image()
+            #variants are made from the stored file once the row is committed
+            transaction.on_commit(instance.process_image)
 
         #profile update
         profile.skills = skills
@@ -0,0 +1,34 @@
+from rest_framework.fields import Field
+from rest_framework.serializers import ListSerializer
+
+from core.images import srcsets
+
+
+class SrcsetField(Field):
+    """
+    `{format: srcset}` of the responsive variants of an image field, e.g.
+    `{"webp": "/media/variants/.../320.webp 320w, ...", "jpeg": "..."}`.
+    When the serializer is a list's child the variants of the whole page
+    are loaded with one query
+    """
+
+    def __init__(self, **kwargs) -> None:
+        kwargs["read_only"] = True
+        super().__init__(**kwargs)
+
+    def page_sources(self) -> set:
+        root = self.root
+        if not isinstance(root, ListSerializer) or self.parent is not root.child or root.instance is None:
+            return set()
+        return {getattr(getattr(instance, self.source, None), "name", None) for instance in root.instance}
+
+    def to_representation(self, value) -> dict:
+        name = getattr(value, "name", None)
+        if not name:
+            return {}
+        loaded = self.root.__dict__.setdefault("_srcsets", {})
+        if name not in loaded:
+            sources = (self.page_sources() | {name}) - set(loaded) - {None}
+            found = srcsets(sources)
+            loaded.update((source, found.get(source, {})) for source in sources)
+        return loaded[name]
@@ -1,8 +1,10 @@
 from rest_framework.serializers import ModelSerializer  # CharField can be imported here too
 
 from core.models import CustomUser
+from .fields import SrcsetField
 
 class CustomUserSerializer(ModelSerializer):
+    image_srcset = SrcsetField(source="image")
 
     class Meta:
         model = CustomUser
@@ -12,4 +14,5 @@ class CustomUserSerializer(ModelSerializer):
             "date_of_birth",
             "phone","address",
             "country","image",
+            "image_srcset",
         )
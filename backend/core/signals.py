@@ -3,6 +3,10 @@ from django.db.models.signals import post_save
 from rest_framework.authtoken.models import Token
 
 from core.models import CustomUser, CustomerProfile, EmployeeProfile
+from core import media
+
+#reference counts of content addressed profile pics
+media.track(CustomUser, "image")
 
 @receiver(post_save, sender = CustomUser, weak = False)
 def report_uploaded(sender, instance, created, **kwargs):
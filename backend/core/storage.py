@@ -0,0 +1,64 @@
+import os
+import posixpath
+import re
+from hashlib import sha256
+
+from django.core.files.base import File
+from django.core.files.storage import FileSystemStorage
+from django.utils import timezone
+from django.utils.deconstruct import deconstructible
+
+#`item_images/ab/ab12...ef.jpg`
+CONTENT_ADDRESSED_RE = re.compile(r"(^|/)([0-9a-f]{2})/\2[0-9a-f]{62}\.\w+$")
+
+
+def is_content_addressed(name:str) -> bool:
+    '''
+    names from `ContentAddressedStorage` never change content
+    '''
+    return bool(CONTENT_ADDRESSED_RE.search(name or ""))
+
+
+def is_upload(file) -> bool:
+    '''
+    False for an empty file field or one still on its default placeholder
+    '''
+    return bool(file.name) and file.name != file.field.default
+
+
+@deconstructible
+class ContentAddressedStorage(FileSystemStorage):
+    """
+    Names every upload by the sha256 of its bytes under the directory `upload_to`
+    gives, hashed chunk by chunk as the file streams past. An upload whose
+    bytes are already stored reuses the existing file instead of writing a copy.
+    Each stored name gets a `core.MediaBlob` row, references are counted by `core.media`
+    """
+
+    def content_name(self, name:str, content) -> str:
+        #streamed uploads were hashed on the way in, see `core.uploads`
+        digest = getattr(content, "digest", None)
+        if digest is None:
+            digest = sha256()
+            for chunk in content.chunks():
+                digest.update(chunk)
+            digest = digest.hexdigest()
+        extension = os.path.splitext(name)[1].lower()
+        return posixpath.join(posixpath.dirname(name.replace("\\", "/")), digest[:2], f"{digest}{extension}")
+
+    def save(self, name, content, max_length=None) -> str:
+        if name is None:
+            name = content.name
+        if not hasattr(content, "chunks"):
+            content = File(content, name)
+        name = self.content_name(name, content)
+        if not self.exists(name):
+            stored = super().save(name, content, max_length=max_length)
+            if stored != name:
+                #the same bytes landed concurrently, keep the one named by content
+                self.delete(stored)
+        from core.models import MediaBlob#core.models use this storage
+        #a fresh `touched` keeps a blob being re-uploaded from being collected
+        if not MediaBlob.objects.filter(name=name).update(touched=timezone.now()):
+            MediaBlob.objects.get_or_create(name=name, defaults={"size": content.size})
+        return name
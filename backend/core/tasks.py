@@ -1,11 +1,8 @@
-import os
-
 from celery import shared_task
 from django.utils.http import urlsafe_base64_encode
 from django.template.loader import render_to_string
 from django.utils.encoding import force_bytes
 from django.core.mail import send_mail
-from PIL import Image
 
 from .core_utils.token import account_activation_token
 
@@ -40,25 +37,31 @@ Also email support to inform us about it.
     send_mail(subject=subject, message=message,from_email="donotreply@ecom.com", recipient_list=[email])
 
 
-#will add celery shared task decorator later
-@shared_task(name="process user image")
-def process_user_image(imagepath)->None:
-    #this operation adds computational overhead each time a save/update to models is done
-    #needs to be reviewed -> Done
-    print("processing image")#will replace all prints with logging properly
-    img = Image.open(imagepath)
-
-    if img.height > 150 or img.width > 150:
-        output_size = (150, 150)  # 125,125 was used in flask example though
-        img.thumbnail(output_size)
-        img.save(imagepath)
+@shared_task(name="process image variants")
+def process_image_variants(name:str, kind:str) -> int:
+    """
+    Writes the responsive WebP/JPEG variants of an uploaded image,
+    `kind` picks the widths from `IMAGE_VARIANTS`
+    """
+    from .images import generate_variants#the models import this module
+    from .media import PROTECTED
+    if not name or name in PROTECTED:
+        #queued for a field default before those were skipped
+        return 0
+    return len(generate_variants(name, kind))
 
 @shared_task(name="delete previous image")
-def del_prev_image(imagepath):
-    #remove old file
-    print("deleting image")
-    try:
-        os.remove(imagepath)
-        return "Success"#will remove later
-    except FileNotFoundError:
-        print("file not found")#will replace with log
+def del_prev_image(name:str) -> bool:
+    """
+    Deletes a replaced image blob and its variants once no row references it
+    """
+    from .media import collect#the models import this module
+    return collect(name)
+
+@shared_task(name="sweep orphaned media")
+def sweep_orphaned_media(dry_run:bool=False) -> dict:
+    """
+    Deletes media files no row references, left behind before uploads were reference counted
+    """
+    from .media import sweep#the models import this module
+    return sweep(dry_run=dry_run)
@@ -0,0 +1,121 @@
+import shutil
+import tempfile
+from io import BytesIO, StringIO
+
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from PIL import Image
+
+from core.images import generate_variants, open_image, process_batch, variant_name
+from core.models import CustomUser, ImageVariant
+from core.serializers import CustomUserSerializer
+from core.storage import is_upload
+from core.tasks import process_image_variants
+
+MEDIA_ROOT = tempfile.mkdtemp()
+
+
+def make_image(name:str, size=(800, 400), mode="RGB", fmt="JPEG") -> str:
+    buffer = BytesIO()
+    Image.new(mode, size, (200, 30, 30, 128) if mode == "RGBA" else (200, 30, 30)).save(buffer, format=fmt)
+    return default_storage.save(name, ContentFile(buffer.getvalue()))
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT, IMAGE_VARIANTS={"item": (200, 400, 1600), "profile": (100,)},
+                   IMAGE_VARIANT_FORMATS=("webp", "jpeg"))
+class ImageVariantTestCase(TestCase):
+
+    @classmethod
+    def tearDownClass(cls) -> None:
+        shutil.rmtree(MEDIA_ROOT, ignore_errors=True)
+        super().tearDownClass()
+
+    def test_variants_keep_aspect_ratio(self):
+        '''
+        a variant per width and format, none larger than the original
+        '''
+        source = make_image("item_images/wide.jpg")
+        self.assertEqual(process_image_variants(source, "item"), 6)
+        sizes = set(ImageVariant.objects.filter(source=source).values_list("format", "width", "height"))
+        self.assertEqual(sizes, {(fmt, width, width // 2) for fmt in ("webp", "jpeg") for width in (200, 400, 800)})
+        with default_storage.open(variant_name(source, 400, "webp")) as file:
+            self.assertEqual((Image.open(file).format, Image.open(file).size), ("WEBP", (400, 200)))
+
+    def test_transparent_image_gets_jpeg_fallback(self):
+        source = make_image("profile_pics/alpha.png", size=(300, 300), mode="RGBA", fmt="PNG")
+        generate_variants(source, "profile")
+        with default_storage.open(variant_name(source, 100, "jpeg")) as file:
+            self.assertEqual(Image.open(file).mode, "RGB")
+        with default_storage.open(variant_name(source, 100, "webp")) as file:
+            self.assertEqual(Image.open(file).mode, "RGBA")
+
+    def test_default_image_has_no_variants(self):
+        '''
+        rows still on the `default.jpg` placeholder don't queue or render variants
+        '''
+        user = CustomUser.objects.create_user(username="plain", email="plain@example.com")
+        self.assertFalse(is_upload(user.image))
+        user.image = make_image("profile_pics/face.jpg")
+        self.assertTrue(is_upload(user.image))
+        self.assertEqual(process_image_variants("default.jpg", "item"), 0)
+        self.assertFalse(ImageVariant.objects.filter(source="default.jpg").exists())
+
+    def test_regenerating_drops_old_widths(self):
+        source = make_image("item_images/regen.jpg")
+        generate_variants(source, "item")
+        with override_settings(IMAGE_VARIANTS={"item": (300,)}):
+            generate_variants(source, "item")
+        self.assertEqual(set(ImageVariant.objects.filter(source=source).values_list("width", flat=True)), {300})
+        self.assertFalse(default_storage.exists(variant_name(source, 200, "webp")))
+
+    def test_srcset_for_a_page_in_one_query(self):
+        for number in range(3):
+            user = CustomUser.objects.create_user(username=f"pic{number}", email=f"pic{number}@example.com")
+            user.image = make_image(f"profile_pics/user{number}.jpg", size=(500, 500))
+            user.save()
+            generate_variants(user.image.name, "profile")
+        users = list(CustomUser.objects.all())
+        with CaptureQueriesContext(connection) as queries:
+            data = CustomUserSerializer(users, many=True).data
+        self.assertEqual(len(queries), 1)
+        self.assertEqual(data[0]["image_srcset"]["webp"], f"/media/{variant_name(users[0].image.name, 100, 'webp')} 100w")
+        self.assertEqual(set(data[2]["image_srcset"]), {"webp", "jpeg"})
+
+    def test_jpeg_decoded_at_reduced_scale(self):
+        source = make_image("item_images/huge.jpg", size=(4000, 2000))
+        with default_storage.open(source, "rb") as file:
+            #the smallest scale still covering the 1600px variant
+            self.assertEqual(open_image(file, "item").size, (2000, 1000))
+        generate_variants(source, "item")
+        self.assertEqual(set(ImageVariant.objects.filter(source=source, format="jpeg").values_list("width", "height")),
+                         {(200, 100), (400, 200), (1600, 800)})
+
+    def test_batch_skips_current_variants(self):
+        first, second = make_image("item_images/one.jpg"), make_image("item_images/two.png", fmt="PNG")
+        broken = default_storage.save("item_images/broken.jpg", ContentFile(b"not an image"))
+        generate_variants(first, "item")
+        report = process_batch([(first, "item"), (second, "item"), (second, "item"), (broken, "item")], workers=1)
+        self.assertEqual((report["processed"], report["skipped"], report["failed"]), (1, 1, 1))
+        self.assertIn(broken, report["errors"])
+        self.assertEqual(ImageVariant.objects.filter(source=second).count(), 6)
+        #a changed configuration makes them stale again
+        with override_settings(IMAGE_VARIANTS={"item": (300,)}):
+            report = process_batch([(first, "item"), (second, "item")], workers=1)
+        self.assertEqual(report["processed"], 2)
+        self.assertEqual(set(ImageVariant.objects.filter(source=first).values_list("width", flat=True)), {300})
+
+    def test_process_images_command(self):
+        user = CustomUser.objects.create_user(username="pool", email="pool@example.com")
+        user.image = make_image("profile_pics/pool.jpg", size=(500, 500))
+        user.save()
+        CustomUser.objects.create_user(username="nopic", email="nopic@example.com")
+        output = StringIO()
+        call_command("process_images", workers=2, stdout=output)
+        self.assertIn("1 images", output.getvalue())
+        self.assertIn("1 processed", output.getvalue())
+        self.assertEqual(ImageVariant.objects.filter(source=user.image.name).count(), 2)
+        self.assertTrue(default_storage.exists(variant_name(user.image.name, 100, "webp")))
@@ -0,0 +1,212 @@
+import os
+import shutil
+import tempfile
+import time
+from functools import partial
+from hashlib import sha256
+from io import StringIO
+
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.utils import timezone
+
+from core.media import PROTECTED, _live, acquire, collect, sweep
+from core.models import CustomUser, MediaBlob, ImageVariant
+from core.storage import ContentAddressedStorage, is_content_addressed
+from core.views.media_views import IMMUTABLE
+
+MEDIA_ROOT = tempfile.mkdtemp()
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT, MEDIA_BLOB_GRACE=0)
+class ContentAddressedMediaTestCase(TestCase):
+
+    @classmethod
+    def tearDownClass(cls) -> None:
+        shutil.rmtree(MEDIA_ROOT, ignore_errors=True)
+        super().tearDownClass()
+
+    def make_user(self, username:str, data:bytes=b"same bytes") -> CustomUser:
+        user = CustomUser.objects.create_user(username=username, email=f"{username}@example.com")
+        user.image = SimpleUploadedFile("Photo.JPG", data)
+        user.save()
+        return user
+
+    def blob(self, name:str) -> MediaBlob:
+        return MediaBlob.objects.get(name=name)
+
+    def queued(self, callbacks) -> list:
+        #leaves out the cache version bumps
+        return [callback for callback in callbacks if not isinstance(callback, partial)]
+
+    def test_same_bytes_share_a_blob(self):
+        first, second = self.make_user("first"), self.make_user("second")
+        self.assertEqual(first.image.name, second.image.name)
+        self.assertTrue(is_content_addressed(first.image.name))
+        self.assertTrue(first.image.name.startswith("profile_pics/") and first.image.name.endswith(".jpg"))
+        self.assertEqual(len(default_storage.listdir(first.image.name.rsplit("/", 1)[0])[1]), 1)
+        self.assertEqual((self.blob(first.image.name).refs, self.blob(first.image.name).size), (2, 10))
+        self.assertNotEqual(self.make_user("third", b"other bytes").image.name, first.image.name)
+
+    def test_blob_deleted_once_unreferenced(self):
+        first, second = self.make_user("first"), self.make_user("second")
+        name = first.image.name
+        ImageVariant.objects.create(source=name, width=10, height=10, format="webp", name="variants/stale.webp")
+        with self.captureOnCommitCallbacks() as callbacks:
+            first.image = SimpleUploadedFile("new.png", b"new bytes")
+            first.save()
+        self.assertEqual((self.blob(name).refs, len(self.queued(callbacks))), (1, 0))
+        self.assertFalse(collect(name))
+        with self.captureOnCommitCallbacks() as callbacks:
+            second.delete()
+        #the delete queued the blob for collection
+        self.assertEqual((self.blob(name).refs, len(self.queued(callbacks))), (0, 1))
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertTrue(collect(name))
+        self.assertFalse(default_storage.exists(name))
+        self.assertFalse(MediaBlob.objects.filter(name=name).exists())
+        self.assertFalse(ImageVariant.objects.filter(source=name).exists())
+        self.assertTrue(default_storage.exists(first.image.name))
+
+    def test_recent_upload_is_kept(self):
+        '''
+        unreferenced but stored within the grace period, the same bytes may be on their way in again
+        '''
+        user = self.make_user("first")
+        name = user.image.name
+        user.delete()
+        with override_settings(MEDIA_BLOB_GRACE=60):
+            self.assertFalse(collect(name))
+        self.assertTrue(collect(name))
+
+    def test_default_image_is_never_collected(self):
+        with self.assertNumQueries(0):
+            #rows without an upload don't touch a shared blob row
+            self.assertIsNone(acquire("default.jpg"))
+        user = CustomUser.objects.create_user(username="plain", email="plain@example.com")
+        user.delete()
+        self.assertFalse(MediaBlob.objects.filter(name="default.jpg").exists())
+        self.assertFalse(collect("default.jpg"))
+
+    def test_deferred_image_replaced(self):
+        user = self.make_user("first")
+        name = user.image.name
+        deferred = CustomUser.objects.only("id", "username").get(pk=user.pk)
+        deferred.image = SimpleUploadedFile("new.jpg", b"replacement")
+        deferred.save()
+        self.assertEqual(self.blob(name).refs, 0)
+        self.assertEqual(self.blob(deferred.image.name).refs, 1)
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT, MEDIA_ACCEL=None)
+class MediaServingTestCase(TestCase):
+
+    @classmethod
+    def tearDownClass(cls) -> None:
+        shutil.rmtree(MEDIA_ROOT, ignore_errors=True)
+        super().tearDownClass()
+
+    def setUp(self) -> None:
+        self.name = default_storage.save("profile_pics/upload.jpg", ContentFile(b"0123456789"))
+        self.url = f"/media/{self.name}"
+
+    def test_content_addressed_file_is_immutable(self):
+        name = ContentAddressedStorage().save("profile_pics/photo.jpg", ContentFile(b"0123456789"))
+        response = self.client.get(f"/media/{name}")
+        self.assertEqual(b"".join(response.streaming_content), b"0123456789")
+        self.assertEqual(response["Cache-Control"], IMMUTABLE)
+        self.assertEqual(response["ETag"], f'"{sha256(b"0123456789").hexdigest()}"')
+        self.assertEqual(response["Content-Type"], "image/jpeg")
+        response = self.client.get(f"/media/{name}", HTTP_IF_NONE_MATCH=response["ETag"])
+        self.assertEqual(response.status_code, 304)
+
+    def test_byte_ranges(self):
+        response = self.client.get(self.url, HTTP_RANGE="bytes=2-5")
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(b"".join(response.streaming_content), b"2345")
+        self.assertEqual((response["Content-Range"], response["Content-Length"]), ("bytes 2-5/10", "4"))
+        response = self.client.get(self.url, HTTP_RANGE="bytes=-3")
+        self.assertEqual(b"".join(response.streaming_content), b"789")
+        self.assertEqual(self.client.get(self.url, HTTP_RANGE="bytes=20-").status_code, 416)
+        #a stale If-Range gets the whole file
+        response = self.client.get(self.url, HTTP_RANGE="bytes=2-5", HTTP_IF_RANGE='"stale"')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response["Cache-Control"], "public, max-age=3600")
+
+    @override_settings(MEDIA_ACCEL="x-accel-redirect", MEDIA_ACCEL_PREFIX="/protected-media/")
+    def test_handed_to_the_proxy(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response["X-Accel-Redirect"], f"/protected-media/{self.name}")
+        self.assertEqual(response.content, b"")
+        with override_settings(MEDIA_ACCEL="x-sendfile"):
+            self.assertEqual(self.client.get(self.url)["X-Sendfile"], default_storage.path(self.name))
+
+    def test_private_paths(self):
+        default_storage.save("tmp/partial.upload.jpg", ContentFile(b"half"))
+        default_storage.save("reports/sales.csv", ContentFile(b"a,b"))
+        for path in ("tmp/partial.upload.jpg", "reports/sales.csv", "../settings.py", "profile_pics/missing.jpg"):
+            self.assertEqual(self.client.get(f"/media/{path}").status_code, 404, path)
+        staff = CustomUser.objects.create_user(username="staff", email="staff@example.com", is_staff=True)
+        self.client.force_login(staff)
+        response = self.client.get("/media/reports/sales.csv")
+        self.assertEqual((response.status_code, response["Cache-Control"]), (200, "private, no-cache"))
+        self.assertEqual(self.client.get("/media/tmp/partial.upload.jpg").status_code, 404)
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT, MEDIA_GC_GRACE=60)
+class MediaSweepTestCase(TestCase):
+
+    def setUp(self) -> None:
+        #every test walks the whole tree
+        shutil.rmtree(MEDIA_ROOT, ignore_errors=True)
+
+    @classmethod
+    def tearDownClass(cls) -> None:
+        shutil.rmtree(MEDIA_ROOT, ignore_errors=True)
+        super().tearDownClass()
+
+    def save(self, name:str, data:bytes, age:int=3600) -> str:
+        name = default_storage.save(name, ContentFile(data))
+        past = time.time() - age
+        os.utime(default_storage.path(name), (past, past))
+        return name
+
+    def test_sweep_deletes_old_orphans(self):
+        user = CustomUser.objects.create_user(username="kept", email="kept@example.com")
+        user.image = SimpleUploadedFile("kept.jpg", b"kept bytes")
+        user.save()
+        os.utime(default_storage.path(user.image.name), (time.time() - 3600,) * 2)
+        variant = self.save(f"variants/{user.image.name}/100.webp", b"variant")
+        ImageVariant.objects.create(source=user.image.name, width=100, height=100, format="webp", name=variant)
+        orphan = self.save("item_images/legacy123.jpg", b"orphaned bytes")
+        orphan_variant = self.save("variants/item_images/legacy123/100.webp", b"old")
+        ImageVariant.objects.create(source=orphan, width=100, height=100, format="webp", name=orphan_variant)
+        recent = self.save("profile_pics/just_uploaded.jpg", b"in flight", age=0)
+        elsewhere = self.save("reports/old.csv", b"not swept")
+
+        report = sweep(dry_run=True)
+        self.assertEqual((report["scanned"], report["orphans"], report["reclaimable"], report["deleted"]), (5, 2, 17, 0))
+        self.assertTrue(default_storage.exists(orphan))
+
+        report = sweep(batch_size=1)
+        self.assertEqual((report["deleted"], report["freed"]), (2, 17))
+        self.assertFalse(default_storage.exists(orphan) or default_storage.exists(orphan_variant))
+        self.assertFalse(ImageVariant.objects.filter(source=orphan).exists())
+        for name in (user.image.name, variant, recent, elsewhere):
+            self.assertTrue(default_storage.exists(name), name)
+
+    def test_rows_saved_during_the_sweep_keep_their_files(self):
+        orphan = self.save("item_images/late.jpg", b"late")
+        user = CustomUser.objects.create_user(username="late", email="late@example.com")
+        CustomUser.objects.filter(pk=user.pk).update(image=orphan)
+        self.assertEqual(_live([orphan], timezone.now()), {orphan} | PROTECTED)
+
+    def test_command_dry_run(self):
+        self.save("item_thumbnails/old.jpg", b"12345")
+        output = StringIO()
+        call_command("sweep_media", dry_run=True, stdout=output)
+        self.assertIn("1 orphaned (5\xa0bytes reclaimable)", output.getvalue())
+        self.assertTrue(default_storage.exists("item_thumbnails/old.jpg"))
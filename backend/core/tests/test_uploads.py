@@ -0,0 +1,135 @@
+import os
+import shutil
+import tempfile
+from functools import partial
+from hashlib import sha256
+from io import BytesIO
+
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import TestCase, override_settings
+from django.test.client import encode_multipart, BOUNDARY, MULTIPART_CONTENT
+from PIL import Image
+from rest_framework.test import APIClient
+
+from core.models import CustomUser, CustomerProfile, MediaBlob
+from core.uploads import get_temp_dir, sniff
+from ecommerce.models import Item
+
+MEDIA_ROOT = tempfile.mkdtemp()
+
+
+def make_png(size=(40, 30), color=(200, 10, 10)) -> bytes:
+    buffer = BytesIO()
+    Image.new("RGB", size, color).save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT)
+class StreamingUploadTestCase(TestCase):
+
+    @classmethod
+    def tearDownClass(cls) -> None:
+        shutil.rmtree(MEDIA_ROOT, ignore_errors=True)
+        super().tearDownClass()
+
+    def setUp(self) -> None:
+        self.user = CustomUser.objects.create_user(username="vendor", email="vendor@example.com")
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def create_item(self, data:bytes, name:str="Photo.PNG", **extra):
+        return self.client.post("/api/v1/item-create/", encode_multipart(BOUNDARY, {
+            "title": "Lamp", "description": "A lamp", "stock": 3, "price": 100,
+            "image": SimpleUploadedFile(name, data, content_type="application/octet-stream"),
+        }), content_type=MULTIPART_CONTENT, **extra)
+
+    def test_sniff(self):
+        self.assertEqual(sniff(make_png()[:16]), "image/png")
+        self.assertEqual(sniff(b"RIFF\x00\x00\x00\x00WEBPVP8 "), "image/webp")
+        self.assertIsNone(sniff(b"<svg xmlns="))
+
+    def test_item_image_streamed_to_storage(self):
+        data = make_png()
+        with self.captureOnCommitCallbacks() as callbacks:
+            response = self.create_item(data)
+        self.assertEqual(response.status_code, 200)
+        item = Item.objects.get(title="Lamp")
+        self.assertEqual(item.vendor, self.user)
+        digest = sha256(data).hexdigest()
+        self.assertEqual(item.image.name, f"item_images/{digest[:2]}/{digest}.png")
+        with default_storage.open(item.image.name, "rb") as stored:
+            self.assertEqual(stored.read(), data)
+        self.assertEqual(MediaBlob.objects.get(name=item.image.name).size, len(data))
+        #the temp file was moved into place, not copied
+        self.assertEqual(os.listdir(get_temp_dir()), [])
+        #variants are queued for after the commit
+        self.assertIn(item.process_image.__func__, [getattr(cb, "__func__", None) for cb in callbacks])
+
+    def test_extension_follows_the_content(self):
+        '''
+        the stored extension is the sniffed type's, not the client filename's
+        '''
+        data = make_png()
+        self.assertEqual(self.create_item(data, "photo.jpg").status_code, 200)
+        digest = sha256(data).hexdigest()
+        self.assertEqual(Item.objects.get(title="Lamp").image.name, f"item_images/{digest[:2]}/{digest}.png")
+
+    def test_profile_image_streamed_to_storage(self):
+        CustomerProfile.objects.create(user=self.user, user_type="vendor")
+        data = make_png((20, 20))
+        with self.captureOnCommitCallbacks() as callbacks:
+            response = self.client.patch("/api/v1/user_profile/", encode_multipart(
+                BOUNDARY, {"bio": "hi", "phone": "0800", "image": SimpleUploadedFile("me.png", data)}), content_type=MULTIPART_CONTENT)
+        self.assertEqual(response.status_code, 200)
+        self.user.refresh_from_db()
+        digest = sha256(data).hexdigest()
+        self.assertEqual(self.user.image.name, f"profile_pics/{digest[:2]}/{digest}.png")
+        #variants, the cache version bumps are partials
+        self.assertEqual(len([callback for callback in callbacks if not isinstance(callback, partial)]), 1)
+
+    def test_idempotency_key_covers_the_file(self):
+        '''
+        a key reused with another file of the same size is refused, not replayed
+        '''
+        red, green = make_png(), make_png(color=(10, 200, 10))
+        self.assertEqual(len(red), len(green))
+        self.assertEqual(self.create_item(red, HTTP_IDEMPOTENCY_KEY="lamp-1").status_code, 200)
+        replayed = self.create_item(red, HTTP_IDEMPOTENCY_KEY="lamp-1")
+        self.assertEqual(replayed["Idempotent-Replayed"], "true")
+        self.assertEqual(self.create_item(green, HTTP_IDEMPOTENCY_KEY="lamp-1").status_code, 422)
+        self.assertEqual(Item.objects.count(), 1)
+
+    def test_not_an_image_refused(self):
+        response = self.create_item(b"#!/bin/sh\necho not an image\n", "evil.png")
+        self.assertEqual(response.status_code, 415)
+        self.assertFalse(Item.objects.exists())
+        self.assertEqual(os.listdir(get_temp_dir()), [])
+
+    @override_settings(IMAGE_UPLOAD_MAX_SIZE=1024)
+    def test_oversized_image_refused(self):
+        #the body is under UPLOAD_MAX_BODY_SIZE so the limit trips while streaming
+        response = self.create_item(make_png() + b"\x00" * 2048)
+        self.assertEqual(response.status_code, 413)
+        self.assertFalse(Item.objects.exists())
+        self.assertEqual(os.listdir(get_temp_dir()), [])
+
+    @override_settings(IMAGE_UPLOAD_MAX_SIZE=100 * 1024)
+    def test_limit_is_per_image(self):
+        '''
+        an image and a thumbnail each under the limit pass, together they are over it
+        '''
+        padding = b"\x00" * 90 * 1024
+        response = self.client.post("/api/v1/item-create/", encode_multipart(BOUNDARY, {
+            "title": "Lamp", "description": "A lamp", "stock": 3, "price": 100,
+            "image": SimpleUploadedFile("a.png", make_png() + padding),
+            "thumbnail": SimpleUploadedFile("b.png", make_png((10, 10)) + padding),
+        }), content_type=MULTIPART_CONTENT)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(Item.objects.get(title="Lamp").image.name.endswith(".png"))
+
+    @override_settings(UPLOAD_MAX_BODY_SIZE=64 * 1024)
+    def test_oversized_body_refused_before_reading(self):
+        response = self.create_item(make_png() + b"\x00" * 128 * 1024)
+        self.assertEqual(response.status_code, 413)
+        self.assertFalse(Item.objects.exists())
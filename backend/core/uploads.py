@@ -0,0 +1,142 @@
+"""
+Streaming image uploads
+
+`StreamingImageUploadHandler` takes over the image fields of a multipart
+body: each chunk is hashed and written straight to a temp file inside
+`MEDIA_ROOT`, so `ContentAddressedStorage` only renames it into place
+(same filesystem, no copy and no second hashing pass) and a worker holds
+one chunk in memory whatever the file size. The file type is sniffed from
+the first bytes and gives the stored name its extension, each image's size
+is checked as its chunks arrive and a body whose `Content-Length` is over
+`UPLOAD_MAX_BODY_SIZE` is refused before any of it is read.
+Views opt in with `StreamingUploadMixin`.
+"""
+import os
+import tempfile
+from hashlib import sha256
+
+from django.conf import settings
+from django.core.files.uploadedfile import TemporaryUploadedFile, UploadedFile
+from django.core.files.uploadhandler import FileUploadHandler, StopFutureHandlers
+from rest_framework.exceptions import APIException, UnsupportedMediaType
+from rest_framework.status import HTTP_413_REQUEST_ENTITY_TOO_LARGE
+
+IMAGE_FIELDS = ("image", "thumbnail")
+#magic bytes -> type, the client's content type isn't trusted
+SIGNATURES = (
+    (b"\xff\xd8\xff", "image/jpeg"),
+    (b"\x89PNG\r\n\x1a\n", "image/png"),
+    (b"GIF87a", "image/gif"),
+    (b"GIF89a", "image/gif"),
+)
+EXTENSIONS = {"image/jpeg": ".jpg", "image/png": ".png", "image/gif": ".gif", "image/webp": ".webp"}
+
+
+class RequestEntityTooLarge(APIException):
+    status_code = HTTP_413_REQUEST_ENTITY_TOO_LARGE
+    default_detail = "The upload is too large"
+    default_code = "too_large"
+
+
+def get_max_size() -> int:
+    return getattr(settings, "IMAGE_UPLOAD_MAX_SIZE", 10 * 1024 * 1024)
+
+
+def get_max_body_size() -> int:
+    return getattr(settings, "UPLOAD_MAX_BODY_SIZE", 32 * 1024 * 1024)
+
+
+def get_temp_dir() -> str:
+    #inside MEDIA_ROOT so storing the upload is a rename
+    path = os.path.join(settings.MEDIA_ROOT, "tmp")
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
+def sniff(head:bytes) -> str:
+    if head[:4] == b"RIFF" and head[8:12] == b"WEBP":
+        return "image/webp"
+    for signature, content_type in SIGNATURES:
+        if head.startswith(signature):
+            return content_type
+    return None
+
+
+class HashedUpload(TemporaryUploadedFile):
+    """
+    An upload already written to disk with the sha256 of its bytes in `digest`
+    """
+
+    def __init__(self, name, content_type, charset, content_type_extra=None) -> None:
+        _, ext = os.path.splitext(name)
+        file = tempfile.NamedTemporaryFile(suffix=".upload" + ext, dir=get_temp_dir())
+        UploadedFile.__init__(self, file, name, content_type, 0, charset, content_type_extra)
+        self.digest = None
+
+
+class StreamingImageUploadHandler(FileUploadHandler):
+    """
+    Handles the `IMAGE_FIELDS` files of a request, other files go on to the default handlers
+    """
+    chunk_size = 256 * 1024
+
+    def handle_raw_input(self, input_data, META, content_length, boundary, encoding=None):
+        if content_length and content_length > get_max_body_size():
+            raise RequestEntityTooLarge(f"Requests are limited to {get_max_body_size() // 1024} KB")
+        return None
+
+    def new_file(self, field_name, file_name, content_type, content_length, charset=None, content_type_extra=None):
+        super().new_file(field_name, file_name, content_type, content_length, charset, content_type_extra)
+        self.upload = None
+        if field_name not in IMAGE_FIELDS:
+            return
+        self.upload = HashedUpload(file_name, content_type, charset, content_type_extra)
+        self.hash = sha256()
+        self.size = 0
+        raise StopFutureHandlers()
+
+    def receive_data_chunk(self, raw_data, start):
+        if self.upload is None:
+            return raw_data
+        if start == 0:
+            content_type = sniff(raw_data[:16])
+            if content_type is None:
+                self.upload.close()
+                raise UnsupportedMediaType(self.content_type, detail="Images must be JPEG, PNG, GIF or WebP")
+            self.upload.content_type = content_type
+            #stored names keep this extension, not the one the client sent
+            self.upload.name = os.path.splitext(self.upload.name)[0] + EXTENSIONS[content_type]
+        self.size += len(raw_data)
+        if self.size > get_max_size():
+            self.upload.close()
+            raise RequestEntityTooLarge(f"Images are limited to {get_max_size() // 1024} KB")
+        self.hash.update(raw_data)
+        self.upload.write(raw_data)
+        return None
+
+    def file_complete(self, file_size):
+        if self.upload is None:
+            return None
+        self.upload.seek(0)
+        self.upload.size = file_size
+        self.upload.digest = self.hash.hexdigest()
+        return self.upload
+
+    def upload_interrupted(self):
+        if getattr(self, "upload", None) is not None:
+            self.upload.close()
+
+
+class StreamingUploadMixin:
+    """
+    Parses multipart bodies of `streaming_upload_actions` (all methods of a
+    plain APIView) with `StreamingImageUploadHandler` ahead of the defaults
+    """
+    streaming_upload_actions = ("create", "update", "partial_update")
+
+    def initialize_request(self, request, *args, **kwargs):
+        drf_request = super().initialize_request(request, *args, **kwargs)
+        action = getattr(self, "action", None)
+        if action is None or action in self.streaming_upload_actions:
+            request.upload_handlers.insert(0, StreamingImageUploadHandler(request))
+        return drf_request
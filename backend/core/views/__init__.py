@@ -6,6 +6,7 @@ from .customer_views import (
     CustomerRetrieveView, CustomerUpdateAPIView
 )
 from .employee_views import EmployeerAPIView
+from .media_views import serve_media
 
 
 __all__ = (
@@ -18,4 +19,5 @@ __all__ = (
     "CustomerRetrieveView",
     "CustomerUpdateAPIView",
     "EmployeerAPIView",
+    "serve_media",
 )
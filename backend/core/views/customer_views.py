@@ -20,6 +20,7 @@ from core.serializers import (
 )
 from core.models import CustomerProfile
 from core.tasks import send_activation_email
+from core.uploads import StreamingUploadMixin
 from utils.pagination import StandardResultsSetPagination
 
 
@@ -53,7 +54,7 @@ class CustomerRegisterAPIView(APIView):
         return Response(serializer.errors, HTTP_400_BAD_REQUEST)
 
 
-class CustomerUpdateAPIView(APIView):#testing between using APIVIEW or genericviewset
+class CustomerUpdateAPIView(StreamingUploadMixin, APIView):#testing between using APIVIEW or genericviewset
     """
     Customer Update/Get Profile Details  View 
     """
@@ -14,9 +14,10 @@ from core.serializers import (
     EmployeeUpdateSerializer
 )
 from core.tasks import send_update_notification
+from core.uploads import StreamingUploadMixin
 
 
-class EmployeerAPIView(APIView):
+class EmployeerAPIView(StreamingUploadMixin, APIView):
     """
     User Registration View to register new users
     """
@@ -0,0 +1,173 @@
+"""
+Media serving
+
+`serve_media` checks the request in Django (path, permissions, conditional
+headers) and then, with `MEDIA_ACCEL` set, hands the transfer to the front
+proxy so workers never read the file:
+
+    "x-accel-redirect" (nginx) redirects to `MEDIA_ACCEL_PREFIX` + path,
+    an internal location aliased to MEDIA_ROOT:
+
+        location /protected-media/ { internal; alias /app/backend/media/; }
+
+    "x-sendfile" (apache mod_xsendfile, lighttpd) names the file on disk
+
+Without it the file is streamed from Django, honouring a single byte range.
+Content addressed uploads get their hash as a strong ETag and are cached
+for a year as immutable, other files for `MEDIA_MAX_AGE`.
+"""
+import mimetypes
+import os
+import posixpath
+import re
+from urllib.parse import quote
+
+from django.conf import settings
+from django.http import FileResponse, Http404, HttpResponse, StreamingHttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
+
+from core.storage import is_content_addressed
+
+IMMUTABLE = "public, max-age=31536000, immutable"
+RANGE_RE = re.compile(r"^bytes=(\d*)-(\d*)$")
+CHUNK_SIZE = 64 * 1024
+ACCEL_HEADERS = {"x-accel-redirect": "X-Accel-Redirect", "x-sendfile": "X-Sendfile"}
+
+
+def get_accel() -> str:
+    return getattr(settings, "MEDIA_ACCEL", None)
+
+
+def get_max_age() -> int:
+    return getattr(settings, "MEDIA_MAX_AGE", 60 * 60)
+
+
+def get_public_dirs() -> tuple:
+    return getattr(settings, "MEDIA_PUBLIC_DIRS", ("item_images", "item_thumbnails", "profile_pics", "variants"))
+
+
+def is_public(path:str) -> bool:
+    '''
+    uploads listed in `MEDIA_PUBLIC_DIRS` and top level files (field defaults)
+    '''
+    return "/" not in path or path.split("/", 1)[0] in get_public_dirs()
+
+
+def has_permission(request, path:str) -> bool:
+    '''
+    anyone may fetch public media, the rest of MEDIA_ROOT is staff only
+    '''
+    return is_public(path) or request.user.is_staff
+
+
+def resolve(path:str) -> str:
+    '''
+    Filesystem path of a normalized media `path`. raises Http404 for anything
+    outside MEDIA_ROOT, uploads still being received and missing files
+    '''
+    if path.startswith("..") or path in ("", ".") or path.split("/", 1)[0] == "tmp":
+        raise Http404("Not found")
+    full = os.path.join(settings.MEDIA_ROOT, *path.split("/"))
+    if not os.path.isfile(full):
+        raise Http404("Not found")
+    return full
+
+
+def get_etag(path:str, stat:os.stat_result) -> str:
+    if is_content_addressed(path):
+        #the name is the sha256 of the bytes
+        return f'"{posixpath.splitext(posixpath.basename(path))[0]}"'
+    return f'"{stat.st_ino:x}-{stat.st_mtime_ns:x}-{stat.st_size:x}"'
+
+
+def get_range(request, etag:str, last_modified:str, size:int):
+    '''
+    `(start, end)` inclusive of a single `Range: bytes=` request, None to send
+    the whole file (no or several ranges, stale `If-Range`).
+    raises ValueError when the range can't be satisfied
+    '''
+    header = request.headers.get("Range", "")
+    match = RANGE_RE.match(header.replace(" ", ""))
+    if match is None or match.groups() == ("", ""):
+        return None
+    if_range = request.headers.get("If-Range")
+    if if_range is not None and if_range not in (etag, last_modified):
+        return None
+    first, last = match.groups()
+    if first == "":
+        #`bytes=-500` is the last 500 bytes
+        start, end = max(size - int(last), 0), size - 1
+    else:
+        start, end = int(first), min(int(last), size - 1) if last else size - 1
+    if start >= size or start > end:
+        raise ValueError(header)
+    return start, end
+
+
+def read_range(full:str, start:int, length:int):
+    with open(full, "rb") as file:
+        file.seek(start)
+        while length > 0:
+            chunk = file.read(min(CHUNK_SIZE, length))
+            if not chunk:
+                break
+            length -= len(chunk)
+            yield chunk
+
+
+def serve_media(request, path):
+    '''
+    Serves a file under MEDIA_URL after the permission and conditional
+    checks, through the front proxy when `MEDIA_ACCEL` is set
+    '''
+    path = posixpath.normpath(path).lstrip("/")
+    if not has_permission(request, path):
+        #no hint that the file exists
+        raise Http404("Not found")
+    full = resolve(path)
+    stat = os.stat(full)
+    etag, last_modified = get_etag(path, stat), http_date(stat.st_mtime)
+    headers = HttpResponse()
+    headers["ETag"] = etag
+    headers["Last-Modified"] = last_modified
+    headers["Accept-Ranges"] = "bytes"
+    if not is_public(path):
+        headers["Cache-Control"] = "private, no-cache"
+    elif is_content_addressed(path):
+        headers["Cache-Control"] = IMMUTABLE
+    else:
+        headers["Cache-Control"] = f"public, max-age={get_max_age()}"
+    conditional = get_conditional_response(request, etag=etag, last_modified=int(stat.st_mtime), response=headers)
+    if conditional is not headers:
+        #304 or 412, nothing to send
+        return conditional
+
+    content_type = mimetypes.guess_type(full)[0] or "application/octet-stream"
+    accel = get_accel()
+    if accel:
+        #the proxy sends the bytes and handles ranges itself
+        response = HttpResponse(content_type=content_type)
+        if accel == "x-accel-redirect":
+            response[ACCEL_HEADERS[accel]] = quote(getattr(settings, "MEDIA_ACCEL_PREFIX", "/protected-media/") + path)
+        else:
+            response[ACCEL_HEADERS[accel]] = full
+    else:
+        try:
+            byte_range = get_range(request, etag, last_modified, stat.st_size)
+        except ValueError:
+            response = HttpResponse(status=416)
+            response["Content-Range"] = f"bytes */{stat.st_size}"
+            return response
+        if byte_range is None:
+            response = FileResponse(open(full, "rb"), content_type=content_type)
+        else:
+            start, end = byte_range
+            response = StreamingHttpResponse(read_range(full, start, end - start + 1), status=206,
+                                             content_type=content_type)
+            response["Content-Range"] = f"bytes {start}-{end}/{stat.st_size}"
+            response["Content-Length"] = str(end - start + 1)
+    for header, value in headers.items():
+        if header != "Content-Type":
+            response[header] = value
+    return response
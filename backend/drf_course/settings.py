@@ -129,6 +129,27 @@ CACHES = {
         "LOCATION":"my_cache_table",
     }
 }
+RESPONSE_CACHE_TIMEOUT = 60 * 15#seconds. cached item responses are invalidated by version bumps anyway
+RESPONSE_CACHE_STATS_INTERVAL = 10#seconds hit/miss counts stay in process before being added to the shared counters
+IDEMPOTENCY_KEY_TTL = 60 * 60 * 24#seconds a replayed Idempotency-Key returns the stored response
+IDEMPOTENCY_LOCK_TIMEOUT = 10#seconds a duplicate in flight waits for the first request
+STOCK_HOLD_TTL = 60 * 15#seconds stock stays held for a buyer's checkout
+STOCK_SHARDS = 8#counters a hot item's stock is spread over when sharded
+STOCK_SHARD_CACHE_TIMEOUT = 2#seconds a summed sharded stock is reused
+#responsive image variants, widths per kind of upload (aspect ratio kept, never upscaled)
+IMAGE_VARIANTS = {
+    "item": (320, 640, 960, 1600),
+    "thumbnail": (125, 250),
+    "profile": (64, 150, 300),
+}
+IMAGE_VARIANT_FORMATS = ("webp", "jpeg")#preferred first, the last is the fallback
+IMAGE_VARIANT_QUALITY = 80
+IMAGE_WORKERS = None#processes the process_images command renders with, None for one per core
+MEDIA_BLOB_GRACE = 60 * 10#seconds an unreferenced upload is kept, in case the same bytes are being uploaded again
+MEDIA_GC_GRACE = 60 * 60 * 24#seconds a file must be unreferenced and untouched before the media sweep deletes it
+MEDIA_GC_DIRS = ("item_images", "item_thumbnails", "profile_pics", "variants")#MEDIA_ROOT directories the sweep walks
+IMAGE_UPLOAD_MAX_SIZE = 10 * 1024 * 1024#bytes per image, larger uploads are refused while streaming
+UPLOAD_MAX_BODY_SIZE = 32 * 1024 * 1024#bytes per multipart request with images, refused before reading
 
 # Email Settings (Development)
 EMAIL_BACKEND = 'django.core.mail.backends.console.EmailBackend'
@@ -183,6 +204,11 @@ STATICFILES_FINDERS = [
 #media files settings
 MEDIA_URL = "/media/"
 MEDIA_ROOT = os.path.join(BASE_DIR, "media")
+#"x-accel-redirect" (nginx) or "x-sendfile" (apache, lighttpd) hands media transfers to the proxy, unset streams them from Django
+MEDIA_ACCEL = os.environ.get("MEDIA_ACCEL") or None
+MEDIA_ACCEL_PREFIX = "/protected-media/"#internal nginx location aliased to MEDIA_ROOT
+MEDIA_MAX_AGE = 60 * 60#seconds media that may change (variants, legacy names) is cached, content addressed uploads are immutable
+MEDIA_PUBLIC_DIRS = ("item_images", "item_thumbnails", "profile_pics", "variants")#anything else under MEDIA_ROOT is staff only
 
 # Default primary key field type
 # https://docs.djangoproject.com/en/4.1/ref/settings/#default-auto-field
@@ -204,6 +230,20 @@ CELERY_TIMEZONE = "Africa/Lagos"
 #CELERY_RESULT_SERIALIZER = "json"
 #CELERY_TASK_SERIALIZER = "json"
 CELERY_CACHE_BACKEND = "default"#the apps cache default settings
+CELERY_BEAT_SCHEDULE = {
+    "release-expired-stock-holds": {
+        "task": "release expired stock holds",
+        "schedule": 60.0,#seconds
+    },
+    "sync-sharded-stock": {
+        "task": "sync sharded stock",
+        "schedule": 30.0,
+    },
+    "sweep-orphaned-media": {
+        "task": "sweep orphaned media",
+        "schedule": 60.0 * 60 * 24,
+    },
+}
 
 
 #rest framework settings
@@ -237,7 +277,7 @@ REST_FRAMEWORK = {
     },
     'DEFAULT_METADATA_CLASS': 'rest_framework_json_api.metadata.JSONAPIMetadata',
     'DEFAULT_FILTER_BACKENDS': (
-        'django_filters.rest_framework.DjangoFilterBackend',
+        'rest_framework_json_api.django_filters.DjangoFilterBackend',#filter[field] style params
         'rest_framework_json_api.filters.QueryParameterValidationFilter',
         'rest_framework_json_api.filters.OrderingFilter',
         'rest_framework.filters.SearchFilter',
@@ -14,7 +14,7 @@ Including another URLconf
     2. Add a URL to urlpatterns:  path('blog/', include('blog.urls'))
 """
 from django.contrib import admin
-from django.urls import path, include
+from django.urls import path, re_path, include
 from django.conf.urls.static import static
 from django.conf import settings
 from rest_framework import routers
@@ -28,7 +28,11 @@ from ecommerce import views as ecommerce_views
 router = routers.DefaultRouter()
 # registering routes instead of using urlpatterns mainly for viewsets
 router.register(r'item', ecommerce_views.ItemViewSet, basename='item')
+router.register(r'item-create', ecommerce_views.ItemCreateViewSet, basename='item-create')
 router.register(r'order', ecommerce_views.OrderViewSet, basename='order')
+router.register(r'vendor-stats', ecommerce_views.VendorStatsViewSet, basename='vendor-stats')
+router.register(r'export', ecommerce_views.ExportViewSet, basename='export')
+router.register(r'hold', ecommerce_views.StockHoldViewSet, basename='hold')
 
 #urlpatterns += router.urls #to add a good prefix to the url i decided to add with include to urlpattern
 
@@ -41,4 +45,6 @@ urlpatterns = [
     path('redoc/', SpectacularRedocView.as_view(url_name='schema'), name='swagger-redoc-ui'),
     #path('api-auth/', include('rest_framework.urls', namespace="rest_framework"))
     path("api-token-auth/", obtain_auth_token), # gives us access to token auth
-] + static(settings.STATIC_URL,document_root=settings.STATIC_ROOT) + static(settings.MEDIA_URL,document_root=settings.MEDIA_ROOT)
+    #permission checked here, bytes sent by the front proxy when MEDIA_ACCEL is set
+    re_path(rf"^{settings.MEDIA_URL.lstrip('/')}(?P<path>.+)$", core_views.serve_media, name="media"),
+] + static(settings.STATIC_URL,document_root=settings.STATIC_ROOT)#only in DEBUG, the proxy serves STATIC_ROOT
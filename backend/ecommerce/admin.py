@@ -1,7 +1,11 @@
 from django.contrib import admin
 from django.contrib.auth.models import User
 
-from .models import Order, Item, Color, Category, OrderItem, Currency
+from . import shards
+from .models import (
+    Order, Item, Color, Category, OrderItem, Currency, CategorySpecKey, OrderStatusHistory, SalesDaily, StockHold,
+    ReconciliationRun, ReconciliationMismatch,
+)
 
 #inlines here
 class ItemInline(admin.StackedInline):
@@ -18,6 +22,29 @@ class CategoryInline(admin.TabularInline):
     model = Category
     extra = 1
 
+class CategorySpecKeyInline(admin.TabularInline):
+    model = CategorySpecKey
+    extra = 1
+
+class ReconciliationMismatchInline(admin.TabularInline):
+    model = ReconciliationMismatch
+    extra = 0
+    can_delete = False
+    readonly_fields = ("transaction", "kind", "amount", "order_total", "orders")
+
+    def has_add_permission(self, request, obj=None):
+        return False#written by ecommerce.reconcile
+
+
+class OrderStatusHistoryInline(admin.TabularInline):
+    model = OrderStatusHistory
+    extra = 0
+    can_delete = False
+    readonly_fields = ("from_status", "to_status", "changed_by", "created")
+
+    def has_add_permission(self, request, obj=None):
+        return False#append only, written by Order.transition
+
 class OrderItemInline(admin.TabularInline):
     model = OrderItem
     inlines = [OrderInline, ItemInline]
@@ -34,6 +61,30 @@ class ItemAdmin(admin.ModelAdmin):
     prepopulated_fields = {'slug': ('title',)}
     ordering = ["-created", 'title', ]
     inlines = [ OrderItemInline]
+    actions = ["shard_stock", "unshard_stock"]
+
+    @admin.action(description="Spread stock over sharded counters (hot items)")
+    def shard_stock(self, request, queryset):
+        changed = sum(shards.enable(pk) for pk in queryset.values_list("id", flat=True))
+        self.message_user(request, f"{changed} item(s) sharded")
+
+    @admin.action(description="Fold sharded stock back into the item")
+    def unshard_stock(self, request, queryset):
+        changed = sum(shards.disable(pk) for pk in queryset.values_list("id", flat=True))
+        self.message_user(request, f"{changed} item(s) unsharded")
+
+
+def transition_action(status):
+    '''
+    admin action moving the selected orders to `status` in batched updates
+    '''
+    def move(modeladmin, request, queryset):
+        result = Order.transition(queryset.values_list("id", flat=True), status, user=request.user)
+        modeladmin.message_user(request, f"{result['updated']} order(s) marked {status}, "
+                                         f"{len(result['skipped'])} skipped by their current status")
+    move.__name__ = f"mark_{status}"
+    move.short_description = f"Mark selected orders as {status}"
+    return move
 
 
 @admin.register(Order)
@@ -42,7 +93,8 @@ class OrderAdmin(admin.ModelAdmin):
     list_filter = ("created","status","user")
     search_fields = ("title", "status", "id")
     ordering = ['-created',"status", ]
-    inlines = [OrderItemInline]
+    inlines = [OrderItemInline, OrderStatusHistoryInline]
+    actions = [transition_action(status) for status in Order.TRANSITIONS]
 
 
 @admin.register(Color)
@@ -68,7 +120,7 @@ class CategoryAdmin(admin.ModelAdmin):
     search_fields = ("name",)
     prepopulated_fields = {'slug': ('name',)}
     ordering = ['name', ]
-    inlines = [ItemInline, CategoryInline]
+    inlines = [CategorySpecKeyInline, ItemInline, CategoryInline]
 
 
 @admin.register(OrderItem)
@@ -77,3 +129,27 @@ class OrderItemAdmin(admin.ModelAdmin):
     list_filter = ("order","item")
     search_fields = ("order",)
     ordering = ['order', ]
+
+
+@admin.register(SalesDaily)
+class SalesDailyAdmin(admin.ModelAdmin):
+    list_display = ('day', 'vendor', 'item', 'orders', 'units', 'revenue')
+    list_filter = ("day",)
+    search_fields = ("item__title", "vendor__username")
+    ordering = ['-day', ]
+
+
+@admin.register(StockHold)
+class StockHoldAdmin(admin.ModelAdmin):
+    list_display = ('item', 'user', 'quantity', 'expires_at')
+    search_fields = ("item__title", "user__username")
+    ordering = ['expires_at', ]
+    readonly_fields = ('item', 'user', 'quantity')
+
+
+@admin.register(ReconciliationRun)
+class ReconciliationRunAdmin(admin.ModelAdmin):
+    list_display = ('started', 'finished', 'checked', 'mismatched')
+    readonly_fields = ('started', 'finished', 'checked', 'mismatched')
+    ordering = ['-started', ]
+    inlines = [ReconciliationMismatchInline]
@@ -0,0 +1,176 @@
+"""
+Facet counts for the item listing
+
+A bitmap per facet value (one bit per item) is built from a handful of
+queries, shared through the cache and rebuilt only when a facet changes:
+the index is keyed on its own `ecommerce.item_facets` version, bumped when
+an item is added or removed or its category, currency, price bucket or
+colors change (`item_saved`, `bump`), not on every item write like stock
+updates.
+Counting a facet under the current filters is then a popcount of
+`facet_bitmap & filtered_bitmap` instead of a GROUP BY per facet. A
+category filter is itself resolved from the bitmaps, other filters
+stream the matching ids.
+"""
+from functools import partial
+from threading import Lock
+
+from django.core.cache import cache
+from django.db import transaction
+
+from .models import Item, Category, Color, Currency
+from utils.caching import bump_version, get_versions
+
+FACETS = ("category", "color", "currency", "price")
+PRICE_BUCKETS = (0, 1000, 5000, 10000, 50000)#in pence, lower bounds
+FACET_VERSION = "ecommerce.item_facets"
+INDEX_MODELS = (FACET_VERSION, Category, Color, Currency)
+INDEX_TIMEOUT = 60 * 60 * 24#old versions just age out
+FACET_FIELDS = ("category_id", "currency_id", "price")
+
+_local = {"versions": None, "index": None}
+_lock = Lock()
+
+
+def price_bucket(price:int) -> str:
+    lower = PRICE_BUCKETS[0]
+    for bound in PRICE_BUCKETS[1:]:
+        if price < bound:
+            return f"{lower}-{bound - 1}"
+        lower = bound
+    return f"{lower}+"
+
+
+def _to_bitmap(positions, size:int) -> int:
+    bits = bytearray(size // 8 + 1)
+    for position in positions:
+        bits[position >> 3] |= 1 << (position & 7)
+    return int.from_bytes(bits, "little")
+
+
+class FacetIndex:
+    """
+    positions: item pk -> bit position
+    bitmaps: facet -> value -> bitmap of items having it
+    labels: facet -> value -> display name
+    """
+
+    def __init__(self, positions:dict, bitmaps:dict, labels:dict) -> None:
+        self.positions = positions
+        self.bitmaps = bitmaps
+        self.labels = labels
+
+    @classmethod
+    def build(cls) -> "FacetIndex":
+        rows = list(Item.objects.order_by().values_list("id", "category_id", "currency_id", "price"))
+        positions = {pk: position for position, (pk, *_) in enumerate(rows)}
+        members = {facet: {} for facet in FACETS}
+        for position, (_, category, currency, price) in enumerate(rows):
+            if category is not None:
+                members["category"].setdefault(category, []).append(position)
+            if currency is not None:
+                members["currency"].setdefault(currency, []).append(position)
+            members["price"].setdefault(price_bucket(price), []).append(position)
+        for item_id, color in Item.colors.through.objects.values_list("item_id", "color_id"):
+            #an item added between the two reads is left to the next version
+            if item_id in positions:
+                members["color"].setdefault(color, []).append(positions[item_id])
+
+        size = len(rows)
+        bitmaps = {facet: {value: _to_bitmap(found, size) for value, found in values.items()}
+                   for facet, values in members.items()}
+        labels = {
+            "category": dict(Category.objects.values_list("id", "name")),
+            "color": dict(Color.objects.values_list("id", "name")),
+            "currency": dict(Currency.objects.values_list("id", "name")),
+            "price": {value: value for value in bitmaps["price"]},
+        }
+        return cls(positions, bitmaps, labels)
+
+    def filter_bitmap(self, item_ids) -> int:
+        return _to_bitmap((self.positions[pk] for pk in item_ids if pk in self.positions), len(self.positions))
+
+    def categories_bitmap(self, category_ids) -> int:
+        bitmap = 0
+        for category in category_ids:
+            bitmap |= self.bitmaps["category"].get(category, 0)
+        return bitmap
+
+    def counts(self, facets, filtered:int=None) -> dict:
+        '''
+        `{facet: [{"id", "name", "count"}, ...]}` largest count first.
+        `filtered` is the bitmap of items matching the current filters, None for all
+        '''
+        result = {}
+        for facet in facets:
+            values = []
+            for value, bitmap in self.bitmaps[facet].items():
+                count = (bitmap & filtered).bit_count() if filtered is not None else bitmap.bit_count()
+                if count:
+                    values.append({"id": value, "name": self.labels[facet].get(value), "count": count})
+            result[facet] = sorted(values, key=lambda entry: -entry["count"])
+        return result
+
+
+def bump() -> None:
+    #after the commit, a rebuild in between would cache the old rows
+    transaction.on_commit(partial(bump_version, FACET_VERSION))
+
+
+def _facet_values(instance:Item) -> tuple:
+    '''
+    loaded facet fields, None for a deferred one
+    '''
+    values = instance.__dict__
+    if any(field not in values for field in FACET_FIELDS):
+        return None
+    return values["category_id"], values["currency_id"], price_bucket(values["price"] or 0)
+
+
+def remember(sender, instance, **kwargs) -> None:
+    instance._facet_values = _facet_values(instance)
+
+
+def item_saved(sender, instance, created, raw=False, **kwargs) -> None:
+    current = _facet_values(instance)
+    #unknown before (deferred) or after counts as a change
+    if created or current is None or current != getattr(instance, "_facet_values", None):
+        bump()
+    instance._facet_values = current
+
+
+def get_facet_index() -> FacetIndex:
+    '''
+    process memo -> shared cache -> rebuild, all keyed on the facet versions
+    '''
+    versions = tuple(get_versions(INDEX_MODELS))
+    if _local["versions"] == versions:
+        return _local["index"]
+    with _lock:
+        if _local["versions"] == versions:
+            return _local["index"]
+        key = "facet_index:" + ".".join(str(version) for version in versions)
+        index = cache.get(key)
+        if index is None:
+            index = FacetIndex.build()
+            cache.set(key, index, timeout=INDEX_TIMEOUT)
+        _local["versions"], _local["index"] = versions, index
+    return index
+
+
+def facet_counts(queryset, facets, filters:dict=None) -> dict:
+    '''
+    facet counts over `queryset`, the listing filtered by `filters`
+    (`{name: value}` of the `filter[...]` params). Unfiltered, the whole
+    index is counted without touching the database, a category filter
+    only looks up the category subtree
+    '''
+    index = get_facet_index()
+    bitmap = None
+    if filters and set(filters) == {"category"}:
+        path = Category.objects.filter(pk=filters["category"]).values_list("path", flat=True).first()
+        subtree = Category.objects.filter(**Category.subtree_lookup(path)).values_list("id", flat=True) if path else []
+        bitmap = index.categories_bitmap(subtree)
+    elif filters:
+        bitmap = index.filter_bitmap(queryset.order_by().values_list("id", flat=True).iterator(chunk_size=5000))
+    return index.counts(facets, bitmap)
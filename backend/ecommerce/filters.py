@@ -0,0 +1,39 @@
+from django_filters.rest_framework import FilterSet, NumberFilter, CharFilter
+from rest_framework.exceptions import ValidationError
+
+from .models import Item, Category
+from .specs import parse_conditions, filter_items
+
+
+class ItemFilter(FilterSet):
+    """
+    Filters for the item listing
+    used as `filter[<name>]` through the json:api filter backend
+    """
+    category = NumberFilter(method="filter_category_subtree")
+    spec = CharFilter(method="filter_specifications")
+
+    def filter_category_subtree(self, queryset, name, value):
+        '''
+        items in the category and every category below it
+        resolved through the materialized path index
+        '''
+        path = Category.objects.filter(pk=value).values_list("path", flat=True).first()
+        if path is None:
+            return queryset.none()
+        subtree = Category.subtree_lookup(path)
+        return queryset.filter(**{f"category__{lookup}": value for lookup, value in subtree.items()})
+
+    def filter_specifications(self, queryset, name, value):
+        '''
+        `filter[spec]=ram:8,size:xl` or a range `filter[spec]=ram:4..16`
+        on keys declared for the item's category, through the ItemSpec indexes
+        '''
+        try:
+            return filter_items(queryset, parse_conditions(value))
+        except ValueError as error:
+            raise ValidationError({"spec": str(error)})
+
+    class Meta:
+        model = Item
+        fields = ("category", "spec")
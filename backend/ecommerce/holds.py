@@ -0,0 +1,112 @@
+"""
+Time limited stock holds between cart and payment
+
+A hold is a `StockHold` row with an expiry plus the same quantity added to
+`Item.held`, both written in one transaction. The counter is only raised
+with a conditional `UPDATE ... WHERE stock - held >= n`, so concurrent
+holds can't promise more than the stock, and reading availability is
+`stock - held` on the item row instead of summing holds.
+Holds on sharded items (see `ecommerce.shards`) also move their quantity
+off the shards while they last.
+`Order.checkout` uses up the buyer's own holds, the `release expired stock holds`
+periodic task gives expired ones back in batches.
+"""
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Case, F, Value, When
+from django.utils import timezone
+
+from .models import Item, StockHold
+from . import shards
+
+
+def get_ttl() -> timedelta:
+    return timedelta(seconds=getattr(settings, "STOCK_HOLD_TTL", 60 * 15))
+
+
+def place_hold(item_id, user, qty:int, ttl:timedelta=None):
+    '''
+    Holds `qty` of an item for `user`, None when not enough is available
+    '''
+    qty = int(qty)
+    with transaction.atomic():
+        release_expired(item_ids=[item_id])
+        count = Item.objects.filter(pk=item_id).values_list("stock_shards", flat=True).first()
+        if count:
+            #item row first, then the shards
+            if not Item.objects.filter(pk=item_id, stock_shards=count).update(held=F("held") + qty):
+                return None
+            if not shards.take(item_id, count, qty):
+                Item.objects.filter(pk=item_id).update(held=F("held") - qty)
+                return None
+        elif not Item.objects.filter(pk=item_id, stock_shards=0, stock__gte=F("held") + qty).update(held=F("held") + qty):
+            return None
+        return StockHold.objects.create(item_id=item_id, user=user, quantity=qty,
+                                        expires_at=timezone.now() + (ttl or get_ttl()))
+
+
+def _give_back(holds) -> int:
+    '''
+    deletes the locked `holds` and takes their quantities off `Item.held`
+    with one UPDATE. returns the number of holds released
+    '''
+    rows = list(holds.select_for_update().values_list("id", "item_id", "quantity"))
+    if not rows:
+        return 0
+    per_item = {}
+    for _, item_id, quantity in rows:
+        per_item[item_id] = per_item.get(item_id, 0) + quantity
+    StockHold.objects.filter(pk__in=[pk for pk, _, _ in rows]).delete()
+    released = Case(*(When(pk=pk, then=Value(qty)) for pk, qty in per_item.items()))
+    Item.objects.filter(pk__in=list(per_item)).update(held=F("held") - released)
+    #read after the item rows are locked, so sharding can't change under it
+    for item_id, count in Item.objects.filter(pk__in=list(per_item), stock_shards__gt=0).values_list("id", "stock_shards"):
+        shards.give_back(item_id, count, per_item[item_id])
+    return len(rows)
+
+
+def release(user, hold_id) -> bool:
+    with transaction.atomic():
+        return bool(_give_back(StockHold.objects.filter(pk=hold_id, user=user)))
+
+
+def release_expired(item_ids=None, batch_size:int=1000) -> int:
+    '''
+    Gives back holds past their expiry, a batch per transaction.
+    `item_ids` limits it to some items (checkout does that for its lines)
+    '''
+    total = 0
+    while True:
+        expired = StockHold.objects.filter(expires_at__lte=timezone.now())
+        if item_ids is not None:
+            expired = expired.filter(item_id__in=item_ids)
+        batch = list(expired.order_by("expires_at").values_list("id", flat=True)[:batch_size])
+        if not batch:
+            return total
+        with transaction.atomic():
+            total += _give_back(StockHold.objects.filter(pk__in=batch))
+        if len(batch) < batch_size:
+            return total
+
+
+def claim(user, item_ids) -> tuple:
+    '''
+    the user's active holds on `item_ids`, locked for the checkout using them.
+    returns `({item_id: held quantity}, [hold ids])`
+    '''
+    if user is None or not user.is_authenticated:
+        return {}, []
+    holds = StockHold.objects.select_for_update().filter(user=user, item_id__in=item_ids,
+                                                         expires_at__gt=timezone.now())
+    rows = list(holds.values_list("id", "item_id", "quantity"))
+    mine = {}
+    for _, item_id, quantity in rows:
+        mine[item_id] = mine.get(item_id, 0) + quantity
+    return mine, [pk for pk, _, _ in rows]
+
+
+def active_holds(user):
+    return StockHold.objects.filter(user=user, expires_at__gt=timezone.now()).order_by("expires_at")
+
@@ -0,0 +1,180 @@
+"""
+Streaming bulk import of items from CSV or NDJSON
+
+Rows are read lazily, validated with `ItemCreateSerializer` a batch at a time
+and written with `bulk_create` for the items and their `Item.colors.through` rows.
+Category, currency and color names are resolved from maps loaded once.
+Used by `manage.py import_items` and `POST /api/v1/item-create/import/`.
+"""
+import csv
+import json
+from uuid import uuid4
+
+from django.db import transaction
+from django.utils.text import slugify
+from rest_framework.exceptions import ValidationError
+
+from .models import Item, Category, Currency, Color
+from .serializers import ItemCreateSerializer
+from . import facets, search
+from utils.caching import bump_version
+
+FORMATS = ("csv", "ndjson")
+COLOR_SEPARATOR = "|"
+
+
+class ImportRowError(Exception):
+    pass
+
+
+def guess_format(filename:str, default:str="csv") -> str:
+    if filename.endswith((".ndjson", ".jsonl")):
+        return "ndjson"
+    if filename.endswith(".csv"):
+        return "csv"
+    return default
+
+
+def iter_rows(lines, fmt:str):
+    '''
+    yields `(line_number, row_dict or ImportRowError)` from an iterable of text lines
+    '''
+    if fmt == "csv":
+        reader = csv.DictReader(lines)
+        for row in reader:
+            #empty cells mean "use the default", not an invalid value
+            yield reader.line_num, {key: value for key, value in row.items() if key and value not in ("", None)}
+        return
+    for number, line in enumerate(lines, start=1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            row = json.loads(line)
+        except ValueError as error:
+            yield number, ImportRowError(f"invalid json: {error}")
+            continue
+        if not isinstance(row, dict):
+            yield number, ImportRowError("each line must be a json object")
+            continue
+        yield number, row
+
+
+class ItemImporter:
+    """
+    Validates and inserts rows in batches.
+    `report()` gives created/failed counts and per row errors
+    """
+    max_errors = 1000
+
+    def __init__(self, vendor=None, batch_size:int=1000) -> None:
+        self.vendor = vendor
+        self.batch_size = batch_size
+        self.created = 0
+        self.failed = 0
+        self.errors = []
+        #lookup maps, one query each for the whole import
+        self.categories = {name.lower(): pk for pk, name in Category.objects.values_list("id", "name")}
+        self.currencies = {}
+        for pk, name, symbol in Currency.objects.values_list("id", "name", "symbol"):
+            self.currencies[name.lower()] = self.currencies[symbol.lower()] = pk
+        self.colors = {name.lower(): pk for pk, name in Color.objects.values_list("id", "name")}
+
+    def add_error(self, line:int, errors) -> None:
+        self.failed += 1
+        if len(self.errors) < self.max_errors:
+            self.errors.append({"row": line, "errors": errors})
+
+    def run(self, rows) -> dict:
+        batch = []
+        for line, row in rows:
+            if isinstance(row, ImportRowError):
+                self.add_error(line, str(row))
+                continue
+            batch.append((line, row))
+            if len(batch) >= self.batch_size:
+                self.import_batch(batch)
+                batch = []
+        if batch:
+            self.import_batch(batch)
+        if self.created:
+            #bulk_create sends no signals
+            bump_version(Item)
+            facets.bump()
+        return self.report()
+
+    def resolve(self, row:dict) -> dict:
+        '''
+        maps category/currency/color names to ids, raises ImportRowError for unknown names
+        '''
+        related, errors = {"colors": []}, {}
+        for field, lookup in (("category", self.categories), ("currency", self.currencies)):
+            name = str(row.get(field) or "").strip()
+            if name:
+                if name.lower() not in lookup:
+                    errors[field] = f"unknown {field} '{name}'"
+                else:
+                    related[f"{field}_id"] = lookup[name.lower()]
+        colors = row.get("colors") or []
+        if isinstance(colors, str):
+            colors = colors.split(COLOR_SEPARATOR)
+        for name in (str(color).strip() for color in colors):
+            if not name:
+                continue
+            if name.lower() not in self.colors:
+                errors["colors"] = f"unknown color '{name}'"
+            else:
+                related["colors"].append(self.colors[name.lower()])
+        if errors:
+            raise ImportRowError(errors)
+        return related
+
+    def assign_slugs(self, items:list) -> None:
+        '''
+        precomputes slugs so AutoSlugField doesn't run a uniqueness query per row.
+        one query finds taken slugs, clashes get a suffix from the new uuid
+        '''
+        slug_length = Item._meta.get_field("slug").max_length
+        bases = [slugify(item.title)[:slug_length] or "item" for item in items]
+        taken = set(Item.objects.filter(slug__in=set(bases)).order_by().values_list("slug", flat=True))
+        for item, base in zip(items, bases):
+            slug = base
+            if slug in taken:
+                suffix = f"-{item.id.hex[:8]}"
+                slug = base[:slug_length - len(suffix)] + suffix
+            taken.add(slug)
+            item.slug = slug
+
+    def import_batch(self, batch:list) -> None:
+        serializer = ItemCreateSerializer(many=True)
+        items, item_colors = [], []
+        for line, row in batch:
+            try:
+                validated = serializer.child.run_validation(row)
+                related = self.resolve(row)
+            except ValidationError as error:
+                self.add_error(line, error.detail)
+                continue
+            except ImportRowError as error:
+                self.add_error(line, error.args[0])
+                continue
+            item = Item(id=uuid4(), vendor=self.vendor, **validated,
+                        category_id=related.get("category_id"), currency_id=related.get("currency_id"))
+            items.append(item)
+            item_colors.extend(Item.colors.through(item_id=item.id, color_id=color) for color in related["colors"])
+        if not items:
+            return
+        self.assign_slugs(items)
+        with transaction.atomic():
+            Item.objects.bulk_create(items, batch_size=self.batch_size)
+            Item.colors.through.objects.bulk_create(item_colors, batch_size=self.batch_size)
+            search.index_items((item.id, item.title, item.description) for item in items)
+        self.created += len(items)
+
+    def report(self) -> dict:
+        return {
+            "created": self.created,
+            "failed": self.failed,
+            "errors": self.errors,
+            "errors_truncated": self.failed > len(self.errors),
+        }
@@ -0,0 +1,107 @@
+import threading
+from time import perf_counter, sleep
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, OperationalError
+
+from ecommerce.models import Item, Order
+from ecommerce import shards
+from core.models import CustomUser
+
+
+def legacy_place_order(item:Item, user, qty:int):
+    '''
+    the old read-modify-write path, kept to show the oversell it allows
+    '''
+    item.refresh_from_db(fields=["stock"])
+    if not item.check_stock(qty):
+        return None
+    order = Order.objects.create(quantity=qty, user=user)
+    order.item.add(item, through_defaults={"quantity": qty})
+    item.stock = item.stock - qty
+    item.save()
+    return order
+
+
+class Command(BaseCommand):
+    help = ("Stress test of Item.place_order: threads race to buy a single item "
+            "until it sells out, then sold quantity is checked against the starting stock. "
+            "With --shards the same item is restocked and raced again with sharded stock "
+            "to compare orders/s. The benchmark rows are deleted afterwards")
+
+    def add_arguments(self, parser):
+        parser.add_argument("--threads", type=int, default=8)
+        parser.add_argument("--stock", type=int, default=500)
+        parser.add_argument("--qty", type=int, default=1, help="quantity per order")
+        parser.add_argument("--legacy", action="store_true", help="run the old read-modify-write path instead")
+        parser.add_argument("--shards", type=int, default=0, help="also run with the stock spread over this many counters")
+
+    def buyer(self, item_id, user, qty:int, legacy:bool, results:list) -> None:
+        item = Item.objects.get(pk=item_id)
+        orders = retries = 0
+        try:
+            while True:
+                try:
+                    order = legacy_place_order(item, user, qty) if legacy else item.place_order(user, qty)
+                except OperationalError:
+                    #sqlite answers "database is locked" past its busy timeout
+                    retries += 1
+                    sleep(0.001)
+                    continue
+                if order is None:
+                    break
+                orders += 1
+        finally:
+            results.append((orders, retries))
+            connection.close()
+
+    def race(self, item:Item, user, threads:int, qty:int, legacy:bool) -> tuple:
+        '''
+        buyers race until the item sells out, returns (orders, seconds, lock retries)
+        '''
+        results = []
+        workers = [threading.Thread(target=self.buyer, args=(item.pk, user, qty, legacy, results))
+                   for _ in range(threads)]
+        start = perf_counter()
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        return sum(placed for placed, _ in results), perf_counter() - start, sum(retried for _, retried in results)
+
+    def report(self, label:str, stock:int, qty:int, orders:int, elapsed:float, retries:int, left:int) -> None:
+        sold = orders * qty
+        self.stdout.write(f"{label}")
+        self.stdout.write(f"  orders placed : {orders} in {elapsed:.2f}s ({orders / elapsed:.0f} orders/s)")
+        self.stdout.write(f"  lock retries  : {retries}")
+        self.stdout.write(f"  sold {sold}, stock left {left}")
+        if sold + left != stock or sold > stock:
+            self.stdout.write(self.style.ERROR(f"  OVERSOLD: {sold + left - stock} units unaccounted for"))
+        else:
+            self.stdout.write(self.style.SUCCESS("  no oversell"))
+
+    def handle(self, *args, **options):
+        threads, stock, qty = options["threads"], options["stock"], options["qty"]
+        if min(threads, stock, qty) < 1 or options["shards"] < 0:
+            raise CommandError("--threads, --stock and --qty must be positive")
+        user = CustomUser.objects.create_user(username="order-benchmark", email="order-benchmark@example.com")
+        item = Item.objects.create(title="Order benchmark item", stock=stock, price=100)
+        self.stdout.write(f"{threads} threads, starting stock {stock}, {qty} per order")
+        try:
+            orders, elapsed, retries = self.race(item, user, threads, qty, options["legacy"])
+            item.refresh_from_db(fields=["stock"])
+            self.report("single row" + (" (legacy path)" if options["legacy"] else ""),
+                        stock, qty, orders, elapsed, retries, item.stock)
+            if options["shards"]:
+                #same hot item, restocked and spread over the counters
+                Item.objects.filter(pk=item.pk).update(stock=stock)
+                shards.enable(item.pk, options["shards"])
+                sharded = self.race(item, user, threads, qty, False)
+                left = sum(item.shards.values_list("stock", flat=True))
+                self.report(f"{options['shards']} shards", stock, qty, *sharded, left)
+                if orders:
+                    self.stdout.write(f"sharded/single row throughput: {(sharded[0] / sharded[1]) / (orders / elapsed):.2f}x")
+        finally:
+            Order.objects.filter(user=user).delete()
+            item.delete()
+            user.delete()
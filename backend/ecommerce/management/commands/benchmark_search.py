@@ -0,0 +1,44 @@
+import random
+from time import perf_counter
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from ecommerce import search
+from ecommerce.models import Item
+
+SYLLABLES = "ka lo mi ne ru ta vo xe zi pa do fu gi hu ja".split()
+
+
+class Command(BaseCommand):
+    help = ("Compares ranked full text search with the LIKE '%term%' baseline "
+            "on a synthetic catalog. The data is rolled back afterwards")
+
+    def add_arguments(self, parser):
+        parser.add_argument("--items", type=int, default=20000)
+        parser.add_argument("--queries", type=int, default=50)
+
+    def timed(self, fn, terms) -> float:
+        start = perf_counter()
+        for term in terms:
+            fn(term, limit=20)
+        return (perf_counter() - start) / len(terms) * 1000
+
+    def handle(self, *args, **options):
+        rng = random.Random(42)
+        #a few thousand distinct words so a term matches a realistic slice of the catalog
+        words = list({"".join(rng.choices(SYLLABLES, k=3)) for _ in range(5000)})
+        terms = [rng.choice(words) for _ in range(options["queries"])]
+        with transaction.atomic():
+            Item.objects.bulk_create(
+                Item(title=" ".join(rng.sample(words, 3)),
+                     description=" ".join(rng.choices(words, k=30)))
+                for _ in range(options["items"])
+            )
+            search.rebuild_index()
+            like_ms = self.timed(search.like_search_item_ids, terms)
+            fts_ms = self.timed(search.search_item_ids, terms)
+            transaction.set_rollback(True)
+        self.stdout.write(f"{options['items']} items, {len(terms)} queries")
+        self.stdout.write(f"LIKE baseline : {like_ms:8.2f} ms/query")
+        self.stdout.write(f"full text     : {fts_ms:8.2f} ms/query")
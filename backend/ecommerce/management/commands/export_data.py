@@ -0,0 +1,38 @@
+from datetime import date
+from time import perf_counter
+
+from django.core.management.base import BaseCommand, CommandError
+
+from ecommerce import exporter
+
+
+class Command(BaseCommand):
+    help = "Streams orders, order-items, transactions or items to CSV/NDJSON in constant memory"
+
+    def add_arguments(self, parser):
+        parser.add_argument("name", choices=list(exporter.EXPORTS))
+        parser.add_argument("--format", choices=exporter.FORMATS, default="csv")
+        parser.add_argument("--from", dest="start", type=date.fromisoformat, help="YYYY-MM-DD")
+        parser.add_argument("--to", dest="end", type=date.fromisoformat, help="YYYY-MM-DD")
+        parser.add_argument("--output", "-o", help="file to write, stdout by default")
+        parser.add_argument("--chunk-size", type=int, default=exporter.CHUNK_SIZE)
+
+    def handle(self, *args, **options):
+        if options["chunk_size"] < 1:
+            raise CommandError("--chunk-size must be positive")
+        start = perf_counter()
+        lines = exporter.stream(options["name"], options["format"], options["start"], options["end"],
+                                chunk_size=options["chunk_size"])
+        output = open(options["output"], "w", encoding="utf-8", newline="") if options["output"] else self.stdout
+        count = 0
+        try:
+            for line in lines:
+                output.write(line)
+                count += 1
+        finally:
+            if output is not self.stdout:
+                output.close()
+        if options["output"]:
+            rows = count - 1 if options["format"] == "csv" else count
+            self.stdout.write(self.style.SUCCESS(
+                f"Exported {rows} {options['name']} to {options['output']} in {perf_counter() - start:.2f}s"))
@@ -0,0 +1,43 @@
+import sys
+from time import perf_counter
+
+from django.core.management.base import BaseCommand, CommandError
+
+from core.models import CustomUser
+from ecommerce.importer import FORMATS, ItemImporter, guess_format, iter_rows
+
+
+class Command(BaseCommand):
+    help = "Streams items from a CSV or NDJSON file into the catalog in batches"
+
+    def add_arguments(self, parser):
+        parser.add_argument("path", help="csv/ndjson file, `-` for stdin")
+        parser.add_argument("--format", choices=FORMATS, help="defaults to the file extension")
+        parser.add_argument("--vendor", help="username the items are listed under")
+        parser.add_argument("--batch-size", type=int, default=1000)
+
+    def handle(self, *args, **options):
+        vendor = None
+        if options["vendor"]:
+            try:
+                vendor = CustomUser.objects.get(username=options["vendor"])
+            except CustomUser.DoesNotExist:
+                raise CommandError(f"vendor {options['vendor']} does not exist")
+        path = options["path"]
+        fmt = options["format"] or guess_format(path)
+        importer = ItemImporter(vendor=vendor, batch_size=options["batch_size"])
+
+        start = perf_counter()
+        if path == "-":
+            report = importer.run(iter_rows(sys.stdin, fmt))
+        else:
+            with open(path, newline="", encoding="utf-8-sig") as source:
+                report = importer.run(iter_rows(source, fmt))
+        elapsed = perf_counter() - start
+
+        for error in report["errors"]:
+            self.stderr.write(f"row {error['row']}: {error['errors']}")
+        rate = report["created"] / elapsed * 60 if elapsed else 0
+        self.stdout.write(self.style.SUCCESS(
+            f"Created {report['created']} items, {report['failed']} failed "
+            f"in {elapsed:.2f}s ({rate:.0f} rows/min)"))
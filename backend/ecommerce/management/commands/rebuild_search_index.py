@@ -0,0 +1,23 @@
+from time import perf_counter
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from ecommerce import search
+
+
+class Command(BaseCommand):
+    help = "Rebuilds the item full text search index from scratch"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=2000)
+
+    def handle(self, *args, **options):
+        if not search.is_supported():
+            self.stdout.write(self.style.WARNING("No full text index on this database backend, nothing to do"))
+            return
+        start = perf_counter()
+        with transaction.atomic():
+            total = search.rebuild_index(batch_size=options["batch_size"])
+        self.stdout.write(self.style.SUCCESS(
+            f"Indexed {total} items in {perf_counter() - start:.2f}s"))
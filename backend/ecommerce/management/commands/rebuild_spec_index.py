@@ -0,0 +1,23 @@
+from time import perf_counter
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from ecommerce import specs
+from ecommerce.models import Item
+from utils.caching import bump_version
+
+
+class Command(BaseCommand):
+    help = "Rebuilds the ItemSpec rows used by spec filters from Item.specifications"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=1000)
+
+    def handle(self, *args, **options):
+        start = perf_counter()
+        with transaction.atomic():
+            total = specs.rebuild_index(batch_size=options["batch_size"])
+        bump_version(Item)
+        self.stdout.write(self.style.SUCCESS(
+            f"Wrote {total} spec rows in {perf_counter() - start:.2f}s"))
@@ -0,0 +1,24 @@
+from time import perf_counter
+
+from django.core.management.base import BaseCommand, CommandError
+
+from ecommerce.reconcile import CHUNK_SIZE, reconcile
+
+
+class Command(BaseCommand):
+    help = ("Checks every paid transaction against the total of its orders with chunked aggregate "
+            "queries, mismatches are written to the reconciliation report tables")
+
+    def add_arguments(self, parser):
+        parser.add_argument("--chunk-size", type=int, default=CHUNK_SIZE, help="transaction ids per query")
+
+    def handle(self, *args, **options):
+        if options["chunk_size"] < 1:
+            raise CommandError("--chunk-size must be positive")
+        start = perf_counter()
+        run = reconcile(chunk_size=options["chunk_size"])
+        elapsed = perf_counter() - start
+        self.stdout.write(f"checked {run.checked} paid transactions in {elapsed:.2f}s "
+                          f"({run.checked / elapsed:.0f}/s)")
+        message = f"{run.mismatched} mismatch(es), see reconciliation run {run.pk}"
+        self.stdout.write(self.style.ERROR(message) if run.mismatched else self.style.SUCCESS(message))
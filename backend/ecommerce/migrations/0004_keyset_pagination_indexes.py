@@ -0,0 +1,32 @@
+# Generated by Django 4.1.3 on 2026-10-18 18:21
+
+from django.db import migrations, models
+import ecommerce.models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ecommerce', '0003_alter_transaction_amount'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='item',
+            name='image',
+            field=models.ImageField(default='default.jpg', upload_to=ecommerce.models.upload_image_path),
+        ),
+        migrations.AlterField(
+            model_name='item',
+            name='thumbnail',
+            field=models.ImageField(default='default.jpg', upload_to=ecommerce.models.upload_thumbnail_path),
+        ),
+        migrations.AddIndex(
+            model_name='item',
+            index=models.Index(fields=['created', 'id'], name='item_created_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['user', 'created', 'id'], name='order_user_created_id_idx'),
+        ),
+    ]
@@ -0,0 +1,41 @@
+# Generated by Django 4.1.3 on 2026-10-18 18:22
+
+from django.db import migrations, models
+
+
+def populate_category_paths(apps, schema_editor):
+    """
+    walks existing categories from the roots down and fills path/depth
+    """
+    Category = apps.get_model("ecommerce", "Category")
+    children = {}
+    for category in Category.objects.all().only("id", "parent_id"):
+        children.setdefault(category.parent_id, []).append(category)
+    pending = [(category, "/") for category in children.get(None, [])]
+    while pending:
+        category, parent_path = pending.pop()
+        category.path = f"{parent_path}{category.pk}/"
+        category.depth = category.path.count("/") - 2
+        category.save(update_fields=["path", "depth"])
+        pending.extend((child, category.path) for child in children.get(category.pk, []))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ecommerce', '0004_keyset_pagination_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='category',
+            name='depth',
+            field=models.PositiveSmallIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='category',
+            name='path',
+            field=models.CharField(db_index=True, default='', editable=False, max_length=255),
+        ),
+        migrations.RunPython(populate_category_paths, migrations.RunPython.noop),
+    ]
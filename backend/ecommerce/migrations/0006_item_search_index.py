@@ -0,0 +1,46 @@
+from django.db import migrations
+
+#kept in sync with ecommerce.search
+SQLITE_FORWARD = [
+    "CREATE VIRTUAL TABLE IF NOT EXISTS ecommerce_item_search USING fts5("
+    "item_id UNINDEXED, title, description, tokenize='unicode61 remove_diacritics 2')",
+    "INSERT INTO ecommerce_item_search (item_id, title, description) "
+    "SELECT id, title, coalesce(description, '') FROM ecommerce_item",
+]
+POSTGRES_FORWARD = [
+    "CREATE TABLE IF NOT EXISTS ecommerce_item_search (item_id uuid PRIMARY KEY "
+    "REFERENCES ecommerce_item(id) ON DELETE CASCADE DEFERRABLE INITIALLY DEFERRED, "
+    "document tsvector NOT NULL)",
+    "CREATE INDEX IF NOT EXISTS ecommerce_item_search_document_idx "
+    "ON ecommerce_item_search USING GIN (document)",
+    "INSERT INTO ecommerce_item_search (item_id, document) "
+    "SELECT id, setweight(to_tsvector('english', coalesce(title, '')), 'A') || "
+    "setweight(to_tsvector('english', coalesce(description, '')), 'B') FROM ecommerce_item",
+]
+BACKWARD = ["DROP TABLE IF EXISTS ecommerce_item_search"]
+
+
+def create_search_index(apps, schema_editor):
+    statements = {
+        "sqlite": SQLITE_FORWARD,
+        "postgresql": POSTGRES_FORWARD,
+    }.get(schema_editor.connection.vendor, [])
+    for statement in statements:
+        schema_editor.execute(statement)
+
+
+def drop_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor in ("sqlite", "postgresql"):
+        for statement in BACKWARD:
+            schema_editor.execute(statement)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ecommerce', '0005_category_materialized_path'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
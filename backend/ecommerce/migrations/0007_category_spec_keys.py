@@ -0,0 +1,49 @@
+# Generated by Django 4.1.3 on 2026-10-18 18:38
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ecommerce', '0006_item_search_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ItemSpec',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('key', models.CharField(max_length=50)),
+                ('value', models.CharField(max_length=255)),
+                ('number', models.FloatField(blank=True, null=True)),
+                ('item', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='spec_rows', to='ecommerce.item')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='CategorySpecKey',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('key', models.SlugField()),
+                ('kind', models.CharField(choices=[('text', 'Text'), ('number', 'Number')], default='text', max_length=10)),
+                ('category', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='spec_keys', to='ecommerce.category')),
+            ],
+            options={
+                'verbose_name': 'Category spec key',
+                'verbose_name_plural': 'Category spec keys',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='itemspec',
+            index=models.Index(fields=['key', 'value', 'item'], name='item_spec_value_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='itemspec',
+            index=models.Index(fields=['key', 'number', 'item'], name='item_spec_number_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='categoryspeckey',
+            constraint=models.UniqueConstraint(fields=('category', 'key'), name='category_spec_key_unique'),
+        ),
+    ]
@@ -0,0 +1,36 @@
+# Generated by Django 4.1.3 on 2026-10-18 18:42
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('ecommerce', '0007_category_spec_keys'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OrderStatusHistory',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('from_status', models.CharField(choices=[('pending', 'PENDING'), ('confirmed', 'CONFIRMED'), ('shipped', 'SHIPPED'), ('delivered', 'DELIVERED'), ('cancelled', 'CANCELLED'), ('returned', 'RETURNED'), ('refunded', 'REFUNDED')], max_length=20)),
+                ('to_status', models.CharField(choices=[('pending', 'PENDING'), ('confirmed', 'CONFIRMED'), ('shipped', 'SHIPPED'), ('delivered', 'DELIVERED'), ('cancelled', 'CANCELLED'), ('returned', 'RETURNED'), ('refunded', 'REFUNDED')], max_length=20)),
+                ('created', models.DateTimeField(auto_now_add=True)),
+                ('changed_by', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to=settings.AUTH_USER_MODEL)),
+                ('order', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='status_history', to='ecommerce.order')),
+            ],
+            options={
+                'verbose_name': 'Order status change',
+                'verbose_name_plural': 'Order status history',
+                'ordering': ['created', 'id'],
+            },
+        ),
+        migrations.AddIndex(
+            model_name='orderstatushistory',
+            index=models.Index(fields=['order', 'created'], name='order_status_history_idx'),
+        ),
+    ]
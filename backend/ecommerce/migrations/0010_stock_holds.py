@@ -0,0 +1,44 @@
+# Generated by Django 4.1.3 on 2026-10-18 18:49
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('ecommerce', '0009_sales_daily_rollups'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='item',
+            name='held',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.CreateModel(
+            name='StockHold',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('quantity', models.PositiveIntegerField()),
+                ('expires_at', models.DateTimeField()),
+                ('created', models.DateTimeField(auto_now_add=True)),
+                ('item', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='holds', to='ecommerce.item')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='stock_holds', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='stockhold',
+            index=models.Index(fields=['expires_at'], name='stock_hold_expiry_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='stockhold',
+            index=models.Index(fields=['item', 'expires_at'], name='stock_hold_item_expiry_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='stockhold',
+            index=models.Index(fields=['user', 'item'], name='stock_hold_user_item_idx'),
+        ),
+    ]
@@ -0,0 +1,46 @@
+# Generated by Django 4.1.3 on 2026-10-18 19:01
+
+import core.storage
+from django.db import migrations, models
+import ecommerce.models
+from django.db.models import Count, F
+
+
+def count_references(apps, schema_editor):
+    '''
+    adds the item images and thumbnails already stored to the blob reference counts
+    '''
+    MediaBlob = apps.get_model("core", "MediaBlob")
+    Item = apps.get_model("ecommerce", "Item")
+    refs = {}
+    for field in ("image", "thumbnail"):
+        references = Item.objects.exclude(**{field: ""}).order_by().values(field).annotate(refs=Count("id"))
+        for row in references.iterator():
+            refs[row[field]] = refs.get(row[field], 0) + row["refs"]
+    known = set(MediaBlob.objects.filter(name__in=list(refs)).values_list("name", flat=True))
+    for name in known:
+        MediaBlob.objects.filter(name=name).update(refs=F("refs") + refs[name])
+    MediaBlob.objects.bulk_create(
+        (MediaBlob(name=name, refs=count) for name, count in refs.items() if name not in known), batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ecommerce', '0012_reconciliation'),
+        ('core', '0008_media_blobs'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='item',
+            name='image',
+            field=models.ImageField(default='default.jpg', storage=core.storage.ContentAddressedStorage(), upload_to=ecommerce.models.upload_image_path),
+        ),
+        migrations.AlterField(
+            model_name='item',
+            name='thumbnail',
+            field=models.ImageField(default='default.jpg', storage=core.storage.ContentAddressedStorage(), upload_to=ecommerce.models.upload_thumbnail_path),
+        ),
+        migrations.RunPython(count_references, migrations.RunPython.noop),
+    ]
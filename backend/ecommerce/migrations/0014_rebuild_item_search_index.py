@@ -0,0 +1,40 @@
+from django.db import migrations
+
+#kept in sync with ecommerce.search
+ROWID_MASK = (1 << 63) - 1
+SQLITE_FORWARD = [
+    "DROP TABLE IF EXISTS ecommerce_item_search",
+    "CREATE VIRTUAL TABLE ecommerce_item_search USING fts5("
+    "item_id UNINDEXED, title, description, tokenize='unicode61 remove_diacritics 2')",
+]
+
+
+def rebuild_search_index(apps, schema_editor):
+    '''
+    sqlite rows written by 0006 have arbitrary rowids, the index now looks
+    them up by a rowid derived from the item uuid so it is rebuilt
+    '''
+    if schema_editor.connection.vendor != "sqlite":
+        #the postgres table is keyed on item_id already
+        return
+    for statement in SQLITE_FORWARD:
+        schema_editor.execute(statement)
+    Item = apps.get_model("ecommerce", "Item")
+    rows = [(pk.int & ROWID_MASK, pk.hex, title, description or "")
+            for pk, title, description in Item.objects.values_list("id", "title", "description").iterator()]
+    with schema_editor.connection.cursor() as cursor:
+        cursor.executemany(
+            "INSERT INTO ecommerce_item_search (rowid, item_id, title, description) VALUES (%s, %s, %s, %s)",
+            rows)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ecommerce', '0013_content_addressed_images'),
+    ]
+
+    operations = [
+        #rows keyed by uuid rowid still resolve by item_id, nothing to undo
+        migrations.RunPython(rebuild_search_index, migrations.RunPython.noop),
+    ]
@@ -1,9 +1,13 @@
 import os
-from random import randint
+from decimal import Decimal
 
-from django.db import models
+from django.db import models, transaction
+from django.db.models import F, Q, Value, Case, When
+from django.db.models.functions import Concat, Substr
 from django.conf import settings
+from django.core.exceptions import ValidationError
 from django.core.validators import MinValueValidator
+from django.utils import timezone
 #from django.contrib.auth.models import User
 from django_extensions.db.models import (
     TimeStampedModel,
@@ -14,7 +18,9 @@ from django_extensions.db.models import (
 
 #from core.models import CustomUser
 from utils.model_abstracts import Model
-from .tasks import process_item_image
+from utils.caching import bump_version
+from core.tasks import process_image_variants
+from core.storage import ContentAddressedStorage, is_upload
 
 """
 #image class for item images incases of multiple images for an item
@@ -28,20 +34,89 @@ class Category( models.Model):
     """
     `ecommerce.category`
     Stores a single category entry.
+    `path` is a materialized path of ancestor ids e.g `/1/4/9/` kept in sync on save,
+    so whole subtrees and breadcrumbs are single indexed range queries.
     """
     name = models.CharField(max_length= 255, unique=True)
     slug = AutoSlugField(populate_from='name')
     description = models.TextField(blank=True,null=True)
     parent=models.ForeignKey("self", null=True, blank=True, on_delete=models.CASCADE)#parent category
+    path = models.CharField(max_length=255, db_index=True, editable=False, default="")
+    depth = models.PositiveSmallIntegerField(default=0, editable=False)
 
     def __str__(self) -> str:
         return self.name
+
+    @staticmethod
+    def subtree_lookup(path:str) -> dict:
+        '''
+        lookup kwargs matching every path starting with `path`.
+        A prefix LIKE, not a `>=`/`<` range: locale collations (postgres
+        outside C) ignore `/` when comparing. postgres backs it with the
+        `varchar_pattern_ops` index Django adds next to the `path` index
+        '''
+        return {"path__startswith": path}
+
+    def build_path(self) -> str:
+        parent_path = self.parent.path if self.parent is not None else "/"
+        return f"{parent_path}{self.pk}/"
+
+    def save(self, *args, **kwargs) -> None:
+        '''
+        Saves and re-computes the materialized path.
+        On a move the whole subtree is re-prefixed with one UPDATE
+        '''
+        if self.parent is not None and self.pk is not None and self.parent.path.startswith(self.path or "-"):
+            raise ValidationError("A category cannot be moved under itself or its sub-categories")
+        super().save(*args, **kwargs)
+        old_path, new_path = self.path, self.build_path()
+        if old_path == new_path:
+            return
+        new_depth = new_path.count("/") - 2
+        if old_path:
+            Category.objects.filter(**Category.subtree_lookup(old_path)).update(
+                path=Concat(Value(new_path), Substr("path", len(old_path) + 1)),
+                depth=F("depth") + (new_depth - self.depth),
+            )
+        else:
+            Category.objects.filter(pk=self.pk).update(path=new_path, depth=new_depth)
+        self.path, self.depth = new_path, new_depth
+        lineage = {int(pk) for pk in f"{old_path}{new_path}".split("/") if pk}
+        if old_path and CategorySpecKey.objects.filter(category_id__in=lineage).exists():
+            #the subtree inherits spec keys from other ancestors now
+            from .specs import rebuild_index#specs imports the models
+            rebuild_index(category=self)
     
     def get_sub_categories(self):
         '''
         returns all sub-categories to current instance
         '''
-        return Category.objects.filter(parent=self).filter(active=True)
+        return Category.objects.filter(parent=self)
+
+    def get_descendants(self, include_self:bool=False):
+        '''
+        returns the whole subtree under current instance in one query
+        '''
+        queryset = Category.objects.filter(**Category.subtree_lookup(self.path))
+        if not include_self:
+            queryset = queryset.exclude(pk=self.pk)
+        return queryset
+
+    def get_ancestors(self, include_self:bool=False):
+        '''
+        returns the breadcrumb from the root down to current instance in one query
+        '''
+        ids = [int(pk) for pk in self.path.strip("/").split("/") if pk]
+        if not include_self:
+            ids = ids[:-1]
+        return Category.objects.filter(pk__in=ids).order_by("depth")
+
+    def get_items(self):
+        '''
+        returns items in current instance and all its sub-categories
+        '''
+        return Item.objects.filter(**{f"category__{lookup}": value
+                                      for lookup, value in Category.subtree_lookup(self.path).items()})
     
     def get_parent_category(self):
         '''
@@ -83,16 +158,23 @@ def get_filename_ext(filepath):
     return name, ext
 
 def upload_image_path(instance, filename):
-    new_filename = randint(1,3910209312)
+    #the storage names the file by the hash of its bytes
     _, ext = get_filename_ext(filename)
-    final_filename = f'{new_filename}{ext}'
-    return "item_images/{final_filename}".format(final_filename=final_filename)
+    return f"item_images/upload{ext}"
 
 def upload_thumbnail_path(instance, filename):
-    new_filename = randint(1,3910209312)
     _, ext = get_filename_ext(filename)
-    final_filename = f'{new_filename}{ext}'
-    return "item_thumbnails/{final_filename}".format(final_filename=final_filename)
+    return f"item_thumbnails/upload{ext}"
+
+class InsufficientStock(Exception):
+    """
+    Raised by `Order.checkout` with the ids of the items
+    whose stock can't cover their cart line
+    """
+    def __init__(self, items:list) -> None:
+        super().__init__(f"Not enough stock for {len(items)} item(s)")
+        self.items = items
+
 
 # Create your models here.
 class Item(TimeStampedModel, ActivatorModel, TitleSlugDescriptionModel, Model):
@@ -105,21 +187,28 @@ class Item(TimeStampedModel, ActivatorModel, TitleSlugDescriptionModel, Model):
     category = models.ForeignKey(Category, on_delete= models.SET_NULL, null=True, blank=True)
     currency = models.ForeignKey(Currency, on_delete= models.CASCADE, null=True, blank=True)
     stock = models.PositiveIntegerField(default=1)#number in stock/inventory
+    held = models.PositiveIntegerField(default=0, editable=False)#running total of active StockHold quantities
+    stock_shards = models.PositiveSmallIntegerField(default=0, editable=False)#0: stock is counted on this row, else in StockShard rows
     price = models.IntegerField(default=0) # normally should be a float field but price here is actually in pence, cents, kobo
-    image = models.ImageField(default="default.jpg", upload_to=upload_image_path)# will later make a one to many/many to many relationship cos an item might have multiple images and images can be shared too btw items
-    thumbnail = models.ImageField(default="default.jpg", upload_to=upload_thumbnail_path)
+    image = models.ImageField(default="default.jpg", upload_to=upload_image_path, storage=ContentAddressedStorage())# will later make a one to many/many to many relationship cos an item might have multiple images and images can be shared too btw items
+    thumbnail = models.ImageField(default="default.jpg", upload_to=upload_thumbnail_path, storage=ContentAddressedStorage())
     weight = models.DecimalField(max_digits = 10, decimal_places=3, default=0)#in kg
     specifications = models.JSONField(null=True, blank=True)
     colors = models.ManyToManyField(Color, related_name='items')
+    slug = AutoSlugField(verbose_name='slug', populate_from='title', overwrite_on_add=False)#keeps slugs set upfront e.g by bulk imports
 
     def __str__(self) -> str:
         return self.title
     
     def process_image(self):
         '''
-        Resizes item and thumbnail images
+        Queues the responsive variants of the item image and thumbnail,
+        the uploaded originals are kept as they are
         '''
-        process_item_image.delay(self.image.path, self.thumbnail.path)#i feel item images shouldnt be resized at all
+        for file, kind in ((self.image, "item"), (self.thumbnail, "thumbnail")):
+            #the `default.jpg` placeholder has no variants
+            if is_upload(file):
+                process_image_variants.delay(file.name, kind)
     
     def get_comments(self):
         '''
@@ -132,7 +221,7 @@ class Item(TimeStampedModel, ActivatorModel, TitleSlugDescriptionModel, Model):
         Image manipulation logic for thumbnail and image logic and saved
         '''
         super().save(*args, **kwargs)
-        #process_item_image(self)#dis adds computational overhead to save 
+        #self.process_image()#dis adds computational overhead to save 
         
     @property
     def amount(self) -> float:
@@ -140,35 +229,152 @@ class Item(TimeStampedModel, ActivatorModel, TitleSlugDescriptionModel, Model):
         amount: float = float(self.price / 100)
         return amount
 
-    def manage_stock(self, qty:int)-> None:
-        # used to reduce item stock when an order is made
-        new_stock: int = self.stock - int(qty)
-        self.stock: int = new_stock
-        self.save()
+    def manage_stock(self, qty:int)-> bool:
+        '''
+        Atomically takes `qty` off the stock with a single
+        `UPDATE ... SET stock = stock - qty WHERE stock >= qty`.
+        Returns False, changing nothing, when there isn't enough stock.
+        Only stock/modified are written and no lock is held past the statement.
+        Sharded items take it off one of their `StockShard` rows instead
+        '''
+        qty = int(qty)
+        if self.stock_shards:
+            from . import shards#imports this module
+            return shards.take(self.pk, self.stock_shards, qty)
+        modified = timezone.now()
+        #stock on hold for other buyers isn't for sale
+        updated = Item.objects.filter(pk=self.pk, stock_shards=0, stock__gte=F("held") + qty).update(
+            stock=F("stock") - qty, modified=modified)
+        if not updated:
+            return False
+        #bulk update sends no signals, cached item responses are dropped once committed
+        transaction.on_commit(lambda: bump_version(Item))
+        self.stock, self.modified = Item.objects.filter(pk=self.pk).values_list("stock", "modified").get()
+        return True
 
     def check_stock(self, qty:int) -> bool:
         #used to check if order quantity exceeds stock levels
-        if int(qty) <= self.stock:
+        if int(qty) <= self.available:
             return True
         return False
 
+    @property
+    def available(self) -> int:
+        #stock not held for a buyer's checkout
+        if self.stock_shards:
+            from . import shards#imports this module
+            return shards.available(self.pk)
+        return self.stock - self.held
+
     def place_order(self, user, qty:int):
-        #used to place an order
-        if self.check_stock(qty):
-            order:Order = Order.objects.create(
-                item = self,
-                quantity = qty,
-                user = user
-            )
-            self.manage_stock(qty)# this setup can lead to reentrancy risks. But for development we allow
-            return order
-        else:
+        '''
+        Reserves the stock and creates the order in one transaction, see `Order.checkout`.
+        Returns None when there isn't enough stock, concurrent orders can't oversell
+        '''
+        try:
+            order:Order = Order.checkout(user, {self.pk: int(qty)})
+        except InsufficientStock:
             return None
+        self.stock, self.held, self.stock_shards, self.modified = Item.objects.filter(pk=self.pk).values_list(
+            "stock", "held", "stock_shards", "modified").get()
+        return order
 
     class Meta:
         verbose_name = "Item"
         verbose_name_plural = "Items"
         ordering = ["id"]
+        indexes = [
+            models.Index(fields=["created", "id"], name="item_created_id_idx"),#keyset pagination
+        ]
+
+
+class StockHold(models.Model):
+    """
+    `ecommerce.StockHold`
+    Stock put aside for a buyer between cart and payment, until `expires_at`.
+    `Item.held` keeps the running total of an item's holds so availability
+    is `stock - held` without summing this table, see `ecommerce.holds`
+    """
+    item = models.ForeignKey(Item, on_delete=models.CASCADE, related_name="holds")
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name="stock_holds")
+    quantity = models.PositiveIntegerField()
+    expires_at = models.DateTimeField()
+    created = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self) -> str:
+        return f'{self.item_id} x {self.quantity} until {self.expires_at}'
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["expires_at"], name="stock_hold_expiry_idx"),#sweep
+            models.Index(fields=["item", "expires_at"], name="stock_hold_item_expiry_idx"),
+            models.Index(fields=["user", "item"], name="stock_hold_user_item_idx"),
+        ]
+
+
+class StockShard(models.Model):
+    """
+    `ecommerce.StockShard`
+    One of the sub-counters a hot item's unheld stock is spread over,
+    so concurrent orders decrement different rows, see `ecommerce.shards`
+    """
+    item = models.ForeignKey(Item, on_delete=models.CASCADE, related_name="shards")
+    index = models.PositiveSmallIntegerField()
+    stock = models.PositiveIntegerField(default=0)
+
+    def __str__(self) -> str:
+        return f'{self.item_id} #{self.index}: {self.stock}'
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["item", "index"], name="stock_shard_item_index_uniq"),
+        ]
+
+
+class CategorySpecKey(models.Model):
+    """
+    `ecommerce.CategorySpecKey`
+    A key of `Item.specifications` declared filterable for a category
+    and every category below it e.g `ram` on Phones
+    """
+    class Kind(models.TextChoices):
+        TEXT = "text", "Text"
+        NUMBER = "number", "Number"#also stored as a number so it can be range filtered
+
+    category = models.ForeignKey(Category, on_delete=models.CASCADE, related_name="spec_keys")
+    key = models.SlugField(max_length=50)
+    kind = models.CharField(choices=Kind.choices, default=Kind.TEXT, max_length=10)
+
+    def __str__(self) -> str:
+        return f"{self.category} - {self.key}"
+
+    class Meta:
+        verbose_name = "Category spec key"
+        verbose_name_plural = "Category spec keys"
+        constraints = [
+            models.UniqueConstraint(fields=["category", "key"], name="category_spec_key_unique"),
+        ]
+
+
+class ItemSpec(models.Model):
+    """
+    `ecommerce.ItemSpec`
+    Normalized `(item, key, value)` rows copied out of `Item.specifications`
+    for the declared keys, so spec filters are index lookups. see `ecommerce.specs`
+    """
+    item = models.ForeignKey(Item, on_delete=models.CASCADE, related_name="spec_rows")
+    key = models.CharField(max_length=50)
+    value = models.CharField(max_length=255)#lower cased text
+    number = models.FloatField(null=True, blank=True)
+
+    def __str__(self) -> str:
+        return f"{self.key}={self.value}"
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["key", "value", "item"], name="item_spec_value_idx"),
+            models.Index(fields=["key", "number", "item"], name="item_spec_number_idx"),
+        ]
 
     
 
@@ -188,6 +394,16 @@ class Order(TimeStampedModel, ActivatorModel, Model):
         RETURNED = "returned", "RETURNED"
         REFUNDED = "refunded", "REFUNDED"
 
+    #target status: statuses it can be reached from
+    TRANSITIONS = {
+        OrderStatus.CONFIRMED: (OrderStatus.PENDING,),
+        OrderStatus.SHIPPED: (OrderStatus.CONFIRMED,),
+        OrderStatus.DELIVERED: (OrderStatus.CONFIRMED, OrderStatus.SHIPPED),
+        OrderStatus.CANCELLED: (OrderStatus.PENDING, OrderStatus.CONFIRMED),
+        OrderStatus.RETURNED: (OrderStatus.DELIVERED,),
+        OrderStatus.REFUNDED: (OrderStatus.CANCELLED, OrderStatus.RETURNED),
+    }
+
     user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, null=True, blank=True)#buyer
     item = models.ManyToManyField(Item, through="OrderItem")
     quantity = models.PositiveIntegerField(verbose_name="quantity", default=1)
@@ -198,20 +414,126 @@ class Order(TimeStampedModel, ActivatorModel, Model):
 
 
     def __str__(self) -> str:
-        return f'{self.user.username} - {self.item.title}'
+        #`item` is a many to many manager, it has no title
+        return f'Order #{self.pk} - {self.user}'
+
+    @classmethod
+    def checkout(cls, user, lines:dict) -> "Order":
+        '''
+        Places one order for a cart of `{item_id: quantity}` lines.
+        All stock is taken off with one conditional UPDATE, the lines are
+        bulk inserted and the totals come from the items already loaded.
+        Lines of sharded items are taken off their `StockShard` rows instead.
+        Either every line is reserved or nothing is written:
+        raises `Item.DoesNotExist` for unknown items and `InsufficientStock`
+        '''
+        lines = {pk: int(qty) for pk, qty in lines.items()}
+        from . import rollups, holds, shards#import this module
+        items = Item.objects.only("id", "price", "weight", "vendor", "category", "held", "stock_shards").in_bulk(list(lines))
+        if len(items) != len(lines):
+            raise Item.DoesNotExist(f"Unknown item(s): {', '.join(str(pk) for pk in lines if pk not in items)}")
+        with transaction.atomic():
+            mine, hold_ids = {}, []
+            #nothing held on any line means no hold rows to read first
+            if any(item.held for item in items.values()):
+                holds.release_expired(item_ids=list(lines))
+                #the buyer's own holds on these items are used up by the order
+                mine, hold_ids = holds.claim(user, list(lines))
+            plain = {pk: qty for pk, qty in lines.items() if not items[pk].stock_shards}
+            sharded = {pk: qty for pk, qty in lines.items() if items[pk].stock_shards}
+            if plain:
+                enough = Q()
+                for pk, qty in plain.items():
+                    enough |= Q(pk=pk, stock_shards=0, stock__gte=F("held") - mine.get(pk, 0) + qty)
+                taken = Case(*(When(pk=pk, then=Value(qty)) for pk, qty in plain.items()))
+                released = Case(*(When(pk=pk, then=Value(qty)) for pk, qty in mine.items()), default=Value(0))
+                updated = Item.objects.filter(enough).update(
+                    stock=F("stock") - taken, held=F("held") - released, modified=timezone.now())
+                if updated != len(plain):
+                    short = [pk for pk, qty in plain.items() if not Item.objects.filter(
+                        pk=pk, stock_shards=0, stock__gte=F("held") - mine.get(pk, 0) + qty).exists()]
+                    raise InsufficientStock(short)
+            if sharded:
+                short = shards.checkout_lines(
+                    sharded, {pk: items[pk].stock_shards for pk in sharded}, mine)
+                if short:
+                    raise InsufficientStock(short)
+            if hold_ids:
+                StockHold.objects.filter(pk__in=hold_ids).delete()
+            order = cls.objects.create(
+                user = user,
+                quantity = sum(lines.values()),
+                total_price = sum(Decimal(items[pk].price * qty) for pk, qty in lines.items()) / 100,
+                total_weight = sum(items[pk].weight * qty for pk, qty in lines.items()),
+            )
+            OrderItem.objects.bulk_create(
+                OrderItem(order=order, item_id=pk, quantity=qty, price=items[pk].price) for pk, qty in lines.items())
+            day = timezone.localdate(order.created)
+            rollups.record_lines((day, items[pk].vendor_id, pk, items[pk].category_id, qty, items[pk].price)
+                                 for pk, qty in lines.items())
+            #sharded lines leave the item rows alone, their snapshot is bumped by `shards.sync`
+            if plain or mine:
+                transaction.on_commit(lambda: bump_version(Item))
+        return order
     
-    def mark_as_delivered(self):
+    @classmethod
+    def transition(cls, ids, status:str, user=None, batch_size:int=1000) -> dict:
+        '''
+        Moves the orders in `ids` to `status` in batches.
+        Each batch is one `UPDATE ... WHERE id IN (batch) AND status IN (allowed_from)`
+        plus one bulk insert into `OrderStatusHistory`.
+        Orders whose current status doesn't allow the move are left alone
+        and returned under `skipped`. raises ValueError for an unknown status
+        '''
+        from . import rollups#imports this module
+        if status not in cls.TRANSITIONS:
+            raise ValueError(f"Orders cannot be moved to '{status}'")
+        allowed_from = cls.TRANSITIONS[status]
+        ids = list(dict.fromkeys(ids))
+        updated = []
+        for start in range(0, len(ids), batch_size):
+            batch = ids[start:start + batch_size]
+            with transaction.atomic():
+                #locked so the statuses written to the history are the ones replaced
+                current = dict(cls.objects.select_for_update().order_by()
+                               .filter(pk__in=batch, status__in=allowed_from).values_list("id", "status"))
+                if not current:
+                    continue
+                cls.objects.filter(pk__in=list(current), status__in=allowed_from).update(
+                    status=status, modified=timezone.now())
+                OrderStatusHistory.objects.bulk_create(
+                    OrderStatusHistory(order_id=pk, from_status=previous, to_status=status, changed_by=user)
+                    for pk, previous in current.items())
+                #orders moving in or out of the sold statuses change the sales rollups
+                flipped = [pk for pk, previous in current.items() if rollups.is_sold(previous) != rollups.is_sold(status)]
+                if flipped:
+                    rollups.record_lines(rollups.order_lines(flipped), sign=1 if rollups.is_sold(status) else -1)
+            updated.extend(current)
+        done = set(updated)
+        return {"updated": len(updated), "skipped": [pk for pk in ids if pk not in done]}
+
+    def transition_to(self, status:str, user=None) -> bool:
+        '''
+        moves this order to `status`, False when its current status doesn't allow it
+        '''
+        if not Order.transition([self.pk], status, user=user)["updated"]:
+            return False
+        self.status, self.modified = Order.objects.filter(pk=self.pk).values_list("status", "modified").get()
+        return True
+
+    def mark_as_delivered(self, user=None) -> bool:
         """
         Method to mark the order as delivered.
         """
-        if self.status != Order.OrderStatus.DELIVERED:
-            self.status = Order.OrderStatus.DELIVERED
-            self.save()
+        return self.transition_to(Order.OrderStatus.DELIVERED, user=user)
 
     class Meta:
         verbose_name = "Order"
         verbose_name_plural = "Orders"
         ordering = ["id"]
+        indexes = [
+            models.Index(fields=["user", "created", "id"], name="order_user_created_id_idx"),#keyset pagination per buyer
+        ]
 
 
 class OrderItem(models.Model):
@@ -221,10 +543,60 @@ class OrderItem(models.Model):
     order = models.ForeignKey(Order, on_delete= models.CASCADE)
     item = models.ForeignKey(Item, on_delete= models.CASCADE)
     quantity = models.PositiveIntegerField()
+    price = models.IntegerField(null=True, blank=True)#unit price in pence when ordered, null on older rows
 
     def __str__(self) -> str:
         return f'Order #{self.order.id} - {self.item.title} x {self.quantity}'
     
+class OrderStatusHistory(models.Model):
+    """
+    `ecommerce.OrderStatusHistory`
+    Append only log of order status changes, written by `Order.transition`
+    """
+    order = models.ForeignKey(Order, on_delete=models.CASCADE, related_name="status_history")
+    from_status = models.CharField(choices=Order.OrderStatus.choices, max_length=20)
+    to_status = models.CharField(choices=Order.OrderStatus.choices, max_length=20)
+    changed_by = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, null=True, blank=True)
+    created = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self) -> str:
+        return f'Order #{self.order_id}: {self.from_status} -> {self.to_status}'
+
+    class Meta:
+        verbose_name = "Order status change"
+        verbose_name_plural = "Order status history"
+        ordering = ["created", "id"]
+        indexes = [
+            models.Index(fields=["order", "created"], name="order_status_history_idx"),
+        ]
+
+
+class SalesDaily(models.Model):
+    """
+    `ecommerce.SalesDaily`
+    Daily sales rollup per vendor and item, kept up to date by `ecommerce.rollups`
+    as orders are placed or cancelled. Per day and per category stats are sums over it
+    """
+    vendor = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name="sales_daily")
+    item = models.ForeignKey(Item, on_delete=models.CASCADE, related_name="sales_daily")
+    category = models.ForeignKey(Category, on_delete=models.SET_NULL, null=True, blank=True)#when sold
+    day = models.DateField()
+    orders = models.IntegerField(default=0)
+    units = models.IntegerField(default=0)
+    revenue = models.BigIntegerField(default=0)#in pence like Item.price
+
+    def __str__(self) -> str:
+        return f'{self.day} - {self.item_id}: {self.units} units'
+
+    class Meta:
+        verbose_name = "Daily sales"
+        verbose_name_plural = "Daily sales"
+        constraints = [
+            #also the index for a vendor's date range
+            models.UniqueConstraint(fields=["vendor", "day", "item"], name="sales_daily_unique"),
+        ]
+
+
 class Transaction(models.Model):
     user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE)#buyer
     amount = models.DecimalField(max_digits=10, decimal_places=2, validators=[MinValueValidator(1)])#in fiat
@@ -234,3 +606,43 @@ class Transaction(models.Model):
 
     def __str__(self):
         return f"Transaction {self.pk} - User: {self.user.username}, Amount: {self.amount}"
+
+
+class ReconciliationRun(models.Model):
+    """
+    `ecommerce.ReconciliationRun`
+    One pass of `ecommerce.reconcile` over the paid transactions
+    """
+    started = models.DateTimeField(auto_now_add=True)
+    finished = models.DateTimeField(null=True, blank=True)
+    checked = models.PositiveIntegerField(default=0)#paid transactions compared
+    mismatched = models.PositiveIntegerField(default=0)
+
+    def __str__(self) -> str:
+        return f'Reconciliation {self.started:%Y-%m-%d %H:%M}: {self.mismatched}/{self.checked} mismatched'
+
+    class Meta:
+        ordering = ["-started"]
+
+
+class ReconciliationMismatch(models.Model):
+    """
+    `ecommerce.ReconciliationMismatch`
+    A paid transaction whose amount isn't what its orders add up to
+    """
+    class Kind(models.TextChoices):
+        AMOUNT = "amount", "Amount differs from the order total"
+        NO_ORDER = "no_order", "Paid but no order"
+
+    run = models.ForeignKey(ReconciliationRun, on_delete=models.CASCADE, related_name="mismatches")
+    transaction = models.ForeignKey(Transaction, on_delete=models.CASCADE, related_name="mismatches")
+    kind = models.CharField(choices=Kind.choices, max_length=10)
+    amount = models.DecimalField(max_digits=10, decimal_places=2)
+    order_total = models.DecimalField(max_digits=12, decimal_places=2, null=True, blank=True)
+    orders = models.PositiveIntegerField(default=0)
+
+    def __str__(self) -> str:
+        return f'Transaction {self.transaction_id}: paid {self.amount}, orders {self.order_total}'
+
+    class Meta:
+        ordering = ["run", "transaction"]
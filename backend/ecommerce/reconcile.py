@@ -0,0 +1,54 @@
+"""
+Reconciliation of paid transactions against their orders
+
+Paid transactions are walked in chunks of ids. Each chunk is one aggregate
+query, `SUM(order.total_price)` grouped per transaction, keeping only the
+transactions with no order or a total off `Transaction.amount` by half a
+penny or more. Only those few rows reach Python, they are bulk inserted as
+`ReconciliationMismatch` rows of the `ReconciliationRun`.
+Backs the `reconcile transactions` celery task and `manage.py reconcile_transactions`.
+"""
+from decimal import Decimal
+
+from django.db.models import Count, F, Max, Min, Q, Sum
+from django.utils import timezone
+
+from .models import Transaction, ReconciliationRun, ReconciliationMismatch
+
+CHUNK_SIZE = 20000
+TOLERANCE = Decimal("0.005")#decimal sums can come back as floats on sqlite
+
+
+def check_chunk(start:int, end:int) -> tuple:
+    '''
+    Compares the paid transactions with `start <= id < end`.
+    returns `(number checked, [(id, amount, order total, orders), ...] mismatched)`
+    '''
+    paid = Transaction.objects.filter(paid=True, pk__gte=start, pk__lt=end).order_by()
+    totals = (paid.annotate(order_total=Sum("order__total_price"), orders=Count("order"))
+              .annotate(difference=F("order_total") - F("amount")))
+    mismatched = totals.filter(Q(order_total__isnull=True) | Q(difference__gte=TOLERANCE) | Q(difference__lte=-TOLERANCE))
+    return paid.count(), list(mismatched.values_list("id", "amount", "order_total", "orders"))
+
+
+def reconcile(chunk_size:int=CHUNK_SIZE) -> ReconciliationRun:
+    '''
+    Checks every paid transaction, a chunk of ids at a time.
+    The run's counters are saved after each chunk so a long run shows its progress
+    '''
+    run = ReconciliationRun.objects.create()
+    bounds = Transaction.objects.filter(paid=True).aggregate(low=Min("id"), high=Max("id"))
+    if bounds["low"] is not None:
+        for start in range(bounds["low"], bounds["high"] + 1, chunk_size):
+            checked, rows = check_chunk(start, start + chunk_size)
+            ReconciliationMismatch.objects.bulk_create(
+                ReconciliationMismatch(
+                    run=run, transaction_id=pk, amount=amount, order_total=total, orders=orders,
+                    kind=ReconciliationMismatch.Kind.NO_ORDER if total is None else ReconciliationMismatch.Kind.AMOUNT,
+                ) for pk, amount, total, orders in rows)
+            run.checked += checked
+            run.mismatched += len(rows)
+            ReconciliationRun.objects.filter(pk=run.pk).update(checked=run.checked, mismatched=run.mismatched)
+    run.finished = timezone.now()
+    run.save(update_fields=["finished"])
+    return run
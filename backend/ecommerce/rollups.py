@@ -0,0 +1,121 @@
+"""
+Daily sales rollups for vendor dashboards
+
+`SalesDaily` holds one row per (vendor, day, item) with the number of orders,
+units and revenue. Placing an order adds its lines, moving an order out of
+the sold statuses (cancelled, returned, refunded) takes them off again, all
+in the transaction that changes the order. `rebuild` recomputes any date
+range from the orders, it backs the `rebuild sales rollups` celery task.
+Dashboards read the small rollup table instead of joining orders.
+"""
+from datetime import timedelta
+
+from django.db import transaction
+from django.db.models import Count, F, Sum
+from django.db.models.functions import Coalesce, TruncDate
+from django.utils import timezone
+
+from .models import Order, OrderItem, SalesDaily
+
+SOLD_STATUSES = (
+    Order.OrderStatus.PENDING,
+    Order.OrderStatus.CONFIRMED,
+    Order.OrderStatus.SHIPPED,
+    Order.OrderStatus.DELIVERED,
+)
+TOP_ITEMS = 10
+
+
+def is_sold(status:str) -> bool:
+    return status in SOLD_STATUSES
+
+
+def record_lines(lines, sign:int=1) -> None:
+    '''
+    Adds (sign=1) or takes off (sign=-1) order lines given as
+    `(day, vendor_id, item_id, category_id, quantity, unit_price)`.
+    One insert for missing rows then one increment per (vendor, day, item)
+    '''
+    deltas = {}
+    for day, vendor, item, category, quantity, price in lines:
+        if vendor is None:
+            continue
+        entry = deltas.setdefault((vendor, day, item), [category, 0, 0, 0])
+        entry[1] += sign
+        entry[2] += sign * quantity
+        entry[3] += sign * quantity * (price or 0)
+    if not deltas:
+        return
+    with transaction.atomic():
+        SalesDaily.objects.bulk_create(
+            [SalesDaily(vendor_id=vendor, day=day, item_id=item, category_id=entry[0])
+             for (vendor, day, item), entry in deltas.items()],
+            ignore_conflicts=True,
+        )
+        for (vendor, day, item), (_, orders, units, revenue) in deltas.items():
+            SalesDaily.objects.filter(vendor_id=vendor, day=day, item_id=item).update(
+                orders=F("orders") + orders, units=F("units") + units, revenue=F("revenue") + revenue)
+
+
+def order_lines(order_ids) -> list:
+    '''
+    lines of the given orders in the shape `record_lines` takes
+    '''
+    rows = OrderItem.objects.filter(order_id__in=order_ids).values_list(
+        "order__created", "item__vendor_id", "item_id", "item__category_id", "quantity",
+        Coalesce("price", "item__price"))
+    return [(timezone.localdate(created), *rest) for created, *rest in rows]
+
+
+def rebuild(start, end, vendor_id=None, chunk_days:int=31) -> int:
+    '''
+    Recomputes the rollups of every day from `start` to `end` inclusive,
+    a chunk of days per transaction. returns the number of rows written
+    '''
+    total = 0
+    while start <= end:
+        chunk_end = min(start + timedelta(days=chunk_days - 1), end)
+        rollups = SalesDaily.objects.filter(day__gte=start, day__lte=chunk_end)
+        lines = OrderItem.objects.filter(order__created__date__gte=start, order__created__date__lte=chunk_end,
+                                         order__status__in=SOLD_STATUSES, item__vendor__isnull=False)
+        if vendor_id is not None:
+            rollups = rollups.filter(vendor_id=vendor_id)
+            lines = lines.filter(item__vendor_id=vendor_id)
+        rows = (lines.annotate(day=TruncDate("order__created"))
+                .values("day", "item__vendor_id", "item_id", "item__category_id")
+                .annotate(orders=Count("order_id", distinct=True), units=Sum("quantity"),
+                          revenue=Sum(F("quantity") * Coalesce("price", "item__price")))
+                .order_by())
+        with transaction.atomic():
+            rollups.delete()
+            created = SalesDaily.objects.bulk_create(
+                [SalesDaily(vendor_id=row["item__vendor_id"], day=row["day"], item_id=row["item_id"],
+                            category_id=row["item__category_id"], orders=row["orders"],
+                            units=row["units"], revenue=row["revenue"] or 0) for row in rows],
+                batch_size=1000,
+            )
+        total += len(created)
+        start = chunk_end + timedelta(days=1)
+    return total
+
+
+def vendor_stats(vendor, start, end) -> dict:
+    '''
+    totals, per day, top items and per category figures of a vendor
+    between `start` and `end` inclusive, straight from the rollups
+    '''
+    rollups = SalesDaily.objects.filter(vendor=vendor, day__gte=start, day__lte=end).order_by()
+    #named apart from the model fields they sum
+    sums = {"total_orders": Sum("orders"), "total_units": Sum("units"), "total_revenue": Sum("revenue")}
+    totals = rollups.aggregate(**sums)
+    return {
+        "from": start,
+        "to": end,
+        "totals": {key: value or 0 for key, value in totals.items()},
+        #days where every order was cancelled keep a zero row
+        "days": list(rollups.values("day").annotate(**sums).filter(total_orders__gt=0).order_by("day")),
+        "items": list(rollups.values("item_id", "item__title").annotate(**sums)
+                      .order_by("-total_revenue")[:TOP_ITEMS]),
+        "categories": list(rollups.values("category_id", "category__name").annotate(**sums)
+                           .order_by("-total_revenue")),
+    }
@@ -0,0 +1,149 @@
+"""
+Full text search index for `ecommerce.Item`
+
+sqlite: an FTS5 virtual table ranked with bm25
+postgres: a side table holding a weighted tsvector with a GIN index
+anything else falls back to the LIKE scan the SearchFilter does
+
+The index tables are created by migration `0006_item_search_index`, the
+sqlite one is rebuilt with uuid derived rowids by `0014_rebuild_item_search_index`
+and kept up to date from the item save/delete signals.
+"""
+import re
+from uuid import UUID
+
+from django.db import connection
+
+from .models import Item
+
+TABLE = "ecommerce_item_search"
+TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+ROWID_MASK = (1 << 63) - 1
+
+
+def is_supported() -> bool:
+    return connection.vendor in ("sqlite", "postgresql")
+
+
+def _db_id(pk) -> str:
+    #sqlite stores uuids as 32 char hex, postgres as native uuid
+    return Item._meta.pk.get_db_prep_value(pk, connection)
+
+
+def fts_rowid(pk) -> int:
+    '''
+    fts5 can only look rows up by rowid, so it is derived from the uuid
+    to keep updates/deletes off a full table scan
+    '''
+    return pk.int & ROWID_MASK
+
+
+def _upsert_sql() -> str:
+    if connection.vendor == "sqlite":
+        return f"INSERT OR REPLACE INTO {TABLE} (rowid, item_id, title, description) VALUES (%s, %s, %s, %s)"
+    return (
+        f"INSERT INTO {TABLE} (item_id, document) VALUES (%s, "
+        "setweight(to_tsvector('english', coalesce(%s, '')), 'A') || "
+        "setweight(to_tsvector('english', coalesce(%s, '')), 'B')) "
+        "ON CONFLICT (item_id) DO UPDATE SET document = EXCLUDED.document"
+    )
+
+
+def index_items(rows) -> None:
+    '''
+    Adds/replaces index entries for an iterable of (id, title, description)
+    '''
+    if not is_supported():
+        return
+    if connection.vendor == "sqlite":
+        rows = [(fts_rowid(pk), _db_id(pk), title or "", description or "") for pk, title, description in rows]
+    else:
+        rows = [(_db_id(pk), title or "", description or "") for pk, title, description in rows]
+    if not rows:
+        return
+    with connection.cursor() as cursor:
+        cursor.executemany(_upsert_sql(), rows)
+
+
+def index_item(item:Item) -> None:
+    index_items([(item.pk, item.title, item.description)])
+
+
+def remove_item(pk) -> None:
+    if not is_supported():
+        return
+    with connection.cursor() as cursor:
+        if connection.vendor == "sqlite":
+            cursor.execute(f"DELETE FROM {TABLE} WHERE rowid = %s", [fts_rowid(pk)])
+        else:
+            cursor.execute(f"DELETE FROM {TABLE} WHERE item_id = %s", [_db_id(pk)])
+
+
+def rebuild_index(batch_size:int=2000) -> int:
+    '''
+    Drops every index entry and re-indexes all items in batches
+    returns the number of indexed items
+    '''
+    if not is_supported():
+        return 0
+    with connection.cursor() as cursor:
+        cursor.execute(f"DELETE FROM {TABLE}")
+    total, batch = 0, []
+    rows = Item.objects.order_by().values_list("id", "title", "description")
+    for row in rows.iterator(chunk_size=batch_size):
+        batch.append(row)
+        if len(batch) >= batch_size:
+            index_items(batch)
+            total += len(batch)
+            batch = []
+    index_items(batch)
+    return total + len(batch)
+
+
+def build_match_query(term:str) -> str:
+    '''
+    Turns free text into an fts5 MATCH expression.
+    Every word is quoted (so user input can't inject fts syntax)
+    and prefix matched, words are ANDed
+    '''
+    return " ".join(f'"{token}"*' for token in TOKEN_RE.findall(term))
+
+
+def search_item_ids(term:str, limit:int=20, offset:int=0, queryset=None) -> list:
+    '''
+    Returns `[(item_id, rank), ...]` best match first.
+    `queryset` (e.g the filtered listing) restricts the matches inside
+    the ranked query, before the LIMIT, so filters never empty a page
+    '''
+    tokens = TOKEN_RE.findall(term or "")
+    if not tokens:
+        return []
+    within, within_params = "", []
+    if queryset is not None:
+        subquery, within_params = queryset.order_by().values("pk").query.sql_with_params()
+        within = f" AND item_id IN ({subquery})"
+    if connection.vendor == "sqlite":
+        #bm25 is lower for better matches, title weighs more than description
+        sql = (f"SELECT item_id, bm25({TABLE}, 0.0, 10.0, 1.0) AS rank FROM {TABLE} "
+               f"WHERE {TABLE} MATCH %s{within} ORDER BY rank LIMIT %s OFFSET %s")
+        params = [build_match_query(term), *within_params, limit, offset]
+    elif connection.vendor == "postgresql":
+        sql = (f"SELECT item_id, -ts_rank(document, query) AS rank "
+               f"FROM {TABLE}, to_tsquery('english', %s) query "
+               f"WHERE document @@ query{within} ORDER BY rank LIMIT %s OFFSET %s")
+        params = [" & ".join(f"{token}:*" for token in tokens), *within_params, limit, offset]
+    else:
+        return [(pk, 0.0) for pk in like_search_item_ids(term, limit, offset, queryset)]
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        return [(pk if isinstance(pk, UUID) else UUID(pk), rank) for pk, rank in cursor.fetchall()]
+
+
+def like_search_item_ids(term:str, limit:int=20, offset:int=0, queryset=None) -> list:
+    '''
+    The LIKE '%term%' scan SearchFilter performs. kept as the benchmark baseline
+    '''
+    queryset = Item.objects.all() if queryset is None else queryset
+    for token in TOKEN_RE.findall(term or ""):
+        queryset = queryset.filter(title__icontains=token) | queryset.filter(description__icontains=token)
+    return list(queryset.order_by("id").values_list("id", flat=True)[offset:offset + limit])
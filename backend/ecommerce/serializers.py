@@ -1,10 +1,19 @@
 from collections import OrderedDict
-from .models import Order, Item
+from rest_framework import serializers
+from .models import Order, OrderItem, Item, Category, Currency, Color, StockHold
+from core.models import CustomUser
+from core.serializers.fields import SrcsetField
 from rest_framework.status import HTTP_400_BAD_REQUEST
 from rest_framework.exceptions import APIException
 from rest_framework_json_api.serializers import (
     ModelSerializer,
+    Serializer,
     PrimaryKeyRelatedField,
+    ResourceRelatedField,
+    UUIDField,
+    IntegerField,
+    ListField,
+    ChoiceField,
     )
 
 
@@ -14,19 +23,84 @@ class NotEnoughStockException(APIException):
     default_code: str = "invalid"
 
 
+class VendorSerializer(ModelSerializer):
+    """
+    Public profile of the user selling an item
+    """
+    class Meta:
+        model: CustomUser = CustomUser
+        resource_name: str = "vendor"
+        fields: tuple = (
+            "username",
+            "country",
+            "avg_rating",
+        )
+
+
+class CategorySerializer(ModelSerializer):
+    class Meta:
+        model: Category = Category
+        resource_name: str = "category"
+        fields: tuple = (
+            "name",
+            "slug",
+            "description",
+        )
+
+
+class CurrencySerializer(ModelSerializer):
+    class Meta:
+        model: Currency = Currency
+        resource_name: str = "currency"
+        fields: tuple = (
+            "name",
+            "symbol",
+            "sign",
+        )
+
+
+class ColorSerializer(ModelSerializer):
+    class Meta:
+        model: Color = Color
+        resource_name: str = "color"
+        fields: tuple = (
+            "name",
+        )
+
+
 class ItemSerializer(ModelSerializer):
     """
     Item serializer class from Item model
-    with field as shown
+    with field as shown.
+    relations can be sideloaded with `include=vendor,category,currency,colors`
     """
+    vendor = ResourceRelatedField(read_only=True)
+    category = ResourceRelatedField(read_only=True)
+    currency = ResourceRelatedField(read_only=True)
+    colors = ResourceRelatedField(read_only=True, many=True)
+    image_srcset = SrcsetField(source="image")
+
+    included_serializers: dict = {
+        "vendor": VendorSerializer,
+        "category": CategorySerializer,
+        "currency": CurrencySerializer,
+        "colors": ColorSerializer,
+    }
+
     class Meta:
         model: Item = Item
+        resource_name: str = "item"
         fields: list = [
             'title',
             'description',
             'stock',
             'price',
             'image',
+            'image_srcset',
+            'vendor',
+            'category',
+            'currency',
+            'colors',
         ]
 
 class ItemCreateSerializer(ModelSerializer):
@@ -56,10 +130,10 @@ class OrderSerializer(ModelSerializer):
         """
         Used to validate Item stock levels
         """
-        item: Item = res.get("item")
         qty: int = res.get("quantity")
-        if not item.check_stock(qty):
-            raise NotEnoughStockException
+        for item in res.get("item", []):
+            if not item.check_stock(qty):
+                raise NotEnoughStockException
         return res
 
     class Meta:
@@ -67,6 +141,128 @@ class OrderSerializer(ModelSerializer):
         fields: tuple = (
             'item',
             'quantity',
+            'total_price',
+            'total_weight',
+            'status',
+        )
+        read_only_fields: tuple = (
+            'total_price',
+            'total_weight',
+            'status',
         )
 
 
+
+
+class ItemSummarySerializer(serializers.ModelSerializer):
+    """
+    The few item columns shown on an order line
+    """
+    class Meta:
+        model: Item = Item
+        fields: tuple = (
+            'id',
+            'title',
+            'slug',
+            'price',
+            'thumbnail',
+        )
+
+
+class OrderLineSerializer(serializers.ModelSerializer):
+    item = ItemSummarySerializer(read_only=True)
+
+    class Meta:
+        model: OrderItem = OrderItem
+        fields: tuple = (
+            'item',
+            'quantity',
+        )
+
+
+class OrderHistorySerializer(ModelSerializer):
+    """
+    Read only order with its lines, for the order history.
+    expects the queryset from `OrderViewSet.get_history_queryset`
+    """
+    lines = OrderLineSerializer(source="orderitem_set", many=True, read_only=True)
+
+    class Meta:
+        model: Order = Order
+        resource_name: str = "order"
+        fields: tuple = (
+            'created',
+            'status',
+            'quantity',
+            'total_price',
+            'total_weight',
+            'lines',
+        )
+        read_only_fields: tuple = fields
+
+
+class OrderCreateSerializer(Serializer):
+    """
+    Payload for placing an order on a single item.
+    The stock check happens atomically in `Item.place_order`
+    """
+    item = UUIDField()
+    quantity = IntegerField(min_value=1)
+
+    class Meta:
+        resource_name: str = "order"
+
+
+class CheckoutLineSerializer(Serializer):
+    item = UUIDField()
+    quantity = IntegerField(min_value=1)
+
+
+class CheckoutSerializer(Serializer):
+    """
+    A cart of `(item, quantity)` lines placed as one order.
+    lines for the same item are merged
+    """
+    lines = CheckoutLineSerializer(many=True, allow_empty=False, max_length=100)
+
+    def validate_lines(self, lines: list) -> dict:
+        merged = {}
+        for line in lines:
+            merged[line["item"]] = merged.get(line["item"], 0) + line["quantity"]
+        return merged
+
+    class Meta:
+        resource_name: str = "order"
+
+
+class OrderTransitionSerializer(Serializer):
+    """
+    Bulk status change `{"ids": [...], "status": "shipped"}`
+    """
+    ids = ListField(child=UUIDField(), allow_empty=False, max_length=10000)
+    status = ChoiceField(choices=list(Order.TRANSITIONS))
+
+    class Meta:
+        resource_name: str = "order"
+
+
+class StockHoldSerializer(ModelSerializer):
+    """
+    Stock held for the current user until `expires_at`
+    """
+    item = UUIDField(source="item_id")
+    quantity = IntegerField(min_value=1)
+
+    class Meta:
+        model: StockHold = StockHold
+        resource_name: str = "hold"
+        fields: tuple = (
+            'id',
+            'item',
+            'quantity',
+            'expires_at',
+        )
+        read_only_fields: tuple = (
+            'id',
+            'expires_at',
+        )
@@ -0,0 +1,176 @@
+"""
+Sharded stock counters for hot items
+
+Every order for an item updates its one `Item.stock` row, so in a flash sale
+orders for a popular item queue up on that row lock. `enable()` spreads the
+item's unheld stock over `Item.stock_shards` `StockShard` rows: an order
+takes its quantity off a random shard with a conditional
+`UPDATE ... WHERE stock >= qty`, so concurrent orders mostly lock different
+rows. Reading the stock sums the shards, cached for `STOCK_SHARD_CACHE_TIMEOUT`.
+
+While an item is sharded the shards hold what is for sale, `Item.held`
+still counts held stock and `Item.stock` is a snapshot (shards + held)
+refreshed by `sync()` for listings, filters and exports. To change the
+stock of a sharded item `disable()` it, edit it and `enable()` it again.
+Rows are always locked item first then shards, like `enable`/`disable`.
+"""
+import random
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Case, F, Sum, Value, When
+from django.utils import timezone
+
+from .models import Item, StockShard
+from utils.caching import bump_version
+
+CACHE_KEY = "stock_shards:{}"
+
+
+def get_shard_count() -> int:
+    return getattr(settings, "STOCK_SHARDS", 8)
+
+
+def get_cache_timeout() -> int:
+    return getattr(settings, "STOCK_SHARD_CACHE_TIMEOUT", 2)
+
+
+def enable(item_id, shards:int=None) -> bool:
+    '''
+    Moves the item's unheld stock into `shards` counters.
+    returns False when it is already sharded
+    '''
+    shards = shards or get_shard_count()
+    with transaction.atomic():
+        item = Item.objects.select_for_update().only("stock", "held", "stock_shards").get(pk=item_id)
+        if item.stock_shards:
+            return False
+        free = max(item.stock - item.held, 0)
+        StockShard.objects.bulk_create(
+            StockShard(item_id=item.pk, index=index, stock=free // shards + (index < free % shards))
+            for index in range(shards))
+        Item.objects.filter(pk=item.pk).update(stock_shards=shards, modified=timezone.now())
+        transaction.on_commit(lambda: bump_version(Item))
+    cache.delete(CACHE_KEY.format(item_id))
+    return True
+
+
+def disable(item_id) -> bool:
+    '''
+    Folds the shards back into `Item.stock`. returns False when it isn't sharded
+    '''
+    with transaction.atomic():
+        item = Item.objects.select_for_update().only("stock_shards").get(pk=item_id)
+        if not item.stock_shards:
+            return False
+        shards = StockShard.objects.filter(item_id=item_id)
+        free = sum(shards.select_for_update().values_list("stock", flat=True))
+        shards.delete()
+        Item.objects.filter(pk=item_id).update(stock=F("held") + free, stock_shards=0, modified=timezone.now())
+        transaction.on_commit(lambda: bump_version(Item))
+    cache.delete(CACHE_KEY.format(item_id))
+    return True
+
+
+def _take_from(item_id, index:int, qty:int) -> bool:
+    return bool(StockShard.objects.filter(item_id=item_id, index=index, stock__gte=qty).update(stock=F("stock") - qty))
+
+
+def _take_spread(item_id, qty:int) -> bool:
+    '''
+    takes `qty` across several shards when none has it all, locking them in index order
+    '''
+    with transaction.atomic():
+        rows = list(StockShard.objects.select_for_update().filter(item_id=item_id, stock__gt=0)
+                    .order_by("index").values_list("id", "stock"))
+        if sum(stock for _, stock in rows) < qty:
+            return False
+        taken = {}
+        for pk, stock in rows:
+            taken[pk] = min(stock, qty)
+            qty -= taken[pk]
+            if not qty:
+                break
+        StockShard.objects.filter(pk__in=list(taken)).update(
+            stock=F("stock") - Case(*(When(pk=pk, then=Value(part)) for pk, part in taken.items())))
+    return True
+
+
+def take(item_id, shards:int, qty:int) -> bool:
+    '''
+    Takes `qty` off a random shard that has it, or off several when no
+    single shard does. Returns False, changing nothing, when the shards
+    together don't have enough
+    '''
+    first = random.randrange(shards)
+    if _take_from(item_id, first, qty):
+        return True
+    #the random pick ran short, try the others that still have enough
+    others = list(StockShard.objects.filter(item_id=item_id, stock__gte=qty).exclude(index=first)
+                  .values_list("index", flat=True))
+    random.shuffle(others)
+    for index in others:
+        if _take_from(item_id, index, qty):
+            return True
+    return _take_spread(item_id, qty)
+
+
+def give_back(item_id, shards:int, qty:int) -> bool:
+    return bool(StockShard.objects.filter(item_id=item_id, index=random.randrange(shards)).update(
+        stock=F("stock") + qty))
+
+
+def checkout_lines(lines:dict, counts:dict, mine:dict) -> list:
+    '''
+    Takes sharded cart lines `{item_id: qty}` off their shards for `Order.checkout`.
+    `counts` is each item's shard count, `mine` the buyer's held quantities:
+    those already left the shards when held, so only the rest is taken and a
+    larger hold gives the excess back. returns the items that ran short
+    '''
+    released = {pk: mine[pk] for pk in lines if mine.get(pk)}
+    if released:
+        Item.objects.filter(pk__in=list(released)).update(
+            held=F("held") - Case(*(When(pk=pk, then=Value(qty)) for pk, qty in released.items())))
+    short = []
+    for pk, qty in lines.items():
+        needed = qty - mine.get(pk, 0)
+        if needed > 0 and not take(pk, counts[pk], needed):
+            short.append(pk)
+        elif needed < 0 and not give_back(pk, counts[pk], -needed):
+            short.append(pk)
+    return short
+
+
+def available(item_id) -> int:
+    '''
+    unheld stock of a sharded item, may lag the shards by the cache timeout
+    '''
+    key = CACHE_KEY.format(item_id)
+    total = cache.get(key)
+    if total is None:
+        total = StockShard.objects.filter(item_id=item_id).aggregate(total=Sum("stock"))["total"] or 0
+        cache.set(key, total, timeout=get_cache_timeout())
+    return total
+
+
+def sync(batch_size:int=500) -> int:
+    '''
+    Writes shards + held into `Item.stock` of the sharded items whose
+    snapshot moved. returns the number of items updated
+    '''
+    totals = dict(StockShard.objects.order_by().values("item_id").annotate(total=Sum("stock"))
+                  .values_list("item_id", "total"))
+    item_ids, changed = list(totals), 0
+    for start in range(0, len(item_ids), batch_size):
+        batch = item_ids[start:start + batch_size]
+        current = Item.objects.filter(pk__in=batch, stock_shards__gt=0).values_list("id", "stock", "held")
+        stale = {pk: totals[pk] for pk, stock, held in current if stock != totals[pk] + held}
+        if stale:
+            changed += Item.objects.filter(pk__in=list(stale), stock_shards__gt=0).update(
+                stock=F("held") + Case(*(When(pk=pk, then=Value(total)) for pk, total in stale.items())),
+                modified=timezone.now())
+        cache.set_many({CACHE_KEY.format(pk): totals[pk] for pk in batch}, timeout=get_cache_timeout())
+    if changed:
+        bump_version(Item)
+    return changed
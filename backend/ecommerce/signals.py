@@ -0,0 +1,89 @@
+from functools import partial
+
+from django.db import transaction
+from django.dispatch import receiver
+from django.utils import timezone
+from django.db.models.signals import post_init, post_save, post_delete, m2m_changed
+
+from ecommerce.models import Item, Category, Color, Currency, CategorySpecKey
+from core.models import CustomUser
+from core import media
+from ecommerce import facets, search, specs
+from utils.caching import bump_version
+
+
+#reference counts of content addressed item images
+media.track(Item, "image", "thumbnail")
+#the facet index is rebuilt only when a facet value changes
+post_init.connect(facets.remember, sender=Item, weak=False)
+post_save.connect(facets.item_saved, sender=Item, weak=False)
+post_delete.connect(lambda sender, **kwargs: facets.bump(), sender=Item, weak=False)
+
+
+@receiver(post_save, sender=Item, weak=False)
+def index_item(sender, instance, **kwargs):
+    #keeps the full text search index in step with the item
+    search.index_item(instance)
+
+
+@receiver(post_save, sender=Item, weak=False)
+def index_item_specs(sender, instance, **kwargs):
+    specs.index_item(instance)
+
+
+@receiver(post_delete, sender=Item, weak=False)
+def unindex_item(sender, instance, **kwargs):
+    search.remove_item(instance.pk)
+
+
+@receiver(post_save, sender=Item, weak=False)
+@receiver(post_delete, sender=Item, weak=False)
+@receiver(post_save, sender=Category, weak=False)
+@receiver(post_delete, sender=Category, weak=False)
+@receiver(post_save, sender=Color, weak=False)
+@receiver(post_delete, sender=Color, weak=False)
+@receiver(post_save, sender=Currency, weak=False)
+@receiver(post_delete, sender=Currency, weak=False)
+def invalidate_catalog_cache(sender, **kwargs):
+    #cached item responses are keyed on these versions, bumped once the
+    #write is visible so a reader can't cache old rows under the new version
+    transaction.on_commit(partial(bump_version, sender))
+
+
+@receiver(m2m_changed, sender=Item.colors.through, weak=False)
+def invalidate_item_colors(sender, instance, action, reverse, pk_set=None, **kwargs):
+    #colors are serialized with the item, `modified` drives its ETag/Last-Modified
+    if action == "pre_clear" and reverse:
+        instance._cleared_item_ids = list(instance.items.values_list("pk", flat=True))
+    if action not in ("post_add", "post_remove", "post_clear"):
+        return
+    if not reverse:
+        item_ids = [instance.pk]
+    elif action == "post_clear":
+        item_ids = getattr(instance, "_cleared_item_ids", [])
+    else:
+        item_ids = list(pk_set or ())
+    if item_ids:
+        Item.objects.filter(pk__in=item_ids).update(modified=timezone.now())
+    transaction.on_commit(partial(bump_version, Item))
+    facets.bump()
+
+
+@receiver(post_save, sender=CustomUser, weak=False)
+@receiver(post_delete, sender=CustomUser, weak=False)
+def invalidate_vendor_cache(sender, update_fields=None, **kwargs):
+    #item responses can include the vendor profile, a login only touches last_login
+    if update_fields and set(update_fields) <= {"last_login"}:
+        return
+    transaction.on_commit(partial(bump_version, sender))
+
+
+@receiver(post_save, sender=CategorySpecKey, weak=False)
+@receiver(post_delete, sender=CategorySpecKey, weak=False)
+def reindex_category_specs(sender, instance, **kwargs):
+    #declaring or dropping a key changes the rows of the whole subtree
+    category = Category.objects.filter(pk=instance.category_id).first()
+    if category is None:
+        return
+    specs.rebuild_index(category=category)
+    bump_version(Item)
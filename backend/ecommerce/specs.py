@@ -0,0 +1,142 @@
+"""
+Indexed filtering on `Item.specifications`
+
+Keys declared with `CategorySpecKey` on a category (or any of its ancestors)
+are copied out of the item's JSON into `ItemSpec` rows, one per value.
+`filter[spec]=ram:8,size:xl` then resolves through the (key, value) index
+instead of parsing the JSON of every row, `ram:4..16` through the (key, number) one.
+Rows are kept in step from the item and spec key signals and category
+moves, `manage.py rebuild_spec_index` rebuilds them all.
+"""
+import re
+from itertools import chain
+
+from django.db import transaction
+
+from .models import Item, Category, CategorySpecKey, ItemSpec
+
+NUMBER_RE = re.compile(r"-?\d+(?:\.\d+)?")
+VALUE_LENGTH = ItemSpec._meta.get_field("value").max_length
+RANGE_SEPARATOR = ".."
+
+
+def normalize(value) -> str:
+    if isinstance(value, bool):
+        return "true" if value else "false"
+    return str(value).strip().lower()[:VALUE_LENGTH]
+
+
+def to_number(value):
+    '''
+    numeric part of a spec value e.g `8` for "8GB", None when there is none
+    '''
+    if isinstance(value, bool):
+        return None
+    if isinstance(value, (int, float)):
+        return float(value)
+    match = NUMBER_RE.search(str(value))
+    return float(match.group()) if match else None
+
+
+def declared_keys(category_ids) -> dict:
+    '''
+    `{category_id: {key: kind}}` with the keys inherited from ancestors.
+    two queries whatever the number of categories
+    '''
+    paths = dict(Category.objects.filter(pk__in=category_ids).values_list("id", "path"))
+    lineage = {pk: [int(part) for part in path.strip("/").split("/") if part] for pk, path in paths.items()}
+    own = {}
+    spec_keys = CategorySpecKey.objects.filter(category_id__in=set(chain(*lineage.values())))
+    for category, key, kind in spec_keys.values_list("category_id", "key", "kind"):
+        own.setdefault(category, {})[key] = kind
+    return {pk: {key: kind for ancestor in ancestors for key, kind in own.get(ancestor, {}).items()}
+            for pk, ancestors in lineage.items()}
+
+
+def spec_rows(item_id, specifications, keys:dict) -> list:
+    '''
+    unsaved `ItemSpec` rows for the declared `keys` found in `specifications`.
+    list values give a row each e.g sizes ["S", "M"]
+    '''
+    if not keys or not isinstance(specifications, dict):
+        return []
+    found = {str(key).strip().lower(): value for key, value in specifications.items()}
+    rows = []
+    for key, kind in keys.items():
+        values = found.get(key)
+        for value in values if isinstance(values, list) else [values]:
+            if value is None or isinstance(value, (dict, list)):
+                continue
+            number = to_number(value) if kind == CategorySpecKey.Kind.NUMBER else None
+            rows.append(ItemSpec(item_id=item_id, key=key, value=normalize(value), number=number))
+    return rows
+
+
+def index_items(items) -> int:
+    '''
+    Replaces the spec rows of `items`, returns the number of rows written
+    '''
+    items = list(items)
+    if not items:
+        return 0
+    keys = declared_keys({item.category_id for item in items if item.category_id is not None})
+    rows = [row for item in items
+            for row in spec_rows(item.pk, item.specifications, keys.get(item.category_id))]
+    with transaction.atomic():
+        ItemSpec.objects.filter(item_id__in=[item.pk for item in items]).delete()
+        ItemSpec.objects.bulk_create(rows, batch_size=1000)
+    return len(rows)
+
+
+def index_item(item:Item) -> int:
+    return index_items([item])
+
+
+def rebuild_index(category:Category=None, batch_size:int=1000) -> int:
+    '''
+    Re-extracts the spec rows of every item, or of the items
+    under `category` when its declared keys changed
+    '''
+    items = category.get_items() if category is not None else Item.objects.all()
+    items = items.order_by().only("id", "category_id", "specifications")
+    total, batch = 0, []
+    for item in items.iterator(chunk_size=batch_size):
+        batch.append(item)
+        if len(batch) >= batch_size:
+            total += index_items(batch)
+            batch = []
+    return total + index_items(batch)
+
+
+def parse_conditions(raw:str) -> list:
+    '''
+    `ram:8,size:xl` -> `[("ram", "8"), ("size", "xl")]`, raises ValueError when malformed
+    '''
+    conditions = []
+    for condition in filter(None, (part.strip() for part in raw.split(","))):
+        key, separator, value = condition.partition(":")
+        if not separator or not key.strip() or not value.strip():
+            raise ValueError(f"'{condition}' should look like key:value")
+        conditions.append((key.strip().lower(), value.strip()))
+    return conditions
+
+
+def filter_items(queryset, conditions:list):
+    '''
+    narrows `queryset` to items matching every `(key, value)`.
+    `low..high` (either side optional) is a numeric range
+    '''
+    for key, value in conditions:
+        rows = ItemSpec.objects.filter(key=key)
+        if RANGE_SEPARATOR in value:
+            low, high = (bound.strip() for bound in value.split(RANGE_SEPARATOR, 1))
+            if not low and not high:
+                raise ValueError(f"'{key}:{value}' needs at least one bound")
+            if low:
+                rows = rows.filter(number__gte=float(low))
+            if high:
+                rows = rows.filter(number__lte=float(high))
+        else:
+            rows = rows.filter(value=normalize(value))
+        queryset = queryset.filter(pk__in=rows.values("item_id"))
+    return queryset
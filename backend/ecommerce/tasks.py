@@ -1,21 +1,39 @@
-from PIL import Image
+from datetime import date
+
 from celery import shared_task
 
 
-@shared_task(name="process item image")
-def process_item_image(imagepath, thumbnailpath=None)->None:
+@shared_task(name="rebuild sales rollups")
+def rebuild_sales_rollups(start:str, end:str, vendor_id=None) -> int:
+    """
+    Backfills or rebuilds the daily sales rollups from `start` to `end` (iso dates)
+    """
+    from .rollups import rebuild#models import this module
+    return rebuild(date.fromisoformat(start), date.fromisoformat(end), vendor_id=vendor_id)
+
+
+@shared_task(name="release expired stock holds")
+def release_expired_stock_holds(batch_size:int=1000) -> int:
+    """
+    Gives expired checkout holds back to the stock, run periodically by celery beat
+    """
+    from .holds import release_expired#models import this module
+    return release_expired(batch_size=batch_size)
+
+
+@shared_task(name="sync sharded stock")
+def sync_sharded_stock() -> int:
+    """
+    Refreshes the `Item.stock` snapshot of sharded items from their counters
+    """
+    from .shards import sync#models import this module
+    return sync()
+
+
+@shared_task(name="reconcile transactions")
+def reconcile_transactions(chunk_size:int=None) -> int:
     """
-    to process thumbnail and images
+    Checks paid transactions against their order totals, returns the run id
     """
-    #open image and makes a copy
-    img = Image.open(imagepath)
-    img_thumbnail = Image.Image.copy(img)
-    #logic to resize image and save to image path
-    if img.height > 300 or img.width > 300:
-        output_size = (300,300)
-        img = img.resize(output_size)
-        img.save(imagepath)
-    #logic to resize as thumbnail and save to thumbnail path
-    if img_thumbnail.height > 125 or img_thumbnail.width > 125:
-        img_thumbnail.thumbnail((125,125))
-        img_thumbnail.save(thumbnailpath)
\ No newline at end of file
+    from .reconcile import CHUNK_SIZE, reconcile#models import this module
+    return reconcile(chunk_size=chunk_size or CHUNK_SIZE).pk
@@ -1,18 +1,44 @@
+import json
+from hashlib import md5
 from uuid import uuid4
 
-from django.test import TestCase
+import threading
+
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.core.cache import cache
+from django.db import connection
+from django.db.models import F
+from django.utils import timezone
+from datetime import timedelta
+from django.test.utils import CaptureQueriesContext
+from django.core.management import call_command
+from io import StringIO
+from django.test.client import encode_multipart, BOUNDARY, MULTIPART_CONTENT
+from django.core.files.uploadedfile import SimpleUploadedFile
 from django.contrib.auth.models import User
-from rest_framework.test import APIClient, APITestCase
+from rest_framework.test import APIClient, APIRequestFactory, APITestCase
 from rest_framework.status import (
     HTTP_400_BAD_REQUEST,
     HTTP_404_NOT_FOUND,
-    HTTP_200_OK
+    HTTP_200_OK,
+    HTTP_201_CREATED,
+    HTTP_304_NOT_MODIFIED,
 )
 from rest_framework.authtoken.models import Token
 
-from .models import Item, Order, OrderItem
+from .models import (
+    Item, Order, OrderItem, Category, Color, Currency, CategorySpecKey, ItemSpec, OrderStatusHistory, SalesDaily, StockHold, StockShard,
+    Transaction, ReconciliationRun, ReconciliationMismatch,
+)
 from .serializers import NotEnoughStockException
+from .importer import ItemImporter, iter_rows
+from .tasks import rebuild_sales_rollups, release_expired_stock_holds, reconcile_transactions
+from . import holds, shards
+from .facets import FACET_VERSION
+from .views import ItemViewSet
 from core.models import CustomUser
+from utils.caching import get_cache_stats, get_versions
+from utils.idempotency import KEY as IDEMPOTENCY_KEY
 
 # Create your tests here.
 class EcommerceTestCase(APITestCase):
@@ -158,3 +184,1177 @@ class EcommerceTestCase(APITestCase):
         for o in orders:
             response = self.client.get(f'/api/v1/order/{o.id}/')
             self.assertEqual(response.status_code, HTTP_200_OK)
+
+
+class KeysetPaginationTestCase(APITestCase):
+    """
+    Test suite for the `(created, id)` cursor pagination on items
+    """
+
+    def setUp(self) -> None:
+        for i in range(7):
+            Item.objects.create(title=f"Paged item {i}", description="paged", price=100, stock=5)
+        self.user = CustomUser.objects.create_user(
+            username="pager", password="testing123", email="pager@example.com")
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION="Token " + Token.objects.get(user=self.user).key)
+
+    def test_walk_forward_and_back(self):
+        '''
+        following next links visits every item once in `(created, id)` order
+        and prev links walk back over the same pages
+        '''
+        expected = list(Item.objects.order_by("created", "id").values_list("title", flat=True))
+        seen, pages = [], []
+        url = '/api/v1/item/?page[size]=3'
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, HTTP_200_OK)
+            pages.append([row["title"] for row in response.data["results"]])
+            seen.extend(pages[-1])
+            last_links = response.data["links"]
+            url = last_links["next"]
+        self.assertEqual(seen, expected)
+        self.assertEqual(len(pages), 3)
+
+        response = self.client.get(last_links["prev"])
+        self.assertEqual([row["title"] for row in response.data["results"]], pages[1])
+        response = self.client.get(response.data["links"]["prev"])
+        self.assertEqual([row["title"] for row in response.data["results"]], pages[0])
+        self.assertIsNone(response.data["links"]["prev"])
+
+    def test_invalid_cursor(self):
+        '''
+        a tampered cursor is rejected instead of raising a server error
+        '''
+        response = self.client.get('/api/v1/item/?page[cursor]=bm90LWpzb24')
+        self.assertEqual(response.status_code, HTTP_404_NOT_FOUND)
+
+    def test_sort_is_kept(self):
+        '''
+        `sort` orders the pages, the cursor seeks on the sorted fields plus id
+        '''
+        Item.objects.filter(title="Paged item 5").update(price=50)
+        Item.objects.filter(title="Paged item 2").update(price=50)
+        expected = list(Item.objects.order_by("-price", "-title", "id").values_list("title", flat=True))
+        seen, url = [], '/api/v1/item/?page[size]=2&sort=-price,-title'
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, HTTP_200_OK)
+            seen.extend(row["title"] for row in response.data["results"])
+            url = response.data["links"]["next"]
+        self.assertEqual(seen, expected)
+        response = self.client.get('/api/v1/item/?page[size]=2&sort=title')
+        back = self.client.get(self.client.get(response.data["links"]["next"]).data["links"]["prev"])
+        self.assertEqual([row["title"] for row in back.data["results"]], ["Paged item 0", "Paged item 1"])
+        self.assertEqual(self.client.get('/api/v1/item/?sort=category').status_code, HTTP_400_BAD_REQUEST)
+
+
+class CategoryTreeTestCase(APITestCase):
+    """
+    Test suite for the category materialized path
+    """
+
+    def setUp(self) -> None:
+        self.root = Category.objects.create(name="Electronics")
+        self.phones = Category.objects.create(name="Phones", parent=self.root)
+        self.android = Category.objects.create(name="Android", parent=self.phones)
+        self.fashion = Category.objects.create(name="Fashion")
+        Item.objects.create(title="Pixel", description="phone", category=self.android)
+        Item.objects.create(title="Charger", description="cable", category=self.root)
+        Item.objects.create(title="Shirt", description="cloth", category=self.fashion)
+        self.user = CustomUser.objects.create_user(
+            username="browser", password="testing123", email="browser@example.com")
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION="Token " + Token.objects.get(user=self.user).key)
+
+    def test_descendants_and_ancestors(self):
+        '''
+        subtree and breadcrumb lookups are one query each
+        '''
+        with self.assertNumQueries(1):
+            names = {c.name for c in self.root.get_descendants()}
+        self.assertEqual(names, {"Phones", "Android"})
+        with self.assertNumQueries(1):
+            breadcrumb = [c.name for c in self.android.get_ancestors(include_self=True)]
+        self.assertEqual(breadcrumb, ["Electronics", "Phones", "Android"])
+        self.assertEqual(set(self.root.get_items().values_list("title", flat=True)), {"Pixel", "Charger"})
+
+    def test_move_reprefixes_subtree(self):
+        '''
+        moving a category rewrites the path of everything below it
+        '''
+        self.phones.parent = self.fashion
+        self.phones.save()
+        self.android.refresh_from_db()
+        self.assertEqual(self.android.path, f"/{self.fashion.pk}/{self.phones.pk}/{self.android.pk}/")
+        self.assertEqual(self.android.depth, 2)
+        self.assertEqual(set(self.root.get_descendants()), set())
+
+    def test_filter_items_by_category_subtree(self):
+        '''
+        test ItemViewSet list filtered by a whole category subtree
+        '''
+        response = self.client.get(f'/api/v1/item/?filter[category]={self.phones.pk}')
+        self.assertEqual(response.status_code, HTTP_200_OK)
+        self.assertEqual([row["title"] for row in response.data["results"]], ["Pixel"])
+
+
+class ItemSearchTestCase(APITestCase):
+    """
+    Test suite for the full text item search
+    """
+
+    def setUp(self) -> None:
+        self.kettle = Item.objects.create(title="Steel kettle", description="boils water fast")
+        self.cup = Item.objects.create(title="Glass cup", description="pairs with the steel kettle")
+        Item.objects.create(title="Desk lamp", description="warm light")
+        self.user = CustomUser.objects.create_user(
+            username="searcher", password="testing123", email="searcher@example.com")
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION="Token " + Token.objects.get(user=self.user).key)
+
+    def test_ranked_search(self):
+        '''
+        title matches outrank description matches
+        '''
+        response = self.client.get('/api/v1/item/search/?filter[search]=kettle')
+        self.assertEqual(response.status_code, HTTP_200_OK)
+        self.assertEqual([row["title"] for row in response.data["results"]], ["Steel kettle", "Glass cup"])
+
+    def test_index_follows_save_and_delete(self):
+        '''
+        the index is updated incrementally on item save/delete
+        '''
+        self.kettle.title = "Copper pot"
+        self.kettle.save()
+        response = self.client.get('/api/v1/item/search/?filter[search]=copper')
+        self.assertEqual([row["title"] for row in response.data["results"]], ["Copper pot"])
+        self.kettle.delete()
+        response = self.client.get('/api/v1/item/search/?filter[search]=copper')
+        self.assertEqual(response.data["results"], [])
+
+    def test_search_syntax_is_escaped(self):
+        '''
+        fts operators in user input are treated as plain words
+        '''
+        response = self.client.get('/api/v1/item/search/?filter[search]=lamp" OR "NEAR(')
+        self.assertEqual(response.status_code, HTTP_200_OK)
+
+    def test_filters_apply_before_the_limit(self):
+        '''
+        a filtered match ranked below the first page is still found, and pages follow the ranking
+        '''
+        for number in range(30):
+            Item.objects.create(title=f"Kettle {number}", description="kettle kettle")
+        category = Category.objects.create(name="Kitchen")
+        Item.objects.create(title="Camping stove", description="fits a kettle", category=category)
+        response = self.client.get(f'/api/v1/item/search/?filter[search]=kettle&filter[category]={category.pk}')
+        self.assertEqual([row["title"] for row in response.data["results"]], ["Camping stove"])
+        self.assertIsNone(response.data["links"]["next"])
+        seen, url = [], '/api/v1/item/search/?filter[search]=kettle&page[size]=10'
+        while url:
+            response = self.client.get(url)
+            seen.extend(row["title"] for row in response.data["results"])
+            url = response.data["links"]["next"]
+        self.assertEqual(len(seen), 33)
+        self.assertEqual(len(set(seen)), 33)
+
+
+class ItemResponseCacheTestCase(APITestCase):
+    """
+    Test suite for the versioned item response cache
+    """
+
+    def setUp(self) -> None:
+        cache.clear()
+        self.item = Item.objects.create(title="Cached item", description="cached", price=100, stock=3)
+        self.user = CustomUser.objects.create_user(
+            username="cacher", password="testing123", email="cacher@example.com")
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION="Token " + Token.objects.get(user=self.user).key)
+
+    def test_repeat_request_is_a_hit(self):
+        '''
+        the second identical request is served from the cache
+        '''
+        hits = get_cache_stats()["hits"]
+        first = self.client.get(f'/api/v1/item/{self.item.id}/')
+        with CaptureQueriesContext(connection) as queries:
+            second = self.client.get(f'/api/v1/item/{self.item.id}/')
+        self.assertEqual(first["X-Cache"], "MISS")
+        self.assertEqual(second["X-Cache"], "HIT")
+        self.assertEqual(first.content, second.content)
+        self.assertEqual(get_cache_stats()["hits"], hits + 1)
+        #a hit doesn't write the hit counter
+        self.assertFalse([query for query in queries if "response_cache:" in query["sql"]])
+
+    def test_model_save_invalidates(self):
+        '''
+        saving an item bumps the version so the next request misses
+        '''
+        self.client.get('/api/v1/item/')
+        version = get_versions([Item])
+        with self.captureOnCommitCallbacks(execute=True):
+            self.item.stock = 10
+            self.item.save()
+            #a reader before the commit still sees the old row
+            self.assertEqual(get_versions([Item]), version)
+        response = self.client.get('/api/v1/item/')
+        self.assertEqual(response["X-Cache"], "MISS")
+        self.assertEqual(response.json()["results"][0]["stock"], 10)
+
+    def test_browsable_api_is_not_cached(self):
+        '''
+        the html page names the user it was rendered for
+        '''
+        other = CustomUser.objects.create_user(username="other", password="testing123", email="other@example.com")
+        first = self.client.get('/api/v1/item/', HTTP_ACCEPT="text/html")
+        self.client.credentials(HTTP_AUTHORIZATION="Token " + Token.objects.get(user=other).key)
+        second = self.client.get('/api/v1/item/', HTTP_ACCEPT="text/html")
+        self.assertEqual((first.status_code, second.status_code), (HTTP_200_OK, HTTP_200_OK))
+        self.assertNotIn("X-Cache", second)
+        self.assertIn(b"other", second.content)
+        self.assertNotIn(b"cacher", second.content)
+
+    def test_query_params_are_part_of_the_key(self):
+        '''
+        different page sizes are cached separately
+        '''
+        self.client.get('/api/v1/item/?page[size]=1')
+        response = self.client.get('/api/v1/item/?page[size]=2')
+        self.assertEqual(response["X-Cache"], "MISS")
+
+
+class ConditionalGetTestCase(APITestCase):
+    """
+    Test suite for ETag/Last-Modified validators on items and orders
+    """
+
+    def setUp(self) -> None:
+        cache.clear()
+        self.item = Item.objects.create(title="Validated item", description="etag", price=100, stock=3)
+        self.user = CustomUser.objects.create_user(
+            username="etagger", password="testing123", email="etagger@example.com")
+        self.order = Order.objects.create(user=self.user, quantity=1)
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION="Token " + Token.objects.get(user=self.user).key)
+
+    def test_detail_not_modified(self):
+        '''
+        a matching If-None-Match or If-Modified-Since returns 304 with no body
+        '''
+        response = self.client.get(f'/api/v1/item/{self.item.id}/')
+        self.assertIn("ETag", response)
+        self.assertIn("Last-Modified", response)
+        etag_response = self.client.get(f'/api/v1/item/{self.item.id}/', HTTP_IF_NONE_MATCH=response["ETag"])
+        self.assertEqual(etag_response.status_code, HTTP_304_NOT_MODIFIED)
+        self.assertEqual(etag_response.content, b"")
+        date_response = self.client.get(f'/api/v1/item/{self.item.id}/',
+                                        HTTP_IF_MODIFIED_SINCE=response["Last-Modified"])
+        self.assertEqual(date_response.status_code, HTTP_304_NOT_MODIFIED)
+
+    def test_list_etag_changes_with_data(self):
+        '''
+        list ETag changes when a row is added, so clients get the new payload
+        '''
+        etag = self.client.get('/api/v1/order/')["ETag"]
+        self.assertEqual(self.client.get('/api/v1/order/', HTTP_IF_NONE_MATCH=etag).status_code,
+                         HTTP_304_NOT_MODIFIED)
+        Order.objects.create(user=self.user, quantity=2)
+        response = self.client.get('/api/v1/order/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, HTTP_200_OK)
+        self.assertNotEqual(response["ETag"], etag)
+
+    def test_item_update_changes_detail_etag(self):
+        '''
+        saving the item moves `modified` and so the ETag
+        '''
+        etag = self.client.get(f'/api/v1/item/{self.item.id}/')["ETag"]
+        self.item.price = 200
+        self.item.save()
+        response = self.client.get(f'/api/v1/item/{self.item.id}/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, HTTP_200_OK)
+
+    def test_color_change_changes_etags(self):
+        '''
+        colors are part of the item payload, adding one is a modification
+        '''
+        detail = self.client.get(f'/api/v1/item/{self.item.id}/')
+        listing = self.client.get('/api/v1/item/')
+        red = Color.objects.create(name="Red")
+        self.item.colors.add(red)
+        response = self.client.get(f'/api/v1/item/{self.item.id}/', HTTP_IF_NONE_MATCH=detail["ETag"])
+        self.assertEqual(response.status_code, HTTP_200_OK)
+        self.assertEqual(self.client.get('/api/v1/item/', HTTP_IF_NONE_MATCH=listing["ETag"]).status_code,
+                         HTTP_200_OK)
+        etag = response["ETag"]
+        red.items.clear()
+        response = self.client.get(f'/api/v1/item/{self.item.id}/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, HTTP_200_OK)
+
+    def test_item_change_changes_order_etags(self):
+        '''
+        the order history embeds item summaries, editing the item is a modification
+        '''
+        OrderItem.objects.create(order=self.order, item=self.item, quantity=1)
+        listing = self.client.get('/api/v1/order/')["ETag"]
+        detail = self.client.get(f'/api/v1/order/{self.order.id}/')["ETag"]
+        with self.captureOnCommitCallbacks(execute=True):
+            self.item.title = "Renamed item"
+            self.item.save()
+        response = self.client.get('/api/v1/order/', HTTP_IF_NONE_MATCH=listing)
+        self.assertEqual(response.status_code, HTTP_200_OK)
+        response = self.client.get(f'/api/v1/order/{self.order.id}/', HTTP_IF_NONE_MATCH=detail)
+        self.assertEqual(response.status_code, HTTP_200_OK)
+
+
+class ItemFacetTestCase(APITestCase):
+    """
+    Test suite for facet counts on the item listing
+    """
+
+    def setUp(self) -> None:
+        cache.clear()
+        self.phones = Category.objects.create(name="Phones")
+        self.android = Category.objects.create(name="Android", parent=self.phones)
+        self.books = Category.objects.create(name="Books")
+        naira = Currency.objects.create(name="Naira", symbol="NGN")
+        red, blue = Color.objects.create(name="Red"), Color.objects.create(name="Blue")
+        pixel = Item.objects.create(title="Pixel", category=self.android, currency=naira, price=90000)
+        pixel.colors.add(red, blue)
+        nokia = Item.objects.create(title="Nokia", category=self.phones, currency=naira, price=4000)
+        nokia.colors.add(red)
+        Item.objects.create(title="Novel", category=self.books, price=500)
+        self.user = CustomUser.objects.create_user(
+            username="faceter", password="testing123", email="faceter@example.com")
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION="Token " + Token.objects.get(user=self.user).key)
+
+    def counts(self, response, facet) -> dict:
+        return {entry["name"]: entry["count"] for entry in response.data["meta"]["facets"][facet]}
+
+    def test_unfiltered_facets(self):
+        '''
+        facets over the whole catalog come back with the first page
+        '''
+        response = self.client.get('/api/v1/item/?fields[facets]=color,currency,price&page[size]=1')
+        self.assertEqual(response.status_code, HTTP_200_OK)
+        self.assertEqual(len(response.data["results"]), 1)
+        self.assertEqual(self.counts(response, "color"), {"Red": 2, "Blue": 1})
+        self.assertEqual(self.counts(response, "currency"), {"Naira": 2})
+        self.assertEqual(self.counts(response, "price"), {"0-999": 1, "1000-4999": 1, "50000+": 1})
+
+    def test_facets_follow_filters(self):
+        '''
+        facets are counted over the filtered items only
+        '''
+        response = self.client.get(f'/api/v1/item/?fields[facets]=category,color&filter[category]={self.phones.pk}')
+        self.assertEqual(self.counts(response, "category"), {"Phones": 1, "Android": 1})
+        self.assertEqual(self.counts(response, "color"), {"Red": 2, "Blue": 1})
+
+    def test_index_rebuilt_on_change(self):
+        '''
+        a catalog change bumps the version and the counts follow
+        '''
+        self.client.get('/api/v1/item/?fields[facets]=category')
+        with self.captureOnCommitCallbacks(execute=True):
+            Item.objects.create(title="Atlas", category=self.books, price=800)
+        response = self.client.get('/api/v1/item/?fields[facets]=category')
+        self.assertEqual(self.counts(response, "category")["Books"], 2)
+
+    def test_index_kept_on_stock_change(self):
+        '''
+        writes that don't touch a facet leave the index version alone
+        '''
+        version = get_versions([FACET_VERSION])
+        item = Item.objects.get(title="Novel")
+        with self.captureOnCommitCallbacks(execute=True):
+            item.stock = 7
+            item.save()
+            Item.objects.filter(pk=item.pk).update(stock=F("stock") - 1)
+        self.assertEqual(get_versions([FACET_VERSION]), version)
+        with self.captureOnCommitCallbacks(execute=True):
+            item.price = 20000
+            item.save()
+        self.assertNotEqual(get_versions([FACET_VERSION]), version)
+
+    def test_category_filter_skips_the_ids(self):
+        '''
+        a category filter is counted from the index, the item ids are not fetched
+        '''
+        self.client.get('/api/v1/item/?fields[facets]=category')
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(f'/api/v1/item/?fields[facets]=category&filter[category]={self.phones.pk}')
+        self.assertEqual(self.counts(response, "category"), {"Phones": 1, "Android": 1})
+        #only the page itself is read from the items table
+        self.assertEqual(len([q for q in queries if 'FROM "ecommerce_item"' in q["sql"]]), 2)
+
+
+class ItemImportTestCase(APITestCase):
+    """
+    Test suite for the streaming bulk item import
+    """
+
+    def setUp(self) -> None:
+        Category.objects.create(name="Phones")
+        Currency.objects.create(name="Naira", symbol="NGN")
+        Color.objects.create(name="Red")
+        Color.objects.create(name="Blue")
+        self.user = CustomUser.objects.create_user(
+            username="importer", password="testing123", email="importer@example.com")
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION="Token " + Token.objects.get(user=self.user).key)
+
+    def test_csv_import_endpoint(self):
+        '''
+        valid rows are created with their relations, bad rows are reported by line
+        '''
+        upload = SimpleUploadedFile("items.csv", (
+            "title,description,stock,price,category,currency,colors\n"
+            "Pixel,android phone,5,90000,Phones,NGN,Red|Blue\n"
+            "Broken,bad stock,many,100,,,\n"
+            "Ghost,unknown category,1,100,Tablets,,\n"
+            "Pixel,second pixel,2,80000,phones,naira,\n"
+        ).encode("utf-8"))
+        response = self.client.post('/api/v1/item-create/import/', encode_multipart(BOUNDARY, {"file": upload}),
+                                    content_type=MULTIPART_CONTENT)
+        self.assertEqual(response.status_code, HTTP_201_CREATED)
+        self.assertEqual(response.data["created"], 2)
+        self.assertEqual([error["row"] for error in response.data["errors"]], [3, 4])
+        pixel = Item.objects.get(description="android phone")
+        self.assertEqual(pixel.vendor, self.user)
+        self.assertEqual(pixel.category.name, "Phones")
+        self.assertEqual(set(pixel.colors.values_list("name", flat=True)), {"Red", "Blue"})
+        slugs = set(Item.objects.values_list("slug", flat=True))
+        self.assertEqual(len(slugs), 2, "imported slugs must stay unique")
+
+    def test_ndjson_import_is_batched(self):
+        '''
+        the query count depends on the number of batches, not rows
+        '''
+        lines = [json.dumps({"title": f"Item {i}", "price": i, "colors": ["Red"]}) for i in range(50)]
+        importer = ItemImporter(batch_size=25)
+        with CaptureQueriesContext(connection) as queries:
+            report = importer.run(iter_rows(lines + ["not json"], "ndjson"))
+        inserts = [query for query in queries.captured_queries
+                   if query["sql"].startswith('INSERT INTO "ecommerce_item')]
+        self.assertEqual(len(inserts), 4, "one item and one colors insert per batch")
+        self.assertEqual(report["created"], 50)
+        self.assertEqual(report["failed"], 1)
+        self.assertEqual(Item.colors.through.objects.count(), 50)
+
+
+class ItemIncludeTestCase(APITestCase):
+    """
+    Test suite for JSON:API compound documents on the item listing
+    """
+
+    def setUp(self) -> None:
+        cache.clear()
+        self.user = CustomUser.objects.create_user(
+            username="includer", password="testing123", email="includer@example.com")
+        phones = Category.objects.create(name="Phones")
+        naira = Currency.objects.create(name="Naira", symbol="NGN")
+        red, blue = Color.objects.create(name="Red"), Color.objects.create(name="Blue")
+        for number in range(12):
+            item = Item.objects.create(title=f"Phone {number}", vendor=self.user, category=phones, currency=naira)
+            item.colors.add(red, blue)
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION="Token " + Token.objects.get(user=self.user).key)
+
+    def get(self, url):
+        return self.client.get(url, HTTP_ACCEPT="application/vnd.api+json")
+
+    def test_included_resources(self):
+        '''
+        related rows come back once each under `included`
+        '''
+        response = self.get('/api/v1/item/?include=vendor,category,currency,colors&page[size]=5')
+        self.assertEqual(response.status_code, HTTP_200_OK)
+        body = response.json()
+        self.assertEqual(len(body["data"]), 5)
+        self.assertEqual(body["data"][0]["type"], "item")
+        self.assertEqual(len(body["data"][0]["relationships"]["colors"]["data"]), 2)
+        included = sorted((resource["type"], resource["attributes"].get("name")) for resource in body["included"])
+        self.assertEqual(included, [
+            ("category", "Phones"), ("color", "Blue"), ("color", "Red"), ("currency", "Naira"), ("vendor", None)])
+
+    def test_sparse_fieldset(self):
+        '''
+        `fields[item]` trims the attributes and relationships
+        '''
+        body = self.get('/api/v1/item/?fields[item]=title,category').json()
+        self.assertEqual(list(body["data"][0]["attributes"]), ["title"])
+        self.assertEqual(list(body["data"][0]["relationships"]), ["category"])
+
+    def test_sort_columns_are_loaded(self):
+        '''
+        the `sort` columns are loaded with the sparse fieldset, the cursor is built from them
+        '''
+        self.get('/api/v1/item/?page[size]=1')
+        counts = []
+        for url in ('/api/v1/item/?fields[item]=title,price&page[size]=5',
+                    '/api/v1/item/?fields[item]=title,price&sort=-price,title&page[size]=5'):
+            with CaptureQueriesContext(connection) as queries:
+                response = self.get(url)
+            self.assertEqual(response.status_code, HTTP_200_OK)
+            self.assertIsNotNone(response.json()["links"]["next"])
+            counts.append(len(queries))
+        self.assertEqual(counts[0], counts[1])
+        view = ItemViewSet(action="list", action_map={"get": "list"}, format_kwarg=None)
+        view.request = view.initialize_request(APIRequestFactory().get('/api/v1/item/?sort=-price,title'))
+        self.assertEqual(view.get_sort_fields(Item.objects.all()), ["price", "title"])
+
+    def test_constant_query_count(self):
+        '''
+        the number of queries doesn't grow with the page size
+        '''
+        #first request seeds the cache version counters
+        self.get('/api/v1/item/?page[size]=1')
+        counts = []
+        for size in (2, 10):
+            with CaptureQueriesContext(connection) as queries:
+                response = self.get(f'/api/v1/item/?include=vendor,category,currency,colors&page[size]={size}')
+            self.assertEqual(response.status_code, HTTP_200_OK)
+            self.assertEqual(len(response.json()["data"]), size)
+            counts.append(len(queries))
+        self.assertEqual(counts[0], counts[1])
+
+
+class SpecFilterTestCase(APITestCase):
+    """
+    Test suite for filtering items on declared specification keys
+    """
+
+    def setUp(self) -> None:
+        cache.clear()
+        self.phones = Category.objects.create(name="Phones")
+        android = Category.objects.create(name="Android", parent=self.phones)
+        CategorySpecKey.objects.create(category=self.phones, key="ram", kind=CategorySpecKey.Kind.NUMBER)
+        CategorySpecKey.objects.create(category=android, key="os")
+        Item.objects.create(title="Pixel", category=android, specifications={"RAM": "8GB", "os": "Android", "size": "6.1"})
+        Item.objects.create(title="Galaxy", category=android, specifications={"ram": 12, "os": "android"})
+        Item.objects.create(title="Nokia", category=self.phones, specifications={"ram": "4 GB", "os": "android"})
+        self.user = CustomUser.objects.create_user(
+            username="specfilter", password="testing123", email="specfilter@example.com")
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION="Token " + Token.objects.get(user=self.user).key)
+
+    def titles(self, spec) -> set:
+        response = self.client.get('/api/v1/item/', {"filter[spec]": spec})
+        self.assertEqual(response.status_code, HTTP_200_OK)
+        return {item["title"] for item in response.data["results"]}
+
+    def test_declared_keys_indexed(self):
+        '''
+        only keys declared on the category or its ancestors get rows
+        '''
+        self.assertEqual(set(ItemSpec.objects.values_list("item__title", "key", "value", "number")), {
+            ("Pixel", "ram", "8gb", 8.0), ("Pixel", "os", "android", None),
+            ("Galaxy", "ram", "12", 12.0), ("Galaxy", "os", "android", None),
+            ("Nokia", "ram", "4 gb", 4.0),
+        })
+
+    def test_exact_and_range_filters(self):
+        '''
+        exact values match case insensitively, numeric keys take ranges
+        '''
+        self.assertEqual(self.titles("os:ANDROID"), {"Pixel", "Galaxy"})
+        self.assertEqual(self.titles("ram:8.."), {"Pixel", "Galaxy"})
+        self.assertEqual(self.titles("ram:..8,os:android"), {"Pixel"})
+        self.assertEqual(self.titles("size:6.1"), set())
+
+    def test_malformed_filter(self):
+        response = self.client.get('/api/v1/item/', {"filter[spec]": "ram"})
+        self.assertEqual(response.status_code, HTTP_400_BAD_REQUEST)
+
+    def test_new_key_reindexes_subtree(self):
+        '''
+        declaring a key backfills the rows of the items below the category
+        '''
+        CategorySpecKey.objects.create(category=self.phones, key="size", kind=CategorySpecKey.Kind.NUMBER)
+        self.assertEqual(self.titles("size:6..7"), {"Pixel"})
+
+    def test_move_reindexes_subtree(self):
+        '''
+        a moved category stops inheriting the old ancestors' keys and picks up the new ones
+        '''
+        tablets = Category.objects.create(name="Tablets")
+        CategorySpecKey.objects.create(category=tablets, key="size", kind=CategorySpecKey.Kind.NUMBER)
+        android = Category.objects.get(name="Android")
+        android.parent = tablets
+        android.save()
+        self.assertEqual(self.titles("ram:1.."), {"Nokia"})
+        self.assertEqual(self.titles("size:6.."), {"Pixel"})
+        self.assertEqual(self.titles("os:android"), {"Pixel", "Galaxy"})
+
+    def test_filter_uses_index(self):
+        '''
+        the spec lookup is an index search, not a scan
+        '''
+        if connection.vendor != "sqlite":
+            self.skipTest("query plan checked on sqlite only")
+        sql, params = ItemSpec.objects.filter(key="os", value="android").values("item_id").query.sql_with_params()
+        with connection.cursor() as cursor:
+            cursor.execute("EXPLAIN QUERY PLAN " + sql, params)
+            plan = " ".join(str(row) for row in cursor.fetchall())
+        self.assertIn("item_spec_value_idx", plan)
+
+
+class PlaceOrderTestCase(TransactionTestCase):
+    """
+    Test suite for the atomic stock reservation in `Item.place_order`
+    """
+
+    def setUp(self) -> None:
+        cache.clear()
+        self.user = CustomUser.objects.create_user(
+            username="buyer", password="testing123", email="buyer@example.com")
+        self.item = Item.objects.create(title="Limited", stock=3, price=250, weight=2)
+
+    def test_place_order(self):
+        '''
+        the order is linked to the item, priced and the stock is taken off
+        '''
+        modified = self.item.modified
+        order = self.item.place_order(self.user, 2)
+        self.assertEqual(self.item.stock, 1)
+        self.assertGreater(self.item.modified, modified)
+        self.assertEqual(Item.objects.get(pk=self.item.pk).stock, 1)
+        self.assertEqual(list(order.orderitem_set.values_list("item_id", "quantity")), [(self.item.pk, 2)])
+        self.assertEqual(order.total_price, 5)
+        self.assertEqual(order.total_weight, 4)
+
+    def test_not_enough_stock(self):
+        '''
+        nothing is written when the stock can't cover the order
+        '''
+        self.assertIsNone(self.item.place_order(self.user, 4))
+        self.assertEqual(Item.objects.get(pk=self.item.pk).stock, 3)
+        self.assertFalse(Order.objects.exists())
+
+    def test_concurrent_orders_dont_oversell(self):
+        '''
+        threads racing for the last units sell exactly the stock
+        '''
+        if connection.vendor == "sqlite" and connection.is_in_memory_db():
+            self.skipTest("in memory sqlite can't be shared between threads, see `manage.py benchmark_orders`")
+        Item.objects.filter(pk=self.item.pk).update(stock=20)
+        placed = []
+
+        def buy():
+            item = Item.objects.get(pk=self.item.pk)
+            while item.place_order(self.user, 1) is not None:
+                placed.append(1)
+            connection.close()
+
+        workers = [threading.Thread(target=buy) for _ in range(4)]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        self.assertEqual(len(placed), 20)
+        self.assertEqual(Item.objects.get(pk=self.item.pk).stock, 0)
+
+
+class CheckoutTestCase(APITestCase):
+    """
+    Test suite for placing a multi item cart as one order
+    """
+
+    def setUp(self) -> None:
+        cache.clear()
+        self.phone = Item.objects.create(title="Phone", stock=5, price=10000, weight="0.200")
+        self.case = Item.objects.create(title="Case", stock=2, price=1500, weight="0.050")
+        self.user = CustomUser.objects.create_user(
+            username="shopper", password="testing123", email="shopper@example.com")
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION="Token " + Token.objects.get(user=self.user).key)
+
+    def checkout(self, lines):
+        return self.client.post('/api/v1/order/checkout/', json.dumps({"lines": lines}),
+                                content_type="application/json")
+
+    def test_checkout(self):
+        '''
+        one order with a line per item, totals computed and stock taken off
+        '''
+        response = self.checkout([
+            {"item": str(self.phone.pk), "quantity": 2},
+            {"item": str(self.case.pk), "quantity": 1},
+            {"item": str(self.case.pk), "quantity": 1},
+        ])
+        self.assertEqual(response.status_code, HTTP_201_CREATED)
+        order = Order.objects.get(user=self.user)
+        self.assertEqual(order.quantity, 4)
+        self.assertEqual(order.total_price, 230)
+        self.assertEqual(float(order.total_weight), 0.5)
+        self.assertEqual(set(order.orderitem_set.values_list("item_id", "quantity")),
+                         {(self.phone.pk, 2), (self.case.pk, 2)})
+        self.assertEqual(dict(Item.objects.values_list("title", "stock")), {"Phone": 3, "Case": 0})
+
+    def test_short_line_fails_whole_cart(self):
+        '''
+        nothing is ordered or taken off the stock when a line is short
+        '''
+        response = self.checkout([
+            {"item": str(self.phone.pk), "quantity": 1},
+            {"item": str(self.case.pk), "quantity": 3},
+        ])
+        self.assertEqual(response.status_code, HTTP_400_BAD_REQUEST)
+        self.assertIn(str(self.case.pk), response.content.decode())
+        self.assertFalse(Order.objects.exists())
+        self.assertEqual(dict(Item.objects.values_list("title", "stock")), {"Phone": 5, "Case": 2})
+
+    def test_unknown_item(self):
+        response = self.checkout([{"item": str(uuid4()), "quantity": 1}])
+        self.assertEqual(response.status_code, HTTP_400_BAD_REQUEST)
+        self.assertFalse(Order.objects.exists())
+
+    def test_single_stock_update(self):
+        '''
+        the whole cart is reserved with one UPDATE
+        '''
+        with CaptureQueriesContext(connection) as queries:
+            self.checkout([{"item": str(self.phone.pk), "quantity": 1}, {"item": str(self.case.pk), "quantity": 1}])
+        updates = [query for query in queries.captured_queries if query["sql"].startswith('UPDATE "ecommerce_item"')]
+        self.assertEqual(len(updates), 1)
+
+
+class OrderHistoryTestCase(APITestCase):
+    """
+    Test suite for the order history list/detail read path
+    """
+
+    def setUp(self) -> None:
+        cache.clear()
+        self.user = CustomUser.objects.create_user(
+            username="historian", password="testing123", email="historian@example.com")
+        self.items = [Item.objects.create(title=f"Thing {number}", stock=100, price=100) for number in range(3)]
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION="Token " + Token.objects.get(user=self.user).key)
+
+    def place_orders(self, count:int) -> None:
+        for _ in range(count):
+            Order.checkout(self.user, {item.pk: 1 for item in self.items})
+
+    def test_history_payload(self):
+        '''
+        orders come with their lines and an item summary per line
+        '''
+        self.place_orders(1)
+        order = Order.objects.get()
+        response = self.client.get(f'/api/v1/order/{order.pk}/')
+        self.assertEqual(response.status_code, HTTP_200_OK)
+        self.assertEqual(response.data["total_price"], "3.00")
+        self.assertEqual(sorted(line["item"]["title"] for line in response.data["lines"]),
+                         ["Thing 0", "Thing 1", "Thing 2"])
+        self.assertEqual(str(order), f"Order #{order.pk} - historian")
+
+    def test_json_api_payload(self):
+        self.place_orders(2)
+        response = self.client.get('/api/v1/order/', HTTP_ACCEPT="application/vnd.api+json")
+        self.assertEqual(response.status_code, HTTP_200_OK)
+        self.assertEqual(len(response.json()["data"][0]["attributes"]["lines"]), 3)
+
+    def test_constant_query_count(self):
+        '''
+        the number of queries doesn't grow with the number of orders
+        '''
+        self.client.get('/api/v1/order/')
+        counts = []
+        for orders in (2, 6):
+            self.place_orders(orders)
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.get('/api/v1/order/')
+            self.assertEqual(response.status_code, HTTP_200_OK)
+            self.assertEqual(len(response.data["results"]), Order.objects.count())
+            counts.append(len([query for query in queries.captured_queries if "ecommerce_" in query["sql"]]))
+        self.assertEqual(counts[0], counts[1])
+        #validators, orders, lines joined to items
+        self.assertEqual(counts[0], 3)
+
+
+class OrderTransitionTestCase(APITestCase):
+    """
+    Test suite for validated bulk order status transitions
+    """
+
+    def setUp(self) -> None:
+        self.staff = CustomUser.objects.create_user(
+            username="fulfilment", password="testing123", email="fulfilment@example.com", is_staff=True)
+        self.confirmed = [Order.objects.create(user=self.staff, status=Order.OrderStatus.CONFIRMED) for _ in range(5)]
+        self.pending = Order.objects.create(user=self.staff)
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION="Token " + Token.objects.get(user=self.staff).key)
+
+    def test_bulk_transition(self):
+        '''
+        allowed orders move with one UPDATE per batch, the rest are skipped
+        '''
+        ids = [order.pk for order in self.confirmed] + [self.pending.pk]
+        with CaptureQueriesContext(connection) as queries:
+            result = Order.transition(ids, Order.OrderStatus.SHIPPED, user=self.staff, batch_size=3)
+        self.assertEqual(result, {"updated": 5, "skipped": [self.pending.pk]})
+        updates = [query for query in queries.captured_queries if query["sql"].startswith('UPDATE "ecommerce_order"')]
+        self.assertEqual(len(updates), 2)
+        self.assertEqual(Order.objects.filter(status=Order.OrderStatus.SHIPPED).count(), 5)
+        self.assertEqual(set(OrderStatusHistory.objects.values_list("from_status", "to_status", "changed_by")),
+                         {("confirmed", "shipped", self.staff.pk)})
+        self.assertEqual(OrderStatusHistory.objects.count(), 5)
+
+    def test_transition_endpoint(self):
+        response = self.client.post('/api/v1/order/transition/', json.dumps({
+            "ids": [str(self.pending.pk)], "status": "delivered"}), content_type="application/json")
+        self.assertEqual(response.status_code, HTTP_200_OK)
+        self.assertEqual(response.data["updated"], 0)
+        response = self.client.post('/api/v1/order/transition/', json.dumps({
+            "ids": [str(self.pending.pk)], "status": "confirmed"}), content_type="application/json")
+        self.assertEqual(response.data["updated"], 1)
+
+    def test_transition_endpoint_staff_only(self):
+        self.staff.is_staff = False
+        self.staff.save()
+        response = self.client.post('/api/v1/order/transition/', json.dumps({
+            "ids": [str(self.pending.pk)], "status": "confirmed"}), content_type="application/json")
+        self.assertEqual(response.status_code, 403)
+
+    def test_mark_as_delivered(self):
+        '''
+        single order path goes through the same validation
+        '''
+        self.assertFalse(self.pending.mark_as_delivered())
+        order = self.confirmed[0]
+        self.assertTrue(order.mark_as_delivered())
+        self.assertEqual(order.status, Order.OrderStatus.DELIVERED)
+        self.assertEqual(order.status_history.get().from_status, "confirmed")
+
+
+class IdempotencyKeyTestCase(APITestCase):
+    """
+    Test suite for `Idempotency-Key` on order creation
+    """
+
+    def setUp(self) -> None:
+        cache.clear()
+        self.item = Item.objects.create(title="Retried", stock=10, price=100)
+        self.user = CustomUser.objects.create_user(
+            username="retrier", password="testing123", email="retrier@example.com")
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION="Token " + Token.objects.get(user=self.user).key)
+
+    def order(self, key, quantity=2):
+        return self.client.post('/api/v1/order/', json.dumps({"item": str(self.item.pk), "quantity": quantity}),
+                                content_type="application/json", HTTP_IDEMPOTENCY_KEY=key)
+
+    def test_retry_is_replayed(self):
+        '''
+        a retry with the same key returns the first response and orders nothing
+        '''
+        first = self.order("retry-1")
+        self.assertEqual(first.status_code, HTTP_200_OK)
+        with CaptureQueriesContext(connection) as queries:
+            second = self.order("retry-1")
+        self.assertEqual(second.status_code, HTTP_200_OK)
+        self.assertEqual(second["Idempotent-Replayed"], "true")
+        self.assertEqual(second.json(), first.json())
+        self.assertFalse([query for query in queries.captured_queries if "ecommerce_" in query["sql"]])
+        self.assertEqual(Order.objects.count(), 1)
+        self.assertEqual(Item.objects.get(pk=self.item.pk).stock, 8)
+
+    def test_new_key_orders_again(self):
+        self.order("retry-1")
+        self.order("retry-2")
+        self.assertEqual(Item.objects.get(pk=self.item.pk).stock, 6)
+
+    def test_key_reused_with_other_payload(self):
+        self.order("retry-1")
+        self.assertEqual(self.order("retry-1", quantity=3).status_code, 422)
+        self.assertEqual(Order.objects.count(), 1)
+
+    @override_settings(IDEMPOTENCY_LOCK_TIMEOUT=0.2)
+    def test_duplicate_in_flight(self):
+        '''
+        a duplicate arriving while the key is locked doesn't run the order again
+        '''
+        digest = md5(b"retry-1").hexdigest()
+        cache.set(IDEMPOTENCY_KEY.format(view="order", action="create", user=self.user.pk, digest=digest) + ":lock", 1)
+        response = self.order("retry-1")
+        self.assertEqual(response.status_code, 409)
+        self.assertFalse(Order.objects.exists())
+
+
+class SalesRollupTestCase(APITestCase):
+    """
+    Test suite for the incrementally maintained vendor sales rollups
+    """
+
+    def setUp(self) -> None:
+        cache.clear()
+        self.vendor = CustomUser.objects.create_user(
+            username="seller", password="testing123", email="seller@example.com")
+        buyer = CustomUser.objects.create_user(username="payer", password="testing123", email="payer@example.com")
+        phones, books = Category.objects.create(name="Phones"), Category.objects.create(name="Books")
+        self.phone = Item.objects.create(title="Phone", vendor=self.vendor, category=phones, stock=50, price=10000)
+        self.book = Item.objects.create(title="Book", vendor=self.vendor, category=books, stock=50, price=500)
+        self.orders = [
+            Order.checkout(buyer, {self.phone.pk: 1, self.book.pk: 2}),
+            Order.checkout(buyer, {self.book.pk: 1}),
+        ]
+        self.phone.place_order(buyer, 2)
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION="Token " + Token.objects.get(user=self.vendor).key)
+
+    def rollups(self) -> set:
+        return set(SalesDaily.objects.values_list("item__title", "orders", "units", "revenue"))
+
+    def test_orders_are_rolled_up(self):
+        self.assertEqual(self.rollups(), {("Phone", 2, 3, 30000), ("Book", 2, 3, 1500)})
+
+    def test_cancelled_order_is_taken_off(self):
+        Order.transition([self.orders[0].pk], Order.OrderStatus.CANCELLED)
+        self.assertEqual(self.rollups(), {("Phone", 1, 2, 20000), ("Book", 1, 1, 500)})
+
+    def test_rebuild_matches_incremental(self):
+        '''
+        the backfill task recomputes the same rows from the orders
+        '''
+        Order.transition([self.orders[1].pk], Order.OrderStatus.CANCELLED)
+        incremental = self.rollups()
+        SalesDaily.objects.all().delete()
+        today = timezone.localdate().isoformat()
+        self.assertEqual(rebuild_sales_rollups(today, today), 2)
+        self.assertEqual(self.rollups(), incremental)
+
+    def test_vendor_stats_endpoint(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get('/api/v1/vendor-stats/')
+        self.assertEqual(response.status_code, HTTP_200_OK)
+        self.assertEqual(response.data["totals"], {"total_orders": 4, "total_units": 6, "total_revenue": 31500})
+        self.assertEqual([item["item__title"] for item in response.data["items"]], ["Phone", "Book"])
+        self.assertEqual(len(response.data["days"]), 1)
+        self.assertEqual(len([query for query in queries.captured_queries if "ecommerce_" in query["sql"]]), 4)
+
+    def test_vendor_stats_bad_range(self):
+        response = self.client.get('/api/v1/vendor-stats/', {"filter[from]": "2024-02-30"})
+        self.assertEqual(response.status_code, HTTP_400_BAD_REQUEST)
+
+
+class ExportTestCase(APITestCase):
+    """
+    Test suite for the streaming CSV/NDJSON exports
+    """
+
+    def setUp(self) -> None:
+        self.staff = CustomUser.objects.create_user(
+            username="finance", password="testing123", email="finance@example.com", is_staff=True)
+        items = [Item.objects.create(title=f"Export {number}", stock=10, price=100) for number in range(3)]
+        for item in items:
+            Order.checkout(self.staff, {item.pk: 1})
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION="Token " + Token.objects.get(user=self.staff).key)
+
+    def test_csv_export(self):
+        response = self.client.get('/api/v1/export/orders/', {"format": "csv"})
+        self.assertEqual(response.status_code, HTTP_200_OK)
+        self.assertTrue(response.streaming)
+        self.assertEqual(response["Content-Type"], "text/csv; charset=utf-8")
+        lines = b"".join(response.streaming_content).decode().splitlines()
+        self.assertEqual(lines[0].split(",")[:3], ["id", "created", "modified"])
+        self.assertEqual(len(lines), 4)
+
+    def test_ndjson_export_with_range(self):
+        today = timezone.localdate().isoformat()
+        response = self.client.get('/api/v1/export/order-items/',
+                                   {"format": "ndjson", "filter[from]": today, "filter[to]": today})
+        rows = [json.loads(line) for line in b"".join(response.streaming_content).splitlines()]
+        self.assertEqual(len(rows), 3)
+        self.assertEqual(set(rows[0]), {"id", "order_id", "item_id", "quantity", "price", "order_created"})
+        response = self.client.get('/api/v1/export/order-items/', {"format": "ndjson", "filter[to]": "2000-01-01"})
+        self.assertEqual(b"".join(response.streaming_content), b"")
+
+    def test_staff_only(self):
+        self.staff.is_staff = False
+        self.staff.save()
+        self.assertEqual(self.client.get('/api/v1/export/items/', {"format": "csv"}).status_code, 403)
+
+    def test_export_command(self):
+        out = StringIO()
+        call_command("export_data", "items", "--format", "ndjson", stdout=out)
+        titles = {json.loads(line)["title"] for line in out.getvalue().splitlines()}
+        self.assertEqual(titles, {"Export 0", "Export 1", "Export 2"})
+
+
+
+class StockHoldTestCase(APITestCase):
+    """
+    Test suite for holding stock between cart and checkout
+    """
+
+    def setUp(self) -> None:
+        cache.clear()
+        self.item = Item.objects.create(title="Limited", stock=3, price=1000)
+        self.user = CustomUser.objects.create_user(
+            username="holder", password="testing123", email="holder@example.com")
+        self.other = CustomUser.objects.create_user(
+            username="other", password="testing123", email="other@example.com")
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION="Token " + Token.objects.get(user=self.user).key)
+
+    def test_hold_blocks_other_buyers(self):
+        self.assertIsNotNone(holds.place_hold(self.item.pk, self.user, 2))
+        self.item.refresh_from_db()
+        self.assertEqual((self.item.stock, self.item.held, self.item.available), (3, 2, 1))
+        self.assertIsNone(holds.place_hold(self.item.pk, self.other, 2))
+        self.assertIsNone(self.item.place_order(self.other, 2))
+        self.assertIsNotNone(self.item.place_order(self.other, 1))
+        self.assertEqual((self.item.stock, self.item.held), (2, 2))
+
+    def test_checkout_uses_own_hold(self):
+        holds.place_hold(self.item.pk, self.user, 3)
+        Order.checkout(self.user, {self.item.pk: 3})
+        self.item.refresh_from_db()
+        self.assertEqual((self.item.stock, self.item.held), (0, 0))
+        self.assertFalse(StockHold.objects.exists())
+
+    def test_checkout_beyond_hold(self):
+        holds.place_hold(self.item.pk, self.user, 1)
+        self.assertIsNone(self.item.place_order(self.user, 4))
+        order = self.item.place_order(self.user, 3)
+        self.assertIsNotNone(order)
+        self.item.refresh_from_db()
+        self.assertEqual((self.item.stock, self.item.held), (0, 0))
+
+    def test_expired_holds_released_in_batches(self):
+        for _ in range(3):
+            holds.place_hold(self.item.pk, self.other, 1)
+        StockHold.objects.update(expires_at=timezone.now() - timedelta(seconds=1))
+        self.assertEqual(release_expired_stock_holds(batch_size=2), 3)
+        self.item.refresh_from_db()
+        self.assertEqual((self.item.stock, self.item.held), (3, 0))
+        self.assertFalse(StockHold.objects.exists())
+
+    def test_expired_hold_does_not_block(self):
+        holds.place_hold(self.item.pk, self.other, 3, ttl=timedelta(seconds=-1))
+        self.assertIsNotNone(self.item.place_order(self.user, 3))
+
+    def test_hold_endpoints(self):
+        response = self.client.post('/api/v1/hold/', json.dumps({"item": str(self.item.pk), "quantity": 2}),
+                                    content_type="application/json")
+        self.assertEqual(response.status_code, HTTP_201_CREATED)
+        hold_id = response.data["id"]
+        response = self.client.post('/api/v1/hold/', json.dumps({"item": str(self.item.pk), "quantity": 2}),
+                                    content_type="application/json")
+        self.assertEqual(response.status_code, HTTP_400_BAD_REQUEST)
+        response = self.client.get('/api/v1/hold/')
+        self.assertEqual([hold["id"] for hold in response.data], [hold_id])
+        self.assertEqual(self.client.delete(f'/api/v1/hold/{hold_id}/').status_code, 204)
+        self.assertEqual(self.client.delete(f'/api/v1/hold/{hold_id}/').status_code, HTTP_404_NOT_FOUND)
+        self.item.refresh_from_db()
+        self.assertEqual(self.item.held, 0)
+
+
+
+class StockShardTestCase(APITestCase):
+    """
+    Test suite for spreading a hot item's stock over sharded counters
+    """
+
+    def setUp(self) -> None:
+        cache.clear()
+        self.item = Item.objects.create(title="Hot", stock=10, price=1000)
+        self.user = CustomUser.objects.create_user(
+            username="buyer", password="testing123", email="buyer@example.com")
+
+    def shard_stock(self) -> list:
+        return list(StockShard.objects.filter(item=self.item).order_by("index").values_list("stock", flat=True))
+
+    def test_enable_spreads_unheld_stock(self):
+        holds.place_hold(self.item.pk, self.user, 3)
+        self.assertTrue(shards.enable(self.item.pk, 3))
+        self.assertFalse(shards.enable(self.item.pk, 3))
+        self.assertEqual(self.shard_stock(), [3, 2, 2])
+        self.assertTrue(shards.disable(self.item.pk))
+        self.item.refresh_from_db()
+        self.assertEqual((self.item.stock, self.item.held, self.item.stock_shards), (10, 3, 0))
+        self.assertFalse(StockShard.objects.exists())
+
+    def test_orders_take_off_shards(self):
+        shards.enable(self.item.pk, 4)
+        self.assertIsNotNone(self.item.place_order(self.user, 2))
+        #no single shard has 4 left, it is gathered across them
+        self.assertIsNotNone(self.item.place_order(self.user, 4))
+        self.assertIsNone(self.item.place_order(self.user, 5))
+        self.assertEqual(sum(self.shard_stock()), 4)
+        self.assertEqual(OrderItem.objects.filter(item=self.item).count(), 2)
+        cache.clear()
+        self.assertEqual(self.item.available, 4)
+        self.assertTrue(self.item.manage_stock(4))
+        self.assertFalse(self.item.manage_stock(1))
+
+    def test_holds_on_sharded_item(self):
+        shards.enable(self.item.pk, 2)
+        other = CustomUser.objects.create_user(username="other", password="testing123", email="other@example.com")
+        hold = holds.place_hold(self.item.pk, self.user, 6)
+        self.assertIsNotNone(hold)
+        self.assertIsNone(holds.place_hold(self.item.pk, other, 5))
+        self.assertEqual(sum(self.shard_stock()), 4)
+        #the hold covers 6, ordering 4 gives 2 back to the shards
+        Order.checkout(self.user, {self.item.pk: 4})
+        self.item.refresh_from_db()
+        self.assertEqual((self.item.held, sum(self.shard_stock())), (0, 6))
+        hold = holds.place_hold(self.item.pk, other, 6)
+        holds.release(other, hold.pk)
+        self.assertEqual(sum(self.shard_stock()), 6)
+
+    def test_sync_snapshot(self):
+        shards.enable(self.item.pk, 2)
+        self.item.place_order(self.user, 3)
+        holds.place_hold(self.item.pk, self.user, 2)
+        self.assertEqual(shards.sync(), 1)
+        self.item.refresh_from_db()
+        self.assertEqual((self.item.stock, self.item.held), (7, 2))
+        self.assertEqual(shards.sync(), 0)
+
+
+
+class ReconciliationTestCase(APITestCase):
+    """
+    Test suite for checking paid transactions against their orders
+    """
+
+    def setUp(self) -> None:
+        self.user = CustomUser.objects.create_user(
+            username="payer", password="testing123", email="payer@example.com")
+
+    def pay(self, amount, order_total=None, paid=True) -> Transaction:
+        payment = Transaction.objects.create(user=self.user, amount=amount, paid=paid)
+        if order_total is not None:
+            Order.objects.create(user=self.user, total_price=order_total, transaction=payment)
+        return payment
+
+    def test_reconcile_in_chunks(self):
+        matched = [self.pay("10.00", "10.00") for _ in range(5)]
+        short = self.pay("12.50", "12.00")
+        orphan = self.pay("3.00")
+        self.pay("7.00", "1.00", paid=False)
+        run = ReconciliationRun.objects.get(pk=reconcile_transactions(chunk_size=2))
+        self.assertEqual((run.checked, run.mismatched), (7, 2))
+        self.assertIsNotNone(run.finished)
+        mismatches = {row.transaction_id: row for row in run.mismatches.all()}
+        self.assertEqual(set(mismatches), {short.pk, orphan.pk})
+        self.assertEqual(mismatches[short.pk].kind, ReconciliationMismatch.Kind.AMOUNT)
+        self.assertEqual(str(mismatches[short.pk].order_total), "12.00")
+        self.assertEqual((mismatches[orphan.pk].kind, mismatches[orphan.pk].orders),
+                         (ReconciliationMismatch.Kind.NO_ORDER, 0))
+        self.assertNotIn(matched[0].pk, mismatches)
+
+    def test_queries_per_chunk(self):
+        for _ in range(6):
+            self.pay("5.00", "5.00")
+        with CaptureQueriesContext(connection) as queries:
+            call_command("reconcile_transactions", "--chunk-size", "3", stdout=StringIO())
+        #the id bounds, then a count and one grouped sum per chunk
+        selects = [query for query in queries.captured_queries if "ecommerce_transaction" in query["sql"]]
+        self.assertEqual(len(selects), 1 + 2 * 2)
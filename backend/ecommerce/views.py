@@ -1,48 +1,179 @@
+import codecs
+from datetime import date, timedelta
 from json import JSONDecodeError
 
-from django.http import JsonResponse
+from django.http import JsonResponse, StreamingHttpResponse
+from django.db import transaction
+from django.db.models import Prefetch
+from django.utils import timezone
 from django.shortcuts import get_object_or_404
-from rest_framework.viewsets import GenericViewSet
+from rest_framework.viewsets import GenericViewSet, ViewSet
+from rest_framework.decorators import action
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import replace_query_param
+from rest_framework.renderers import JSONRenderer
 from rest_framework.views import APIView
 from rest_framework.parsers import JSONParser, MultiPartParser, FormParser
-from rest_framework.status import HTTP_400_BAD_REQUEST, HTTP_404_NOT_FOUND, HTTP_200_OK
+from rest_framework.status import HTTP_400_BAD_REQUEST, HTTP_404_NOT_FOUND, HTTP_200_OK, HTTP_201_CREATED, HTTP_204_NO_CONTENT
+from rest_framework.exceptions import ValidationError, NotFound
 from rest_framework.response import Response
-from rest_framework.permissions import IsAuthenticated
+from rest_framework.permissions import IsAuthenticated, IsAdminUser
 from rest_framework.mixins import ListModelMixin, UpdateModelMixin, RetrieveModelMixin, CreateModelMixin
 
-from .models import Order, Item
-from .serializers import ItemSerializer, OrderSerializer, ItemCreateSerializer
+from .models import Order, OrderItem, Item, Category, Color, Currency, InsufficientStock
+from .filters import ItemFilter
+from .search import search_item_ids
+from .facets import FACETS, facet_counts
+from .importer import FORMATS, ItemImporter, guess_format, iter_rows
+from .rollups import vendor_stats
+from . import exporter, holds
+from .serializers import (
+    ItemSerializer, OrderSerializer, OrderCreateSerializer, ItemCreateSerializer, NotEnoughStockException,
+    CheckoutSerializer, OrderHistorySerializer, OrderTransitionSerializer, StockHoldSerializer,
+)
+from utils.pagination import KeysetCursorPagination
+from utils.caching import VersionedCacheMixin, get_cache_stats
+from utils.conditional import ConditionalGetMixin
+from utils.includes import IncludesQuerysetMixin
+from utils.idempotency import idempotent
+from utils.renderers import CSVRenderer, NDJSONRenderer
+from core.models import CustomUser, ImageVariant
+from core.uploads import StreamingUploadMixin
 
 # Create your views here.
-class ItemViewSet(ListModelMixin, RetrieveModelMixin, GenericViewSet):
+class ItemViewSet(ConditionalGetMixin, VersionedCacheMixin, IncludesQuerysetMixin,
+                  ListModelMixin, RetrieveModelMixin, GenericViewSet):
     """
     A Simple ViewSet for listing or retrieving items
+    list/retrieve responses are cached until an item or a related row changes
+    and answer If-None-Match/If-Modified-Since with a 304.
+    `include=vendor,category,currency,colors` and `fields[item]=` are
+    resolved with a constant number of queries per page
     """
     permission_classes = (IsAuthenticated,)
     queryset = Item.objects.all()
     serializer_class = ItemSerializer
+    pagination_class = KeysetCursorPagination
+    filterset_class = ItemFilter
+    cache_models = (Item, Category, Color, Currency, CustomUser, ImageVariant)
+    etag_models = (Category, Color, Currency, CustomUser, ImageVariant)
+    search_page_size = 20
+    max_search_page_size = 100
+    facets_query_param = "fields[facets]"
 
+    def get_requested_facets(self) -> list:
+        '''
+        facets asked for with `fields[facets]=category,color,currency,price`
+        '''
+        requested = self.request.query_params.get(self.facets_query_param, "")
+        return [facet for facet in requested.split(",") if facet in FACETS]
 
-class ItemCreateViewSet(CreateModelMixin, UpdateModelMixin, GenericViewSet):
+    def get_paginated_response(self, data):
+        """
+        Adds facet counts for the whole filtered listing to `meta.facets`
+        so results and facets come back in one round trip
+        """
+        response = super().get_paginated_response(data)
+        facets = self.get_requested_facets()
+        if facets:
+            filters = {key[len("filter["):-1]: value for key, value in self.request.query_params.items()
+                       if key.startswith("filter[") and key.endswith("]")}
+            response.data["meta"]["facets"] = facet_counts(
+                self.filter_queryset(self.get_queryset()), facets, filters=filters)
+        return response
+
+    @action(detail=False, methods=["get"])
+    def search(self, request) -> Response:
+        """
+        Ranked full text search over item title/description
+        `?filter[search]=<terms>&page[size]=<n>&page[number]=<p>` best match first.
+        other `filter[...]` params restrict the matches inside the ranked query
+        """
+        term = request.query_params.get(api_settings.SEARCH_PARAM, "")
+        try:
+            limit = min(int(request.query_params.get("page[size]", self.search_page_size)), self.max_search_page_size)
+        except ValueError:
+            limit = self.search_page_size
+        limit = max(limit, 1)
+        try:
+            page = max(int(request.query_params.get("page[number]", 1)), 1)
+        except ValueError:
+            page = 1
+        queryset = self.filter_queryset(self.get_queryset())
+        filtered = any(key.startswith("filter[") and key != api_settings.SEARCH_PARAM for key in request.query_params)
+        #one extra row tells whether there is a next page without counting
+        ranked = search_item_ids(term, limit=limit + 1, offset=(page - 1) * limit,
+                                 queryset=queryset if filtered else None)
+        has_next, ranked = len(ranked) > limit, ranked[:limit]
+        ranks = {pk: position for position, (pk, _) in enumerate(ranked)}
+        items = sorted(queryset.filter(pk__in=ranks.keys()), key=lambda item: ranks[item.pk])
+        serializer = self.get_serializer(items, many=True)
+        url = request.build_absolute_uri()
+        return Response({
+            "results": serializer.data,
+            "meta": {"search": {"term": term, "count": len(items)},
+                     "pagination": {"page": page, "page_size": limit}},
+            "links": {
+                "next": replace_query_param(url, "page[number]", page + 1) if has_next else None,
+                "prev": replace_query_param(url, "page[number]", page - 1) if page > 1 else None,
+            },
+        })
+
+    @action(detail=False, methods=["get"], url_path="cache-stats", permission_classes=[IsAdminUser])
+    def cache_stats(self, request) -> Response:
+        """
+        Response cache hit/miss counters. staff only
+        """
+        return Response(get_cache_stats())
+
+
+class ItemCreateViewSet(StreamingUploadMixin, CreateModelMixin, UpdateModelMixin, GenericViewSet):
     """
-    A Simple ViewSet for listing or retrieving items
+    A Simple ViewSet for creating and updating the current user's items.
+    Images are streamed to storage as they upload, see `core.uploads`
     """
     parser_classes = [MultiPartParser, FormParser, JSONParser]
     permission_classes = (IsAuthenticated,)
     serializer_class = ItemCreateSerializer
 
+    def get_queryset(self):
+        #vendors can only update their own listings
+        return Item.objects.filter(vendor=self.request.user)
+
+    @action(detail=False, methods=["post"], url_path="import", parser_classes=[MultiPartParser])
+    def import_items(self, request) -> Response:
+        """
+        Bulk import of a CSV/NDJSON `file` listed under the current user.
+        rows are streamed from the upload and inserted in batches,
+        the response reports created/failed counts with per row errors
+        """
+        upload = request.FILES.get("file")
+        if upload is None:
+            return Response({"message": "A csv or ndjson `file` is required"}, status=HTTP_400_BAD_REQUEST)
+        fmt = request.data.get("format") or guess_format(upload.name)
+        if fmt not in FORMATS:
+            return Response({"message": f"format must be one of {', '.join(FORMATS)}"}, status=HTTP_400_BAD_REQUEST)
+        importer = ItemImporter(vendor=request.user)
+        report = importer.run(iter_rows(codecs.iterdecode(upload, "utf-8-sig"), fmt))
+        return Response(report, status=HTTP_201_CREATED if report["created"] else HTTP_400_BAD_REQUEST)
+
+    @idempotent
     def create(self, request, *args, **kwargs):
-        data = MultiPartParser(request)
-        serializer = self.get_serializer(data= data)
-        if serializer.is_valid(raise_exception=True):
-            serializer.save()
-            return Response({"message":"Item Created Successfully", "data":serializer.data})
-        else:
-            return Response(serializer.errors, status=HTTP_400_BAD_REQUEST)
+        serializer = self.get_serializer(data= request.data)
+        serializer.is_valid(raise_exception=True)
+        item: Item = serializer.save(vendor=request.user)
+        #variants are made from the stored file once the row is committed
+        transaction.on_commit(item.process_image)
+        return Response({"message":"Item Created Successfully", "data":serializer.data})
+
+    def perform_update(self, serializer) -> None:
+        item: Item = serializer.save()
+        if "image" in serializer.validated_data:
+            transaction.on_commit(item.process_image)
 
 
 
-class OrderViewSet(ListModelMixin, UpdateModelMixin, RetrieveModelMixin, GenericViewSet):
+class OrderViewSet(ConditionalGetMixin, ListModelMixin, UpdateModelMixin, RetrieveModelMixin, GenericViewSet):
     """
     This view should return A List of all orders
     for the currently authenticated user.
@@ -51,6 +182,13 @@ class OrderViewSet(ListModelMixin, UpdateModelMixin, RetrieveModelMixin, Generic
     #authentication_classes = (TokenAuthentication,)# it has been defaulted in rest_framework settings
     #parser_classes = [JSONParser] # it has been defaulted too
     serializer_class = OrderSerializer
+    pagination_class = KeysetCursorPagination
+    history_actions = ("list", "retrieve")
+    #columns read by OrderHistorySerializer, `created`/`id` also build the page cursor
+    history_fields = ("id", "created", "modified", "status", "quantity", "total_price", "total_weight")
+    line_fields = ("id", "order_id", "quantity", "item__id", "item__title", "item__slug", "item__price", "item__thumbnail")
+    #the history embeds item summaries and their thumbnails
+    history_etag_models = (Item, ImageVariant)
 
     def get_queryset(self) -> Order:
         """
@@ -58,21 +196,179 @@ class OrderViewSet(ListModelMixin, UpdateModelMixin, RetrieveModelMixin, Generic
         for the currently authenticated user.
         """
         user = self.request.user
+        if self.action in self.history_actions:
+            return self.get_history_queryset(user)
         return Order.objects.filter(user = user)
+
+    def get_history_queryset(self, user):
+        """
+        Orders with their lines and item summaries in two queries
+        whatever the page size: the orders, then one prefetch joining lines to items
+        """
+        lines = OrderItem.objects.select_related("item").only(*self.line_fields).order_by("id")
+        return (Order.objects.filter(user = user)
+                .only(*self.history_fields)
+                .prefetch_related(Prefetch("orderitem_set", queryset=lines)))
+
+    def get_serializer_class(self):
+        if self.action in self.history_actions:
+            return OrderHistorySerializer
+        return super().get_serializer_class()
+
+    def get_etag_models(self) -> tuple:
+        if self.action in self.history_actions:
+            return self.history_etag_models
+        return super().get_etag_models()
     
+    @idempotent
     def create(self, request) -> Response:
         """
         For handling update/creating of orders
+        stock is reserved with a conditional UPDATE so concurrent orders can't oversell.
+        retries carrying the same `Idempotency-Key` header get the first response back
         """
         try:
             data = JSONParser().parse(request)#no need for dis cos data is already parsed through default parser in settings
-            serializer = OrderSerializer(data = data)
+            serializer = OrderCreateSerializer(data = data)
             if serializer.is_valid(raise_exception=True):
-                item: Item =  get_object_or_404(Item, pk=serializer.validated_data["item"].id)#validated data for relationship field returns the class instance for that model
+                item: Item = get_object_or_404(Item, pk=serializer.validated_data["item"])
                 order = item.place_order(request.user, qty= serializer.validated_data["quantity"])
+                if order is None:
+                    raise NotEnoughStockException
                 return Response(OrderSerializer(order).data)
             else:
                 return Response(serializer.errors, status=HTTP_400_BAD_REQUEST)
         except JSONDecodeError:
             return JsonResponse({"result":"error", "message":"Json Decode Error"}, status=400)
 
+    @action(detail=False, methods=["post"])
+    def checkout(self, request) -> Response:
+        """
+        Places one order for a cart `{"lines": [{"item": <id>, "quantity": <n>}, ...]}`
+        in a single transaction. nothing is ordered if any line is short
+        """
+        try:
+            data = JSONParser().parse(request)
+        except JSONDecodeError:
+            return JsonResponse({"result":"error", "message":"Json Decode Error"}, status=400)
+        serializer = CheckoutSerializer(data = data)
+        serializer.is_valid(raise_exception=True)
+        try:
+            order = Order.checkout(request.user, serializer.validated_data["lines"])
+        except Item.DoesNotExist as error:
+            raise ValidationError({"lines": str(error)})
+        except InsufficientStock as error:
+            raise NotEnoughStockException(
+                f"There is not enough stock for item(s) {', '.join(str(pk) for pk in error.items)}")
+        return Response(OrderSerializer(order).data, status=HTTP_201_CREATED)
+
+    @action(detail=False, methods=["post"], permission_classes=[IsAdminUser])
+    def transition(self, request) -> Response:
+        """
+        Moves many orders to a status `{"ids": [...], "status": "shipped"}`. staff only.
+        orders whose status doesn't allow the move are reported under `skipped`
+        """
+        try:
+            data = JSONParser().parse(request)
+        except JSONDecodeError:
+            return JsonResponse({"result":"error", "message":"Json Decode Error"}, status=400)
+        serializer = OrderTransitionSerializer(data = data)
+        serializer.is_valid(raise_exception=True)
+        result = Order.transition(serializer.validated_data["ids"], serializer.validated_data["status"],
+                                  user=request.user)
+        return Response(result)
+
+
+class VendorStatsViewSet(ViewSet):
+    """
+    Sales figures of the current user's items, read from the daily rollups.
+    `?filter[from]=YYYY-MM-DD&filter[to]=YYYY-MM-DD` defaults to the last 30 days
+    """
+    permission_classes = (IsAuthenticated,)
+    default_days = 30
+    max_days = 366
+
+    def get_date(self, request, param:str, default:date) -> date:
+        value = request.query_params.get(param)
+        if not value:
+            return default
+        try:
+            return date.fromisoformat(value)
+        except ValueError:
+            raise ValidationError({param: "Expected a date as YYYY-MM-DD"})
+
+    def list(self, request) -> Response:
+        end = self.get_date(request, "filter[to]", timezone.localdate())
+        start = self.get_date(request, "filter[from]", end - timedelta(days=self.default_days - 1))
+        if start > end or (end - start).days >= self.max_days:
+            raise ValidationError({"filter[from]": f"The range must run forward and cover at most {self.max_days} days"})
+        return Response(vendor_stats(request.user, start, end))
+
+
+class ExportViewSet(ViewSet):
+    """
+    Streaming exports for staff `GET /api/v1/export/<name>/?format=csv|ndjson`
+    with an optional `filter[from]`/`filter[to]` date range.
+    rows are streamed as they are read so any size exports in constant memory
+    """
+    permission_classes = (IsAdminUser,)
+    renderer_classes = (JSONRenderer, CSVRenderer, NDJSONRenderer)
+    lookup_value_regex = "[a-z-]+"
+
+    def get_date(self, request, param:str):
+        value = request.query_params.get(param)
+        if not value:
+            return None
+        try:
+            return date.fromisoformat(value)
+        except ValueError:
+            raise ValidationError({param: "Expected a date as YYYY-MM-DD"})
+
+    def list(self, request) -> Response:
+        return Response({"exports": list(exporter.EXPORTS), "formats": list(exporter.FORMATS)})
+
+    def retrieve(self, request, pk=None):
+        if pk not in exporter.EXPORTS:
+            raise NotFound(f"Unknown export '{pk}'")
+        fmt = request.accepted_renderer.format
+        if fmt not in exporter.FORMATS:
+            fmt = "csv"
+        start, end = self.get_date(request, "filter[from]"), self.get_date(request, "filter[to]")
+        content_type = CSVRenderer.media_type if fmt == "csv" else NDJSONRenderer.media_type
+        response = StreamingHttpResponse(exporter.stream(pk, fmt, start, end),
+                                         content_type=f"{content_type}; charset=utf-8")
+        suffix = "".join(f"_{day}" for day in (start, end) if day is not None)
+        response["Content-Disposition"] = f'attachment; filename="{pk}{suffix}.{fmt}"'
+        return response
+
+
+class StockHoldViewSet(ListModelMixin, GenericViewSet):
+    """
+    Puts stock aside for the current user's checkout for `STOCK_HOLD_TTL`.
+    `POST {"item": <id>, "quantity": <n>}` holds, `DELETE <id>` gives it back,
+    the next checkout of those items uses the holds up
+    """
+    permission_classes = (IsAuthenticated,)
+    serializer_class = StockHoldSerializer
+    pagination_class = None
+
+    def get_queryset(self):
+        return holds.active_holds(self.request.user)
+
+    def create(self, request) -> Response:
+        try:
+            data = JSONParser().parse(request)
+        except JSONDecodeError:
+            return JsonResponse({"result":"error", "message":"Json Decode Error"}, status=400)
+        serializer = StockHoldSerializer(data = data)
+        serializer.is_valid(raise_exception=True)
+        item: Item = get_object_or_404(Item, pk=serializer.validated_data["item_id"])
+        hold = holds.place_hold(item.pk, request.user, serializer.validated_data["quantity"])
+        if hold is None:
+            raise NotEnoughStockException
+        return Response(StockHoldSerializer(hold).data, status=HTTP_201_CREATED)
+
+    def destroy(self, request, pk=None) -> Response:
+        if not holds.release(request.user, pk):
+            raise NotFound("No such hold")
+        return Response(status=HTTP_204_NO_CONTENT)
@@ -0,0 +1,142 @@
+from hashlib import md5
+from threading import Lock
+from time import monotonic, time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.http import HttpResponse
+
+
+VERSION_KEY = "cache_version:{label}"
+STATS_KEY = "response_cache:{name}"
+#hits/misses counted in this process, not yet added to the shared counters
+_pending = {"hits": 0, "misses": 0}
+_pending_lock = Lock()
+_flushed = [monotonic()]
+
+
+def _incr(key:str, seed:int=0, delta:int=1) -> int:
+    '''
+    cache.incr that creates the key when missing
+    '''
+    try:
+        return cache.incr(key, delta)
+    except ValueError:
+        if cache.add(key, seed + delta, timeout=None):
+            return seed + delta
+        #created concurrently
+        return cache.incr(key, delta)
+
+
+def _seed() -> int:
+    #a version that disappeared from the cache restarts above any number it had before,
+    #so stale entries keyed on an old version can never be served again
+    return int(time() * 1000)
+
+
+def _label(model) -> str:
+    #a model, or a label for a version that isn't a whole model e.g `ecommerce.item_facets`
+    return model if isinstance(model, str) else model._meta.label_lower
+
+
+def get_versions(models) -> list:
+    '''
+    current version counter of each model, one cache round trip
+    '''
+    keys = [VERSION_KEY.format(label=_label(model)) for model in models]
+    found = cache.get_many(keys)
+    for key in keys:
+        if key not in found:
+            cache.add(key, _seed(), timeout=None)
+            found[key] = cache.get(key)
+    return [found[key] for key in keys]
+
+
+def bump_version(model) -> None:
+    '''
+    invalidates every cached response depending on `model`.
+    nothing is deleted, the old keys just stop being looked up and expire
+    '''
+    _incr(VERSION_KEY.format(label=_label(model)), seed=_seed())
+
+
+def get_stats_interval() -> int:
+    return getattr(settings, "RESPONSE_CACHE_STATS_INTERVAL", 10)
+
+
+def _count(name:str) -> None:
+    '''
+    Counts a hit/miss in process. The shared counters are written at most
+    once per `RESPONSE_CACHE_STATS_INTERVAL` seconds, so a cache hit stays
+    read only (with the DatabaseCache every counter update is a db write)
+    '''
+    with _pending_lock:
+        _pending[name] += 1
+        if monotonic() - _flushed[0] < get_stats_interval():
+            return
+        pending = dict(_pending)
+        _pending.update(hits=0, misses=0)
+        _flushed[0] = monotonic()
+    for key, count in pending.items():
+        if count:
+            _incr(STATS_KEY.format(name=key), delta=count)
+
+
+def get_cache_stats() -> dict:
+    '''
+    shared counters plus this process' unflushed counts
+    '''
+    found = cache.get_many([STATS_KEY.format(name=name) for name in ("hits", "misses")])
+    with _pending_lock:
+        hits, misses = (found.get(STATS_KEY.format(name=name), 0) + _pending[name] for name in ("hits", "misses"))
+    total = hits + misses
+    return {"hits": hits, "misses": misses, "hit_ratio": round(hits / total, 4) if total else None}
+
+
+class VersionedCacheMixin:
+    """
+    Caches rendered list/retrieve responses of a viewset.
+    The key covers the action, query params, url kwargs, negotiated renderer
+    and the version counter of every model in `cache_models`
+    which the model signals bump on save/delete.
+    Only `cache_formats` are cached, the browsable API page carries the
+    user's name and CSRF token and is rendered per request.
+    """
+    cache_models: tuple = ()
+    cache_formats: tuple = ("json", "vnd.api+json")
+    cache_timeout: int = getattr(settings, "RESPONSE_CACHE_TIMEOUT", 60 * 15)
+
+    def get_response_cache_key(self, request, **kwargs) -> str:
+        params = sorted((key, tuple(values)) for key, values in request.query_params.lists())
+        digest = md5(repr((request.path, params, sorted(kwargs.items()))).encode("utf-8")).hexdigest()
+        versions = ".".join(str(version) for version in get_versions(self.cache_models))
+        return f"response:{self.basename}:{self.action}:{versions}:{request.accepted_media_type}:{digest}"
+
+    def cached_response(self, handler, request, *args, **kwargs):
+        if getattr(request.accepted_renderer, "format", None) not in self.cache_formats:
+            return handler(request, *args, **kwargs)
+        key = self.get_response_cache_key(request, **kwargs)
+        cached = cache.get(key)
+        if cached is not None:
+            _count("hits")
+            content, content_type = cached
+            response = HttpResponse(content, content_type=content_type)
+            response["X-Cache"] = "HIT"
+            return response
+        _count("misses")
+        response = handler(request, *args, **kwargs)
+        if response.status_code == 200:
+            response["X-Cache"] = "MISS"
+
+            def store(rendered) -> None:
+                #stores the bytes once the renderer has run, so a hit skips the db and the serializer
+                cache.set(key, (rendered.content, rendered["Content-Type"]), self.cache_timeout)
+
+            response.add_post_render_callback(store)
+        return response
+
+    def list(self, request, *args, **kwargs):
+        return self.cached_response(super().list, request, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.cached_response(super().retrieve, request, *args, **kwargs)
@@ -0,0 +1,84 @@
+from hashlib import md5
+
+from django.core.exceptions import ValidationError
+from django.db.models import Count, Max
+from django.utils.cache import get_conditional_response, quote_etag
+from django.utils.http import http_date
+
+from utils.caching import get_versions
+
+
+class ConditionalGetMixin:
+    """
+    ETag/Last-Modified support for list/retrieve on models
+    carrying `TimeStampedModel.modified`.
+    The validators come from a single cheap query, so a `304 Not Modified`
+    is answered before the object is loaded or serialized.
+    `etag_models` are related models embedded in the response,
+    their version counters are mixed into every ETag,
+    override `get_etag_models` when they depend on the action.
+    """
+    modified_field: str = "modified"
+    etag_models: tuple = ()
+
+    def get_etag_models(self) -> tuple:
+        return self.etag_models
+
+    def _etag(self, request, *parts) -> str:
+        #the negotiated renderer is part of the representation
+        parts = (self.basename, self.action, request.accepted_media_type) + parts
+        etag_models = self.get_etag_models()
+        if etag_models:
+            parts += tuple(get_versions(etag_models))
+        return quote_etag(md5(repr(parts).encode("utf-8")).hexdigest())
+
+    def get_list_validators(self, request) -> tuple:
+        '''
+        ETag over MAX(modified), COUNT(*) of the filtered queryset and the query params.
+        the count catches deletes, which leave MAX(modified) untouched.
+        no Last-Modified is sent for lists for the same reason
+        '''
+        queryset = self.filter_queryset(self.get_queryset()).order_by()
+        stats = queryset.aggregate(last_modified=Max(self.modified_field), count=Count("pk"))
+        params = sorted((key, tuple(values)) for key, values in request.query_params.lists())
+        last_modified = stats["last_modified"].isoformat() if stats["last_modified"] else None
+        etag = self._etag(request, request.user.pk, last_modified, stats["count"], params)
+        return etag, None
+
+    def get_detail_validators(self, request, **kwargs) -> tuple:
+        lookup_url_kwarg = self.lookup_url_kwarg or self.lookup_field
+        queryset = self.filter_queryset(self.get_queryset()).order_by()
+        try:
+            modified = queryset.filter(**{self.lookup_field: kwargs[lookup_url_kwarg]}).values_list(
+                self.modified_field, flat=True).first()
+        except (TypeError, ValueError, KeyError, ValidationError):
+            modified = None
+        if modified is None:
+            #unknown object, the handler answers with its own 404
+            return None, None
+        etag = self._etag(request, str(kwargs[lookup_url_kwarg]), modified.isoformat())
+        return etag, int(modified.timestamp())
+
+    def conditional_response(self, handler, validators, request, *args, **kwargs):
+        etag, last_modified = validators
+        if etag is not None:
+            not_modified = get_conditional_response(request, etag=etag, last_modified=last_modified)
+            if not_modified is not None:
+                not_modified["ETag"] = etag
+                if last_modified is not None:
+                    not_modified["Last-Modified"] = http_date(last_modified)
+                return not_modified
+        response = handler(request, *args, **kwargs)
+        if etag is not None and response.status_code == 200:
+            response["ETag"] = etag
+            if last_modified is not None:
+                response["Last-Modified"] = http_date(last_modified)
+        return response
+
+    def list(self, request, *args, **kwargs):
+        return self.conditional_response(super().list, self.get_list_validators(request),
+                                         request, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.conditional_response(super().retrieve, self.get_detail_validators(request, **kwargs),
+                                         request, *args, **kwargs)
@@ -0,0 +1,118 @@
+from functools import wraps
+from hashlib import md5, sha256
+from time import monotonic, sleep
+
+from django.conf import settings
+from django.core.cache import cache
+from django.http import HttpResponse
+from rest_framework.response import Response
+from rest_framework.status import HTTP_400_BAD_REQUEST, HTTP_409_CONFLICT, HTTP_422_UNPROCESSABLE_ENTITY
+
+
+HEADER = "Idempotency-Key"
+KEY = "idempotency:{view}:{action}:{user}:{digest}"
+MAX_KEY_LENGTH = 255
+POLL_INTERVAL = 0.05
+
+
+def _file_digest(upload) -> str:
+    #streamed image uploads are hashed as they arrive
+    digest = getattr(upload, "digest", None)
+    if digest is None:
+        hasher = sha256()
+        for chunk in upload.chunks():
+            hasher.update(chunk)
+        upload.seek(0)
+        digest = hasher.hexdigest()
+    return digest
+
+
+def _fingerprint(request) -> str:
+    '''
+    digest of the payload, a key reused with another payload is refused.
+    multipart bodies are parsed (files go to the upload handlers) and the
+    form fields are digested with the sha256 of each file, the raw body
+    isn't read into memory here
+    '''
+    if request.content_type.startswith("multipart/"):
+        fields = sorted((key, tuple(values)) for key, values in request.data.lists() if key not in request.FILES)
+        files = sorted((key, tuple(_file_digest(upload) for upload in uploads))
+                       for key, uploads in request.FILES.lists())
+        return md5(repr((fields, files)).encode("utf-8")).hexdigest()
+    return md5(request._request.body).hexdigest()
+
+
+def _store(response) -> tuple:
+    if isinstance(response, Response):
+        return ("data", response.status_code, response.data)
+    return ("content", response.status_code, response.content, response["Content-Type"])
+
+
+def _replay(stored:tuple):
+    if stored[0] == "data":
+        response = Response(stored[2], status=stored[1])
+    else:
+        response = HttpResponse(stored[2], status=stored[1], content_type=stored[3])
+    response["Idempotent-Replayed"] = "true"
+    return response
+
+
+def idempotent(handler):
+    '''
+    Makes a viewset action honour the `Idempotency-Key` header.
+    The first request with a key runs and its response is kept for
+    `IDEMPOTENCY_KEY_TTL`, a retry with the same key gets that response back
+    without running the action again. A duplicate arriving while the first
+    is still running waits on a short lock, then replays or gets a 409.
+    Requests without the header run as usual
+    '''
+    @wraps(handler)
+    def wrapper(self, request, *args, **kwargs):
+        key = request.headers.get(HEADER)
+        if not key:
+            return handler(self, request, *args, **kwargs)
+        if len(key) > MAX_KEY_LENGTH:
+            return Response({"detail": f"{HEADER} is limited to {MAX_KEY_LENGTH} characters"},
+                            status=HTTP_400_BAD_REQUEST)
+        cache_key = KEY.format(view=self.basename, action=self.action, user=request.user.pk,
+                               digest=md5(key.encode("utf-8")).hexdigest())
+        fingerprint = _fingerprint(request)
+        ttl = getattr(settings, "IDEMPOTENCY_KEY_TTL", 60 * 60 * 24)
+        lock_timeout = getattr(settings, "IDEMPOTENCY_LOCK_TIMEOUT", 10)
+
+        def replay(stored):
+            if stored["fingerprint"] != fingerprint:
+                return Response({"detail": f"{HEADER} was already used with a different request"},
+                                status=HTTP_422_UNPROCESSABLE_ENTITY)
+            return _replay(stored["response"])
+
+        stored = cache.get(cache_key)
+        if stored is not None:
+            return replay(stored)
+        lock = cache_key + ":lock"
+        if not cache.add(lock, 1, timeout=lock_timeout):
+            #the same key is in flight, wait for its response instead of running twice
+            deadline = monotonic() + lock_timeout
+            while monotonic() < deadline:
+                sleep(POLL_INTERVAL)
+                stored = cache.get(cache_key)
+                if stored is not None:
+                    return replay(stored)
+                if cache.get(lock) is None:
+                    break
+            response = Response({"detail": f"A request with this {HEADER} is still being processed"},
+                                status=HTTP_409_CONFLICT)
+            response["Retry-After"] = "1"
+            return response
+        try:
+            stored = cache.get(cache_key)
+            if stored is not None:
+                return replay(stored)
+            response = handler(self, request, *args, **kwargs)
+            if response.status_code < 500:
+                #stored before the lock goes so a waiting duplicate finds it
+                cache.set(cache_key, {"fingerprint": fingerprint, "response": _store(response)}, timeout=ttl)
+            return response
+        finally:
+            cache.delete(lock)
+    return wrapper
@@ -0,0 +1,79 @@
+from django.core.exceptions import FieldDoesNotExist
+from rest_framework_json_api.utils import get_included_resources, get_resource_type_from_serializer
+
+
+class IncludesQuerysetMixin:
+    """
+    Shapes the viewset queryset after the JSON:API `include=` and
+    `fields[<type>]=` params, so a page costs the same number of queries
+    whatever its size:
+    included to-one relations are joined with select_related,
+    to-many relations are prefetched once per page
+    and only the columns the serializer will read are loaded.
+    """
+
+    def get_requested_fields(self, serializer_class) -> list:
+        '''
+        serializer fields left after the sparse fieldset for the resource type
+        '''
+        fields = list(serializer_class.Meta.fields)
+        fieldset = self.request.query_params.get(f"fields[{get_resource_type_from_serializer(serializer_class)}]")
+        if fieldset:
+            requested = fieldset.split(",")
+            fields = [field for field in fields if field in requested]
+        return fields
+
+    def get_sort_fields(self, queryset) -> list:
+        '''
+        columns of the `?sort=` the ordering filter applies after this,
+        the cursor is built from them
+        '''
+        fields = []
+        for backend in self.filter_backends:
+            if not hasattr(backend, "get_ordering") or not hasattr(backend, "ordering_param"):
+                continue
+            for field in backend().get_ordering(self.request, queryset, self) or ():
+                try:
+                    model_field = queryset.model._meta.get_field(field.lstrip("-"))
+                except FieldDoesNotExist:
+                    continue
+                if model_field.concrete and not model_field.is_relation:
+                    fields.append(model_field.name)
+        return fields
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if getattr(self, "request", None) is None:
+            return queryset
+        serializer_class = self.get_serializer_class()
+        includes = {include.split(".")[0] for include in get_included_resources(self.request, serializer_class)}
+        model = queryset.model
+        #the pagination cursor is built from the ordering fields
+        load = {model._meta.pk.name}
+        load.update(field.lstrip("-") for field in getattr(self.paginator, "ordering", None) or ())
+        load.update(self.get_sort_fields(queryset))
+        select, prefetch = [], []
+        declared = getattr(serializer_class, "_declared_fields", {})
+        for name in self.get_requested_fields(serializer_class):
+            #a field declared with a plain `source` reads that model field
+            source = getattr(declared.get(name), "source", None) or name
+            try:
+                field = model._meta.get_field(source)
+            except FieldDoesNotExist:
+                #a computed field could read anything, load the whole row
+                load = None
+                continue
+            if field.many_to_many or field.one_to_many:
+                prefetch.append(source)
+                continue
+            if field.is_relation and name in includes:
+                select.append(source)
+            if load is not None:
+                load.add(source)
+        if select:
+            queryset = queryset.select_related(*select)
+        if prefetch:
+            queryset = queryset.prefetch_related(*prefetch)
+        if load is not None:
+            queryset = queryset.only(*load)
+        return queryset
@@ -1,5 +1,16 @@
-from rest_framework.pagination import PageNumberPagination
+import json
+import binascii
+from base64 import urlsafe_b64encode, urlsafe_b64decode
+from collections import OrderedDict
+from datetime import datetime
+from typing import Optional
+
+from django.core.exceptions import FieldDoesNotExist
+from django.db.models import Q
+from rest_framework.exceptions import NotFound, ValidationError
+from rest_framework.pagination import BasePagination, PageNumberPagination
 from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param, remove_query_param
 
 class LargeResultsSetPagination(PageNumberPagination):
     page_size = 50
@@ -21,4 +32,169 @@ class StandardResultsSetPagination(PageNumberPagination):
             'count': self.page.paginator.count,
             'results': data,
         })
-    """
\ No newline at end of file
+    """
+
+class KeysetCursorPagination(BasePagination):
+    """
+    Keyset (seek) pagination over `(created, id)`.
+    Unlike `PageNumberPagination` there is no COUNT(*) and no OFFSET scan,
+    each page is a `WHERE (created, id) > (cursor) ORDER BY created, id LIMIT n`
+    so deep pages cost the same as the first one.
+    A `sort` applied by the OrderingFilter is kept: the cursor is then built
+    over the requested fields with `id` appended as the tie-breaker.
+    Cursors are opaque base64 tokens and the response shape matches the
+    json:api pagination classes (results, meta, links).
+    """
+    page_size = 20
+    page_size_query_param = 'page[size]'
+    max_page_size = 100
+    cursor_query_param = 'page[cursor]'
+    ordering = ('created', 'id')#must end with a unique field
+    tie_breaker = 'id'
+    invalid_cursor_message = 'Invalid cursor'
+
+    def get_ordering(self, queryset) -> tuple:
+        '''
+        the ordering already on the queryset (`?sort=`) closed with the
+        tie-breaker, else the default. Only plain non null columns can be seeked on
+        '''
+        requested = queryset.query.order_by
+        if not requested:
+            return tuple(self.ordering)
+        ordering = []
+        for field in requested:
+            name = field.lstrip('-') if isinstance(field, str) else None
+            try:
+                model_field = queryset.model._meta.get_field(name) if name else None
+            except FieldDoesNotExist:
+                model_field = None
+            if model_field is None or model_field.null or model_field.is_relation:
+                raise ValidationError({'sort': f'Results can not be sorted by {field} with cursor pagination'})
+            ordering.append(field)
+        if not any(field.lstrip('-') == self.tie_breaker for field in ordering):
+            ordering.append(self.tie_breaker)
+        return tuple(ordering)
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        self.ordering = self.get_ordering(queryset)
+        cursor = self.decode_cursor(request)
+        self.reverse = bool(cursor and cursor['reverse'])
+
+        ordering = self.ordering
+        if self.reverse:
+            ordering = tuple(field[1:] if field.startswith('-') else f'-{field}' for field in self.ordering)
+        queryset = queryset.order_by(*ordering)
+        if cursor is not None:
+            queryset = queryset.filter(self.keyset_filter(cursor['position'], self.reverse))
+
+        #fetch one extra row to know if there is a further page without counting
+        results = list(queryset[:self.page_size + 1])
+        has_more = len(results) > self.page_size
+        results = results[:self.page_size]
+        if self.reverse:
+            results.reverse()
+            self.has_previous, self.has_next = has_more, True
+        else:
+            self.has_previous, self.has_next = cursor is not None, has_more
+        self.page = results
+        return results
+
+    def get_page_size(self, request) -> int:
+        try:
+            page_size = int(request.query_params[self.page_size_query_param])
+            if page_size > 0:
+                return min(page_size, self.max_page_size)
+        except (KeyError, ValueError):
+            pass
+        return self.page_size
+
+    def keyset_filter(self, position:list, reverse:bool=False) -> Q:
+        '''
+        Builds the row value comparison `(a, b) > (x, y)` as
+        `a > x OR (a = x AND b > y)` which sqlite and postgres both
+        resolve through a composite index on the ordering fields,
+        a descending field compares the other way
+        '''
+        names = [field.lstrip('-') for field in self.ordering]
+        condition = Q()
+        for index, field in enumerate(self.ordering):
+            lookup = 'lt' if field.startswith('-') != reverse else 'gt'
+            equal = {name: value for name, value in zip(names[:index], position)}
+            condition |= Q(**equal, **{f'{names[index]}__{lookup}': position[index]})
+        return condition
+
+    def get_position(self, instance) -> list:
+        position = []
+        for field in self.ordering:
+            value = getattr(instance, field.lstrip('-'))
+            #isoformat keeps microseconds, which the keyset comparison needs
+            position.append(value.isoformat() if isinstance(value, datetime) else str(value))
+        return position
+
+    def encode_cursor(self, position:list, reverse:bool) -> str:
+        payload = json.dumps({'p': position, 'r': int(reverse)}, separators=(',', ':'))
+        token = urlsafe_b64encode(payload.encode('utf-8')).decode('ascii')
+        url = self.request.build_absolute_uri()
+        return replace_query_param(url, self.cursor_query_param, token)
+
+    def decode_cursor(self, request) -> Optional[dict]:
+        token = request.query_params.get(self.cursor_query_param)
+        if not token:
+            return None
+        try:
+            payload = json.loads(urlsafe_b64decode(token.encode('ascii')).decode('utf-8'))
+            position = payload['p']
+            if not isinstance(position, list) or len(position) != len(self.ordering):
+                raise ValueError
+            return {'position': position, 'reverse': bool(payload.get('r'))}
+        except (TypeError, ValueError, KeyError, UnicodeError, binascii.Error):
+            raise NotFound(self.invalid_cursor_message)
+
+    def get_next_link(self) -> Optional[str]:
+        if not self.has_next or not self.page:
+            return None
+        return self.encode_cursor(self.get_position(self.page[-1]), reverse=False)
+
+    def get_previous_link(self) -> Optional[str]:
+        if not self.has_previous or not self.page:
+            return None
+        return self.encode_cursor(self.get_position(self.page[0]), reverse=True)
+
+    def get_first_link(self) -> str:
+        url = self.request.build_absolute_uri()
+        return remove_query_param(url, self.cursor_query_param)
+
+    def get_paginated_response(self, data):
+        return Response({
+            'results': data,
+            'meta': {
+                'pagination': OrderedDict([
+                    ('page_size', self.page_size),
+                ])
+            },
+            'links': OrderedDict([
+                ('first', self.get_first_link()),
+                ('next', self.get_next_link()),
+                ('prev', self.get_previous_link()),
+            ]),
+        })
+
+    def get_schema_operation_parameters(self, view):
+        return [
+            {
+                'name': self.cursor_query_param,
+                'required': False,
+                'in': 'query',
+                'description': 'Opaque cursor taken from links.next or links.prev',
+                'schema': {'type': 'string'},
+            },
+            {
+                'name': self.page_size_query_param,
+                'required': False,
+                'in': 'query',
+                'description': 'Number of results to return per page',
+                'schema': {'type': 'integer'},
+            },
+        ]
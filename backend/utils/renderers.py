@@ -0,0 +1,28 @@
+import json
+
+from django.core.serializers.json import DjangoJSONEncoder
+from rest_framework.renderers import BaseRenderer
+
+
+class StreamingFormatRenderer(BaseRenderer):
+    """
+    Lets `?format=` / Accept select a streamed format.
+    The view writes the body itself with a StreamingHttpResponse,
+    anything rendered through here (errors) is plain json
+    """
+    charset = "utf-8"
+
+    def render(self, data, accepted_media_type=None, renderer_context=None) -> bytes:
+        if data is None:
+            return b""
+        return json.dumps(data, cls=DjangoJSONEncoder).encode(self.charset)
+
+
+class CSVRenderer(StreamingFormatRenderer):
+    media_type = "text/csv"
+    format = "csv"
+
+
+class NDJSONRenderer(StreamingFormatRenderer):
+    media_type = "application/x-ndjson"
+    format = "ndjson"